@@ -0,0 +1,308 @@
+import argparse
+import json
+import multiprocessing as mp
+import os
+import sys
+import config
+import pixel_cache
+import result_cache
+import scheduler
+import tiles
+import tracing
+import video_generator
+from pixel_data import load_pixel_data
+from progress import format_progress
+
+class BatchRenderer:
+    """
+    Renders many videos on one long-lived worker pool. The pool is planned from the first job that is
+    rendered and then reused for the rest of the batch.
+
+    Pixel data files are loaded once and kept for the whole batch, and every job streams straight into
+    its own output file, so nothing is written to the shared upload or processed frame directories and
+    several renderers can run side by side.
+    """
+    def __init__(self, max_workers=None, engine=None, use_result_cache=True, backend=None):
+        """
+        Args:
+            max_workers (int, optional): Number of workers. Defaults to config.NUM_WORKERS, or a size
+                chosen from a calibration run.
+            engine (str, optional): Name of the compositing engine to use. Defaults to config.COMPOSITING_ENGINE.
+            use_result_cache (bool, optional): Whether finished videos are looked up in and added to the result cache.
+            backend (str, optional): One of scheduler.WORKER_BACKENDS. Defaults to config.WORKER_BACKEND.
+        """
+        self.engine = engine
+        self.use_result_cache = use_result_cache
+        self.max_workers = max_workers
+        self.backend = backend
+        self.executor = None
+        self.workers = None
+        self.pixel_data = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Shuts down the worker pool.
+        """
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+            self.workers = None
+
+    def load_pixel_data(self, pixel_data_path):
+        """
+        Loads a pixel data file, reusing it if an earlier job of the batch already loaded it.
+
+        Args:
+            pixel_data_path (str): Path to the pixel data file.
+
+        Returns:
+            PixelData: The loaded pixel data.
+        """
+        pixel_data_path = os.path.abspath(pixel_data_path)
+        if pixel_data_path not in self.pixel_data:
+            self.pixel_data[pixel_data_path] = load_pixel_data(pixel_data_path)
+        return self.pixel_data[pixel_data_path]
+
+    def render(self, image, output_video_path, input_resolution=config.DEFAULT_INPUT_RESOLUTION,
+               framerate=config.DEFAULT_FRAMERATE, output_resolution=config.DEFAULT_OUTPUT_RESOLUTION,
+               pixel_data_path=None, audio_path=config.AUDIO_FILE, preview_path=None, progress_callback=None):
+        """
+        Renders one video.
+
+        Args:
+            image (str, PIL.Image.Image or numpy.ndarray): Path to the user's image, an already opened image,
+                or an image array in the channel order of cv.imread.
+            output_video_path (str): Path to save the output video file.
+            input_resolution (str, optional): Key of config.INPUT_RESOLUTION_GRIDS.
+            framerate (str, optional): Key of config.FRAME_RATE_OPTIONS.
+            output_resolution (str or tuple, optional): Key of config.OUTPUT_RESOLUTION_DIMENSIONS, 'WIDTHxHEIGHT',
+                or (width, height).
+            pixel_data_path (str, optional): Pixel data file to use instead of the input resolution and frame rate preset.
+            audio_path (str, optional): Path to the audio file, or None for a silent video.
+            preview_path (str, optional): Where to save a preview frame of the video.
+            progress_callback (callable, optional): Called with a RenderProgress while the video is rendered.
+        """
+        if pixel_data_path is None:
+            pixel_data_path = pixel_cache.find_preset_pixel_data(input_resolution, framerate)
+        output_resolution = parse_output_resolution(output_resolution)
+        if audio_path is not None and not os.path.exists(audio_path):
+            raise FileNotFoundError(f"Audio file '{audio_path}' not found.")
+
+        with tracing.trace_render(os.path.splitext(os.path.basename(output_video_path))[0]):
+            with tracing.span('load pixel data'):
+                pixel_data = self.load_pixel_data(pixel_data_path)
+            fps = pixel_data.fps or config.FRAME_RATE_OPTIONS[framerate]
+
+            cache_key = None
+            if self.use_result_cache:
+                cache_key = result_cache.result_key(image, pixel_data_path, output_resolution, fps, audio_path)
+                if result_cache.lookup(cache_key, output_video_path, preview_path):
+                    print(f"Reused the cached video for '{output_video_path}'.")
+                    return
+
+            tile_size, frame_dimensions = video_generator.compute_tile_layout(
+                pixel_data.frame_dimensions, output_resolution,
+                even_tiles=config.STREAM_PIXEL_FORMAT == video_generator.YUV_PIXEL_FORMAT
+            )
+            with tracing.span('load tiles'):
+                user_img_array, gray_user_img_array = tiles.load_user_tiles(image, tile_size)
+            pixel_format = video_generator.stream_pixel_format(tile_size)
+
+            if self.executor is None:
+                self.executor, plan = video_generator.create_render_executor(
+                    pixel_data, tile_size, frame_dimensions, user_img_array, gray_user_img_array, self.engine,
+                    backend=self.backend, max_workers=self.max_workers, pixel_format=pixel_format
+                )
+                self.workers = plan.workers
+            video_generator.encode_stream(
+                self.executor, pixel_data, tile_size, frame_dimensions, user_img_array, gray_user_img_array, fps,
+                output_video_path, audio_path, engine=self.engine, progress_callback=progress_callback,
+                preview_path=preview_path, pixel_format=pixel_format, workers=self.workers
+            )
+            if cache_key is not None:
+                result_cache.store(cache_key, output_video_path, preview_path)
+
+def parse_output_resolution(value):
+    """
+    Reads an output resolution given as a key of config.OUTPUT_RESOLUTION_DIMENSIONS or as 'WIDTHxHEIGHT'.
+
+    Args:
+        value (str, list or tuple): The preset name, 'WIDTHxHEIGHT' string or (width, height) pair.
+
+    Returns:
+        tuple: The output (width, height) in pixels.
+    """
+    if isinstance(value, (list, tuple)):
+        width, height = value
+        return int(width), int(height)
+    if value in config.OUTPUT_RESOLUTION_DIMENSIONS:
+        return config.OUTPUT_RESOLUTION_DIMENSIONS[value]
+    try:
+        width, height = (int(size) for size in value.lower().split('x'))
+    except ValueError:
+        raise ValueError(
+            f"Output resolution '{value}' is neither one of {', '.join(config.OUTPUT_RESOLUTION_DIMENSIONS)} nor WIDTHxHEIGHT."
+        )
+    if width <= 0 or height <= 0:
+        raise ValueError(f"Output resolution '{value}' must be positive.")
+    return width, height
+
+def default_output_path(image_path, output_dir):
+    """
+    Builds the output path of a job from its image name.
+
+    Args:
+        image_path (str): Path to the user's image.
+        output_dir (str): Directory for the output videos.
+
+    Returns:
+        str: The output video path.
+    """
+    return os.path.join(output_dir, os.path.splitext(os.path.basename(image_path))[0] + ".mp4")
+
+def load_manifest(manifest_path, output_dir):
+    """
+    Reads a JSON manifest of jobs. The manifest is a list of objects with an 'image' and optional
+    'output', 'input_resolution', 'framerate', 'output_resolution', 'pixel_data' and 'audio' keys.
+    Relative paths are resolved against the manifest's directory. The output resolution is a preset name,
+    a 'WIDTHxHEIGHT' string or a [width, height] list.
+
+    Args:
+        manifest_path (str): Path to the manifest file.
+        output_dir (str): Directory for jobs without an explicit output path.
+
+    Returns:
+        list: The jobs as keyword arguments for BatchRenderer.render.
+    """
+    with open(manifest_path) as file:
+        entries = json.load(file)
+
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    resolve = lambda path: path if path is None or os.path.isabs(path) else os.path.join(base_dir, path)
+
+    jobs = []
+    for entry in entries:
+        image_path = resolve(entry['image'])
+        job = {
+            'image': image_path,
+            'output_video_path': resolve(entry.get('output')) or default_output_path(image_path, output_dir),
+            'input_resolution': entry.get('input_resolution', config.DEFAULT_INPUT_RESOLUTION),
+            'framerate': entry.get('framerate', config.DEFAULT_FRAMERATE),
+            'output_resolution': entry.get('output_resolution', config.DEFAULT_OUTPUT_RESOLUTION),
+            'pixel_data_path': resolve(entry.get('pixel_data'))
+        }
+        if 'audio' in entry:
+            job['audio_path'] = resolve(entry['audio'])
+        jobs.append(job)
+    return jobs
+
+def render_batch(jobs, max_workers=None, engine=None, progress_callback=None, use_result_cache=True, backend=None):
+    """
+    Renders a list of jobs on a single warm worker pool. A failing job is reported and skipped
+    instead of stopping the rest of the batch.
+
+    Args:
+        jobs (list): Keyword arguments for BatchRenderer.render, one dict per job.
+        max_workers (int, optional): Number of workers. Defaults to config.NUM_WORKERS, or a size chosen from a calibration run.
+        engine (str, optional): Name of the compositing engine to use.
+        progress_callback (callable, optional): Called with the job index and a RenderProgress.
+        use_result_cache (bool, optional): Whether finished videos are looked up in and added to the result cache.
+        backend (str, optional): One of scheduler.WORKER_BACKENDS. Defaults to config.WORKER_BACKEND.
+
+    Returns:
+        list: The exception raised by every job, or None for jobs that succeeded.
+    """
+    errors = []
+    with BatchRenderer(max_workers=max_workers, engine=engine, use_result_cache=use_result_cache, backend=backend) as renderer:
+        for index, job in enumerate(jobs):
+            job_callback = None
+            if progress_callback is not None:
+                job_callback = lambda progress, index=index: progress_callback(index, progress)
+            try:
+                renderer.render(**job, progress_callback=job_callback)
+                errors.append(None)
+            except Exception as e:
+                print(f"Job {index + 1} ({job.get('image')}) failed: {e}")
+                errors.append(e)
+    return errors
+
+def output_resolution_arg(value):
+    try:
+        return parse_output_resolution(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def main():
+    parser = argparse.ArgumentParser(description="Render Bad Apple mosaic videos for many images without the GUI.")
+    parser.add_argument('images', nargs='*', help="Images to render, one video each.")
+    parser.add_argument('--manifest', help="JSON manifest of jobs to render in addition to the images.")
+    parser.add_argument('--output-dir', default=config.OUTPUT_VIDEO_DIR, help="Directory for the output videos.")
+    parser.add_argument('--input-resolution', choices=list(config.INPUT_RESOLUTION_GRIDS), default=config.DEFAULT_INPUT_RESOLUTION)
+    parser.add_argument('--framerate', choices=list(config.FRAME_RATE_OPTIONS), default=config.DEFAULT_FRAMERATE)
+    parser.add_argument(
+        '--output-resolution', type=output_resolution_arg, default=config.DEFAULT_OUTPUT_RESOLUTION,
+        help=f"One of {', '.join(config.OUTPUT_RESOLUTION_DIMENSIONS)}, or WIDTHxHEIGHT."
+    )
+    parser.add_argument('--audio', default=config.AUDIO_FILE, help="Soundtrack of the videos.")
+    parser.add_argument('--no-audio', action='store_true', help="Render silent videos.")
+    parser.add_argument('--workers', type=int, help="Number of workers, chosen from a calibration run by default.")
+    parser.add_argument('--backend', choices=list(scheduler.WORKER_BACKENDS), help="Render on worker processes or threads, or pick automatically.")
+    parser.add_argument('--engine', choices=list(video_generator.COMPOSITING_ENGINES))
+    parser.add_argument('--no-cache', action='store_true', help="Always render, without using or filling the result cache.")
+    parser.add_argument('--quiet', action='store_true', help="Do not print progress.")
+    parser.add_argument('--trace', metavar='DIR', help="Write a Chrome trace of every render to this directory.")
+    parser.add_argument('--profile', action='store_true', help="Also save cProfile profiles next to the traces.")
+    args = parser.parse_args()
+
+    if args.trace:
+        config.TRACE_DIR = args.trace
+    if args.profile:
+        config.TRACE_PROFILE = True
+        if not config.TRACE_DIR:
+            parser.error("--profile needs --trace or BAD_APPLE_TRACE.")
+
+    audio_path = None if args.no_audio else args.audio
+    jobs = [
+        {
+            'image': image_path,
+            'output_video_path': default_output_path(image_path, args.output_dir),
+            'input_resolution': args.input_resolution,
+            'framerate': args.framerate,
+            'output_resolution': args.output_resolution,
+            'audio_path': audio_path
+        }
+        for image_path in args.images
+    ]
+    if args.manifest:
+        manifest_jobs = load_manifest(args.manifest, args.output_dir)
+        for job in manifest_jobs:
+            job.setdefault('audio_path', audio_path)
+        jobs.extend(manifest_jobs)
+
+    if not jobs:
+        parser.error("No images or manifest given.")
+
+    def report(index, progress):
+        if progress.total_frames and progress.frames_done >= progress.total_frames:
+            end = "\n"
+        else:
+            end = "\r"
+        print(f"[{index + 1}/{len(jobs)}] {format_progress(progress)}", end=end, flush=True)
+
+    errors = render_batch(
+        jobs, max_workers=args.workers, engine=args.engine, progress_callback=None if args.quiet else report,
+        use_result_cache=not args.no_cache, backend=args.backend
+    )
+    failed = sum(error is not None for error in errors)
+    print(f"Rendered {len(jobs) - failed} of {len(jobs)} videos.")
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    mp.freeze_support()
+    main()
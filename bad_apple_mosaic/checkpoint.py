@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+
+MANIFEST_FILE_NAME = 'render_manifest.json'
+MANIFEST_VERSION = 1
+
+def hash_arrays(*arrays):
+    """
+    Computes the SHA-256 hash of the contents, shapes and types of NumPy arrays.
+
+    Args:
+        *arrays (numpy.ndarray): The arrays to hash.
+
+    Returns:
+        str: The hex digest of the arrays.
+    """
+    digest = hashlib.sha256()
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(f"{array.shape}{array.dtype.str}".encode())
+        digest.update(array.data)
+    return digest.hexdigest()
+
+def render_inputs(pixel_data, tile_size, frame_dimensions, user_img_array, gray_user_img_array, **settings):
+    """
+    Describes everything that determines the output of a render, so that finished work is only
+    reused by a render that would produce exactly the same frames.
+
+    Args:
+        pixel_data (PixelData): The pixel data of the render.
+        tile_size (tuple): Size (width, height) of each tile.
+        frame_dimensions (tuple): Dimensions (width, height) of the frame.
+        user_img_array (numpy.ndarray): User image array.
+        gray_user_img_array (numpy.ndarray): Grayscale user image array.
+        **settings: Any further settings of the render, which must be JSON serializable.
+
+    Returns:
+        dict: The inputs of the render.
+    """
+    return {
+        'image_hash': hash_arrays(user_img_array, gray_user_img_array),
+        'pixel_data_hash': hash_arrays(np.asarray(pixel_data.packed_frames)),
+        'first_frame': pixel_data.first_frame,
+        'levels': pixel_data.levels,
+        'frame_count': len(pixel_data),
+        'tile_size': list(tile_size),
+        'frame_dimensions': list(frame_dimensions),
+        **settings
+    }
+
+class RenderManifest:
+    """
+    Records which frames of a render are finished in a JSON file next to its output.
+
+    Finished work is stored as merged [start, stop) ranges of frame indices together with the inputs
+    of the render. Opening the manifest for different inputs discards the directory's contents, so a
+    restarted render only skips work that belongs to it.
+    """
+    def __init__(self, directory, inputs):
+        """
+        Args:
+            directory (str): Directory holding the render's frames or segments and the manifest.
+            inputs (dict): The inputs of the render, as returned by render_inputs.
+        """
+        self.directory = directory
+        self.path = os.path.join(directory, MANIFEST_FILE_NAME)
+        # Round-tripped through JSON so that tuples compare equal to the lists read back from the file
+        self.inputs = json.loads(json.dumps(inputs))
+        self.completed = []
+
+        manifest = None
+        if os.path.exists(self.path):
+            try:
+                with open(self.path) as file:
+                    manifest = json.load(file)
+            except (OSError, ValueError):
+                manifest = None
+
+        if manifest and manifest.get('version') == MANIFEST_VERSION and manifest.get('inputs') == self.inputs:
+            self.completed = [tuple(interval) for interval in manifest.get('completed', [])]
+        else:
+            self.reset()
+
+    def reset(self):
+        """
+        Discards all finished work, including the files in the manifest's directory.
+        """
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(self.directory, exist_ok=True)
+        self.completed = []
+        self.save()
+
+    def save(self):
+        """
+        Writes the manifest. The file is replaced atomically, so it stays valid if the render is killed.
+        """
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as file:
+            json.dump({
+                'version': MANIFEST_VERSION,
+                'inputs': self.inputs,
+                'completed': [list(interval) for interval in self.completed]
+            }, file)
+        os.replace(temp_path, self.path)
+
+    def is_complete(self, start, stop):
+        """
+        Checks whether a range of frames is finished.
+
+        Args:
+            start (int): Index of the first frame of the range.
+            stop (int): Index after the last frame of the range.
+
+        Returns:
+            bool: True if every frame of the range is finished.
+        """
+        return any(done_start <= start and stop <= done_stop for done_start, done_stop in self.completed)
+
+    def mark_complete(self, start, stop):
+        """
+        Records a range of frames as finished and saves the manifest.
+
+        Args:
+            start (int): Index of the first frame of the range.
+            stop (int): Index after the last frame of the range.
+        """
+        merged = []
+        for interval in sorted(self.completed + [(start, stop)]):
+            if merged and interval[0] <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], interval[1]))
+            else:
+                merged.append(interval)
+        self.completed = merged
+        self.save()
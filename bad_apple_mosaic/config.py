@@ -17,20 +17,115 @@ AUDIO_FILE = os.path.join(ASSETS_DIR, 'bad_apple_enhanced.mp3')
 ICON_FILE = os.path.join(ASSETS_DIR, 'badApple.ico')
 IMAGE_FILE = os.path.join(ASSETS_DIR, 'badApple.png')
 PIXEL_DATA_DIR = os.path.join(base_path, 'pixel_data')
+PIXEL_CACHE_DIR = os.path.join(PIXEL_DATA_DIR, 'cache')
+SOURCE_VIDEO_FILE = os.path.join(ASSETS_DIR, 'bad_apple.mp4')
+RESULT_CACHE_DIR = os.path.join(OUTPUT_VIDEO_DIR, 'cache')
 
+# Most render workers started, leaving some cores to ffmpeg and the GUI
 NUM_PROCESSES = max(2, int(mp.cpu_count() * 0.7))
 MIN_TILE_SIZE = 20
+# Largest output width and height in pixels, the limit of libx264
+MAX_OUTPUT_DIMENSION = 16384
+
+# Grayscale value above which a cell of the source video counts as white
+PIXEL_THRESHOLD = 128
+# Brightness levels per cell of the pixel data: 2 is black and white, 4, 8 or 16 (2-4 bits per cell) keep
+# the anti-aliased edges of the silhouette as shades between the darkened and the original tile
+PIXEL_LEVELS = 2
+
+# 'vectorized' composes each frame with NumPy, 'loop' is the per-tile reference implementation
+COMPOSITING_ENGINE = 'vectorized'
+# Repaint only the tiles that changed since the previous frame of each task, instead of whole frames
+DELTA_RENDERING = True
+# Memory limit in bytes of each worker's cache of composed tile rows, 0 disables the cache
+ROW_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# 'stream' pipes raw frames into ffmpeg, 'png' writes every frame to PROCESSED_FRAMES_DIR first
+RENDER_MODE = 'stream'
+# Memory in bytes for composed frames waiting to be encoded. It sets how many frames are rendered ahead
+# of the encoder, so memory use stays flat however long the video is
+RENDER_MEMORY_BUDGET = 512 * 1024 * 1024
+# Frame slots of the shared memory ring that streamed frames are composed into and encoded from, or None
+# for two tasks per worker, and at least one task per segment encoded in parallel, within RENDER_MEMORY_BUDGET.
+# Workers wait for free slots when the encoder falls behind
+FRAME_RING_SLOTS = None
+# Memory in bytes a worker may use for the frame it composes. Larger frames are composed in horizontal strips
+# of whole tile rows straight into their ring slot, so memory per worker does not grow with the output resolution
+WORKER_FRAME_BUDGET = 64 * 1024 * 1024
+
+# 'yuv420p' composes streamed frames as YUV 4:2:0 planes from tiles converted once per render and sends
+# them to ffmpeg as Y4M, which needs even tile sizes; 'bgr24' sends BGR frames for ffmpeg to convert
+STREAM_PIXEL_FORMAT = 'yuv420p'
+
+# Streamed renders can be encoded as this many segments at a time in parallel ffmpeg processes and joined
+# afterwards, 1 encodes them one after another. Every segment restarts the encoder on a keyframe of its own,
+# which costs a little size at the same CRF, and a lot on videos that are only a few keyframe intervals long
+ENCODE_SEGMENTS = 1
+# Streamed renders are split into segments of at most this many seconds, rounded up to whole keyframe
+# intervals. Every finished segment is checkpointed, so an interrupted render of the same inputs resumes
+# after it. None only splits the video for ENCODE_SEGMENTS, and encodes it in a single process without
+# checkpoints when that is 1
+CHECKPOINT_SEGMENT_SECONDS = 60
+# Longest distance between keyframes of a segmented encode, which segments are whole multiples of.
+# Scene cuts still add keyframes in between, like x264's own default of 250 frames
+KEYFRAME_INTERVAL_SECONDS = 10
+# libx264 settings; X264_THREADS of None lets x264 decide, or splits the cores between segments
+X264_PRESET = 'medium'
+X264_CRF = 23
+X264_THREADS = None
+
+# Number of consecutive frames sent to a worker as one task
+TASK_CHUNKSIZE = 4
+
+# 'process' renders on spawned worker processes, 'thread' on threads of the main process, and 'auto'
+# picks the faster one from a short calibration run before each render
+WORKER_BACKEND = 'auto'
+# Number of render workers, or None to size the pool from the calibration run, free cores and free memory
+NUM_WORKERS = None
+# Frames rendered per calibration task, and most threads run side by side to see how rendering scales
+CALIBRATION_FRAMES = 6
+CALIBRATION_THREADS = 4
+# Estimated start-up time and memory of a spawned worker process, with its imports
+PROCESS_STARTUP_SECONDS = 1.0
+WORKER_PROCESS_BYTES = 150 * 1024 * 1024
+# Least amount of work in seconds that makes another worker worth starting
+MIN_SECONDS_PER_WORKER = 1.0
+# Share of the free memory the workers of a render may use
+WORKER_MEMORY_SHARE = 0.5
+
+PREVIEW_FRAME_NUMBER = 250
+
+# Directory for a Chrome trace of every render (open it in chrome://tracing or ui.perfetto.dev) with the
+# time of every stage and worker task and the memory in use, or None to not trace. Set by BAD_APPLE_TRACE
+TRACE_DIR = os.environ.get('BAD_APPLE_TRACE') or None
+# Also save cProfile profiles of the parent and of every worker next to the trace. Set by BAD_APPLE_PROFILE=1
+TRACE_PROFILE = os.environ.get('BAD_APPLE_PROFILE', '0') not in ('', '0')
+# Seconds between two memory samples of the parent process of a traced render
+TRACE_MEMORY_INTERVAL = 0.1
+
+# Size limit in bytes of the cache of finished videos, least recently used videos are evicted first
+RESULT_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+# Resolution, number of sampled frames and frame interval of the preview shown after selecting an image
+PREVIEW_RESOLUTION = (480, 360)
+PREVIEW_SAMPLE_COUNT = 8
+PREVIEW_FRAME_INTERVAL_MS = 500
 
 DEFAULT_INPUT_RESOLUTION = '48p'
 DEFAULT_FRAMERATE = '30fps'
 DEFAULT_OUTPUT_RESOLUTION = '1080p'
 
 OUTPUT_RESOLUTION_DIMENSIONS = {
+    '8K': (5760, 4320),
     '4K': (2880, 2160),
     '2K': (1920, 1440),
     '1080p': (1440, 1080)
 }
 
+INPUT_RESOLUTION_GRIDS = {
+    '72p': (72, 54),
+    '48p': (48, 36)
+}
+
 FRAME_RATE_OPTIONS = {
     '30fps': 30,
     '60fps': 60
@@ -1,18 +1,41 @@
+import time
+
+# Taken before any other import, so the measured startup time includes loading the GUI toolkit
+STARTUP_START_TIME = time.perf_counter()
+
 import customtkinter as ctk
 from tkinter import filedialog, messagebox
-from PIL import Image, ImageOps, ImageEnhance
+from PIL import Image
 import shutil
 import os
 import sys
-import video_generator
-import time
+from progress import format_progress
 import config
 import threading
 import multiprocessing
 import re
 
+# The rendering modules pull in OpenCV and NumPy, so they are imported by load_render_stack on first use
+video_generator = None
+pixel_cache = None
+result_cache = None
+
+def load_render_stack():
+    """
+    Imports the rendering modules. The window opens without them, and they are loaded in the
+    background once it is shown, or by the first preview or render if that comes sooner.
+    """
+    global video_generator, pixel_cache, result_cache
+    import video_generator
+    import pixel_cache
+    import result_cache
+
 class BadAppleApp(ctk.CTk):
-    def __init__(self):
+    def __init__(self, measure_startup=False):
+        """
+        Args:
+            measure_startup (bool, optional): Print the startup time and close the window once it is shown.
+        """
         super().__init__()
         self.title("Bad Appleify")
         self.iconbitmap(config.ICON_FILE)
@@ -37,6 +60,9 @@ class BadAppleApp(ctk.CTk):
         # Keep a reference to the processing thread
         self.processing_thread = None
 
+        # Incremented for every preview request so that stale previews are discarded
+        self.preview_request = 0
+
         # Initialize frames dictionary
         self.frames = {}
         self.current_frame = None
@@ -46,7 +72,21 @@ class BadAppleApp(ctk.CTk):
 
         # Set the protocol handler for window close event
         self.protocol("WM_DELETE_WINDOW", self.on_closing)
-        
+
+        # Runs after the deferred widgets of the initial frame, once the window can be used
+        self.measure_startup = measure_startup
+        self.after_idle(self.startup_complete)
+
+    def startup_complete(self):
+        """
+        Reports the startup time and loads the rendering modules in the background.
+        """
+        print(f"Startup took {time.perf_counter() - STARTUP_START_TIME:.2f}s.")
+        if self.measure_startup:
+            self.destroy()
+            return
+        threading.Thread(target=load_render_stack, daemon=True).start()
+
     def show_frame(self, frame_class):
         """
         Displays the specified frame in the application window.
@@ -105,6 +145,7 @@ class BadAppleApp(ctk.CTk):
             displayed_file_path = ("..." + file_path[-(max_length - 3):]) if len(file_path) > max_length else file_path
             initial_frame = self.frames[InitialFrame]
             initial_frame.fileNameLbl.configure(text=displayed_file_path)
+            initial_frame.stop_preview()
 
             img = Image.open(file_path).convert("RGB")
             img.thumbnail((200, 200))
@@ -114,6 +155,46 @@ class BadAppleApp(ctk.CTk):
             initial_frame.imgLbl.image = ctkImg
 
             self.selected_img_path, self.selected_img_extension = os.path.splitext(file_path)
+            self.start_preview()
+
+    def start_preview(self):
+        """
+        Renders a low-resolution preview of the selected image in a separate daemon thread.
+        """
+        if not self.selected_img_path:
+            return
+
+        self.preview_request += 1
+        preview_thread = threading.Thread(
+            target=self.render_preview,
+            args=(self.preview_request, self.selected_img_path + self.selected_img_extension,
+                  self.input_resolution, self.output_framerate),
+            daemon=True
+        )
+        preview_thread.start()
+
+    def render_preview(self, request, image_path, input_resolution, framerate):
+        """
+        Renders the preview frames and hands them to the initial frame.
+
+        Args:
+            request (int): The preview request number, used to discard previews of an earlier selection.
+            image_path (str): Path to the selected image.
+            input_resolution (str): The selected input resolution.
+            framerate (str): The selected output frame rate.
+        """
+        try:
+            load_render_stack()
+            pixel_data_path = pixel_cache.find_preset_pixel_data(input_resolution, framerate)
+            frames = video_generator.render_preview(image_path, pixel_data_path)
+        except Exception as e:
+            print(f"Could not render the preview: {e}")
+            return
+
+        def show():
+            if request == self.preview_request:
+                self.frames[InitialFrame].show_preview([frame for _, frame in frames])
+        self.after(0, show)
 
     def upload_file_handler(self):
         """
@@ -123,9 +204,6 @@ class BadAppleApp(ctk.CTk):
             messagebox.showerror("Error", "No valid file was selected.")
             return
 
-        save_dir = config.UPLOAD_DIR
-        os.makedirs(save_dir, exist_ok=True)
-
         # Show progress frame
         self.show_frame(ProgressFrame)
 
@@ -138,35 +216,49 @@ class BadAppleApp(ctk.CTk):
         Processes the user-selected image and generates the video.
         """
         try:
-            save_file_name = "upload.png"
-            save_path = os.path.join(config.UPLOAD_DIR, save_file_name)
-
-            img = Image.open(self.selected_img_path + self.selected_img_extension).convert("RGB")
-            img.save(save_path, "PNG")
-
-            gray_img = ImageOps.grayscale(img)
-            enhanced_img = ImageEnhance.Contrast(gray_img).enhance(2.0)
-            enhanced_img = ImageEnhance.Brightness(enhanced_img).enhance(0.1)
-            enhanced_img.save(os.path.join(config.UPLOAD_DIR, "gray_upload.png"), "PNG")
+            load_render_stack()
+            # The renders open the file themselves, so JPEG uploads are decoded at the tile's scale
+            image_path = self.selected_img_path + self.selected_img_extension
 
             # Construct pixel data file path based on user selections
-            pixel_data_filename = f"pixel_data@{self.input_resolution}{self.output_framerate}.pkl"
-            pixel_data_path = os.path.join(config.PIXEL_DATA_DIR, pixel_data_filename)
-            if not os.path.exists(pixel_data_path):
-                raise FileNotFoundError(f"Pixel data file '{pixel_data_filename}' not found.")
-
-            # Call video_generator functions
+            pixel_data_path = pixel_cache.find_preset_pixel_data(self.input_resolution, self.output_framerate)
+            output_resolution = config.OUTPUT_RESOLUTION_DIMENSIONS[self.output_resolution]
+            fps = config.FRAME_RATE_OPTIONS[self.output_framerate]
+            output_video_path = os.path.join(config.OUTPUT_VIDEO_DIR, "good_apple.mp4")
+
+            # The same image with the same settings was rendered before, so reuse that video
+            cache_key = result_cache.result_key(image_path, pixel_data_path, output_resolution, fps, config.AUDIO_FILE)
+            if result_cache.lookup(cache_key, output_video_path, config.VIDEO_PREVIEW_FILE):
+                self.processing_complete()
+                return
+
+            # Call video_generator functions, which build the tiles from the image in memory
             start_time = time.time()
-            video_generator.generate_frames(
-                pixel_data_path=pixel_data_path,
-                output_resolution=config.OUTPUT_RESOLUTION_DIMENSIONS[self.output_resolution]
-            )
-            video_generator.generate_video(
-                frames_dir=config.PROCESSED_FRAMES_DIR,
-                fps=config.FRAME_RATE_OPTIONS[self.output_framerate],
-                output_video_path=os.path.join(config.OUTPUT_VIDEO_DIR, "good_apple.mp4"),
-                audio_path=config.AUDIO_FILE
-            )
+            if config.RENDER_MODE == 'stream':
+                video_generator.stream_video(
+                    pixel_data_path=pixel_data_path,
+                    output_resolution=output_resolution,
+                    fps=fps,
+                    output_video_path=output_video_path,
+                    audio_path=config.AUDIO_FILE,
+                    progress_callback=self.report_progress,
+                    image=image_path
+                )
+            else:
+                video_generator.generate_frames(
+                    pixel_data_path=pixel_data_path,
+                    output_resolution=output_resolution,
+                    progress_callback=self.report_progress,
+                    image=image_path
+                )
+                video_generator.generate_video(
+                    frames_dir=config.PROCESSED_FRAMES_DIR,
+                    fps=fps,
+                    output_video_path=output_video_path,
+                    audio_path=config.AUDIO_FILE,
+                    progress_callback=self.report_progress
+                )
+            result_cache.store(cache_key, output_video_path, config.VIDEO_PREVIEW_FILE)
 
             # After processing is done, update the GUI
             self.processing_complete()
@@ -174,6 +266,15 @@ class BadAppleApp(ctk.CTk):
         except Exception as e:
             self.show_error_message(f"An unexpected error occurred: {e}")
 
+    def report_progress(self, progress):
+        """
+        Progress callback invoked from the processing thread.
+
+        Args:
+            progress (RenderProgress): The latest progress of the render.
+        """
+        self.after(0, lambda: self.frames[ProgressFrame].show_progress(progress))
+
     def processing_complete(self):
         """
         Callback function invoked when the processing is complete.
@@ -228,8 +329,10 @@ class BadAppleApp(ctk.CTk):
         """
         if messagebox.askokcancel("Quit", "Do you want to cancel?"):
             try:
-                # Terminate the executor if it's running
-                if video_generator.executor_reference is not None:
+                # Terminate the executor if it's running. Segments that are already encoded stay in the
+                # '<output>.segments' directory with their manifest (finished frames stay in PROCESSED_FRAMES_DIR
+                # in png mode), so uploading the same image again with the same settings resumes the render.
+                if video_generator is not None and video_generator.executor_reference is not None:
                     video_generator.executor_reference.shutdown(wait=False, cancel_futures=True)
             except Exception as e:
                 print(f"Error during shutdown: {e}")
@@ -260,13 +363,14 @@ class InitialFrame(ctk.CTkFrame):
         )
         titleLbl.grid(row=0, column=0, columnspan=3, pady=5, sticky="ew")
 
-        # Display Image
-        image_path = config.IMAGE_FILE
-        img = Image.open(image_path)
-        ctkImg = ctk.CTkImage(light_image=img, size=(200, 200))
-        self.imgLbl = ctk.CTkLabel(master=self, image=ctkImg, anchor="center", text="")
+        # Display Image, loaded once the window is shown
+        self.imgLbl = ctk.CTkLabel(master=self, anchor="center", text="")
         self.imgLbl.grid(row=1, column=0, columnspan=3, pady=5)
-        self.imgLbl.image = ctkImg
+
+        # Preview frames shown in place of the image once it is selected
+        self.preview_images = []
+        self.preview_index = 0
+        self.preview_job = None
 
         # Select Image Button
         selectImageBtn = ctk.CTkButton(
@@ -280,6 +384,31 @@ class InitialFrame(ctk.CTkFrame):
         )
         self.fileNameLbl.grid(row=2, column=1, columnspan=2, pady=5, sticky="ew")
 
+        # Image Requirements Label
+        imgReqLbl = ctk.CTkLabel(
+            master=self, text="*Your file must be an image file.", anchor="center"
+        )
+        imgReqLbl.grid(row=6, column=0, columnspan=3, pady=5, sticky="ew")
+
+        # Upload Button
+        uploadBtn = ctk.CTkButton(
+            master=self, text="Upload", border_width=1, command=self.controller.upload_file_handler
+        )
+        uploadBtn.grid(row=7, column=0, columnspan=3, pady=10)
+
+        # The image and option menus are the slowest widgets to create, so they are added after the first paint
+        self.after_idle(self.load_deferred_widgets)
+
+    def load_deferred_widgets(self):
+        """
+        Loads the default image and builds the option menus.
+        """
+        if self.controller.selected_img_path is None:
+            img = Image.open(config.IMAGE_FILE)
+            ctkImg = ctk.CTkImage(light_image=img, size=(200, 200))
+            self.imgLbl.configure(image=ctkImg)
+            self.imgLbl.image = ctkImg
+
         # Input Resolution Option Menu
         input_resolution_label = ctk.CTkLabel(master=self, text="Input Resolution:", anchor="w")
         input_resolution_label.grid(row=3, column=0, padx=5, pady=5, sticky="w")
@@ -313,7 +442,7 @@ class InitialFrame(ctk.CTkFrame):
         output_resolution_label.grid(row=5, column=0, padx=5, pady=5, sticky="w")
 
         self.output_resolution_var = ctk.StringVar(value=self.controller.output_resolution)
-        output_resolution_options = ["4K", "2K", "1080p"]
+        output_resolution_options = ["8K", "4K", "2K", "1080p"]
         output_resolution_menu = ctk.CTkOptionMenu(
             master=self,
             values=output_resolution_options,
@@ -322,17 +451,54 @@ class InitialFrame(ctk.CTkFrame):
         )
         output_resolution_menu.grid(row=5, column=1, columnspan=2, padx=5, pady=5, sticky="ew")
 
-        # Image Requirements Label
-        imgReqLbl = ctk.CTkLabel(
-            master=self, text="*Your file must be an image file.", anchor="center"
-        )
-        imgReqLbl.grid(row=6, column=0, columnspan=3, pady=5, sticky="ew")
+    def show_preview(self, frames):
+        """
+        Cycles through rendered preview frames in the image label.
 
-        # Upload Button
-        uploadBtn = ctk.CTkButton(
-            master=self, text="Upload", border_width=1, command=self.controller.upload_file_handler
-        )
-        uploadBtn.grid(row=7, column=0, columnspan=3, pady=10)
+        Args:
+            frames (list): The preview frames as BGR arrays.
+        """
+        self.stop_preview()
+        self.preview_images = []
+        for frame in frames:
+            img = Image.fromarray(frame[:, :, ::-1])
+            img.thumbnail((200, 200))
+            self.preview_images.append(ctk.CTkImage(light_image=img, size=img.size))
+        self.preview_index = 0
+        self.animate_preview()
+
+    def animate_preview(self):
+        """
+        Shows the next preview frame and schedules the one after it.
+        """
+        if not self.preview_images:
+            return
+        ctkImg = self.preview_images[self.preview_index]
+        self.imgLbl.configure(image=ctkImg)
+        self.imgLbl.image = ctkImg
+        self.preview_index = (self.preview_index + 1) % len(self.preview_images)
+        self.preview_job = self.after(config.PREVIEW_FRAME_INTERVAL_MS, self.animate_preview)
+
+    def stop_preview(self):
+        """
+        Stops cycling through the preview frames.
+        """
+        if self.preview_job is not None:
+            self.after_cancel(self.preview_job)
+            self.preview_job = None
+
+    def on_show_frame(self):
+        """
+        Resumes the preview when returning to this frame.
+        """
+        if self.preview_images and self.preview_job is None:
+            self.animate_preview()
+
+    def on_hide_frame(self):
+        """
+        Pauses the preview while another frame is shown.
+        """
+        self.stop_preview()
 
     def update_input_resolution(self, value):
         """
@@ -342,6 +508,7 @@ class InitialFrame(ctk.CTkFrame):
             value (str): The selected input resolution.
         """
         self.controller.input_resolution = value
+        self.controller.start_preview()
 
     def update_output_framerate(self, value):
         """
@@ -351,6 +518,7 @@ class InitialFrame(ctk.CTkFrame):
             value (str): The selected output frame rate.
         """
         self.controller.output_framerate = value
+        self.controller.start_preview()
 
     def update_output_resolution(self, value):
         """
@@ -375,7 +543,7 @@ class ProgressFrame(ctk.CTkFrame):
 
         # Configure grid layout
         self.grid_columnconfigure(0, weight=1)
-        self.grid_rowconfigure((0, 1, 2, 3), weight=1)
+        self.grid_rowconfigure((0, 1, 2, 3, 4), weight=1)
 
         # Progress Label
         self.progress_label = ctk.CTkLabel(
@@ -386,6 +554,10 @@ class ProgressFrame(ctk.CTkFrame):
         # Progress Bar
         self.progress_bar = ctk.CTkProgressBar(self, orientation="horizontal", mode="indeterminate", height=20)
         self.progress_bar.grid(row=1, column=0, padx=20, pady=10, sticky="ew")
+
+        # Progress Details Label
+        self.progress_details_label = ctk.CTkLabel(master=self, text="Preparing...", anchor="center")
+        self.progress_details_label.grid(row=2, column=0, padx=20, pady=5, sticky="ew")
         
         # Warning Label
         warning_text = (
@@ -393,16 +565,32 @@ class ProgressFrame(ctk.CTkFrame):
             "Please ensure your computer is plugged in and avoid running other heavy applications."
         )
         warningLbl = ctk.CTkLabel(master=self, text=warning_text, anchor="center")
-        warningLbl.grid(row=2, column=0, pady=10, sticky="ew")
+        warningLbl.grid(row=3, column=0, pady=10, sticky="ew")
 
         # Cancel Button
         self.cancelBtn = ctk.CTkButton(
             master=self, text="Cancel", border_width=1, command=self.controller.on_closing
         )
-        self.cancelBtn.grid(row=3, column=0, padx=20, pady=10)
+        self.cancelBtn.grid(row=4, column=0, padx=20, pady=10)
+
+    def show_progress(self, progress):
+        """
+        Switches the progress bar to determinate mode and shows the latest progress of the render.
+
+        Args:
+            progress (RenderProgress): The latest progress of the render.
+        """
+        if self.progress_bar.cget("mode") != "determinate":
+            self.progress_bar.stop()
+            self.progress_bar.configure(mode="determinate")
+        if progress.total_frames:
+            self.progress_bar.set(min(1.0, progress.frames_done / progress.total_frames))
+        self.progress_details_label.configure(text=format_progress(progress))
 
     def on_show_frame(self):
         """Method called when the frame is shown."""
+        self.progress_bar.configure(mode="indeterminate")
+        self.progress_details_label.configure(text="Preparing...")
         self.progress_bar.start()
 
     def on_hide_frame(self):
@@ -455,5 +643,6 @@ class SaveFrame(ctk.CTkFrame):
 
 if __name__ == "__main__":
     multiprocessing.freeze_support()
-    app = BadAppleApp()
+    # 'python gui.py --measure-startup' prints how long the window takes to open and exits
+    app = BadAppleApp(measure_startup='--measure-startup' in sys.argv[1:])
     app.mainloop()
@@ -0,0 +1,278 @@
+import cv2 as cv
+import numpy as np
+import os
+import re
+import sys
+import hashlib
+import config
+from pixel_data import (
+    MAX_BITS_PER_CELL, PIXEL_DATA_EXTENSION, PIXEL_DATA_VERSION, find_pixel_data_file, load_pixel_data, pack_levels,
+    write_pixel_data
+)
+
+# Source hashes memoized by (path, size, modification time) so a file is only hashed once per process
+_source_hashes = {}
+
+def hash_file(path):
+    """
+    Computes the SHA-256 hash of a file.
+
+    Args:
+        path (str): Path to the file.
+
+    Returns:
+        str: The hex digest of the file's contents.
+    """
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if memo_key not in _source_hashes:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b''):
+                digest.update(chunk)
+        _source_hashes[memo_key] = digest.hexdigest()
+    return _source_hashes[memo_key]
+
+def bits_per_cell(levels):
+    """
+    Returns the number of bits needed to store a number of brightness levels.
+
+    Args:
+        levels (int): Number of brightness levels per cell, a power of two.
+
+    Returns:
+        int: The number of bits per cell.
+    """
+    bits = int(levels).bit_length() - 1
+    if levels < 2 or levels != 1 << bits or bits > MAX_BITS_PER_CELL:
+        raise Exception(f"Pixel data can store 2, 4, 8 ... {1 << MAX_BITS_PER_CELL} brightness levels, not {levels}.")
+    return bits
+
+def quantize_cells(small_frame, levels, threshold=config.PIXEL_THRESHOLD):
+    """
+    Turns a grayscale frame downsampled to the tile grid into cell values. Two levels are thresholded;
+    more levels split the gray range evenly, so cells on the silhouette's edges keep their partial coverage.
+
+    Args:
+        small_frame (numpy.ndarray): The grayscale frame at the size of the tile grid.
+        levels (int): Number of brightness levels per cell.
+        threshold (int, optional): Grayscale value above which a cell counts as white with two levels.
+
+    Returns:
+        numpy.ndarray: The flat cell values from 0 to levels - 1.
+    """
+    if levels == 2:
+        return (small_frame > threshold).reshape(-1).astype(np.uint8)
+    return ((small_frame.astype(np.uint16) * levels) >> 8).astype(np.uint8).reshape(-1)
+
+def extract_pixel_data(video_path, grid_size, fps=None, threshold=config.PIXEL_THRESHOLD, levels=2):
+    """
+    Reads a video in a single pass and turns every frame into packed pixel data, without writing any
+    intermediate images. Frames are downsampled to the tile grid, quantized and packed with pack_levels.
+
+    Args:
+        video_path (str): Path to the source video.
+        grid_size (tuple): Dimensions (columns, rows) of the tile grid.
+        fps (float, optional): Frame rate of the pixel data. Frames are dropped or repeated to match it.
+            Defaults to the frame rate of the source video.
+        threshold (int, optional): Grayscale value above which a cell counts as white with two levels.
+        levels (int, optional): Number of brightness levels per cell.
+
+    Returns:
+        tuple: The packed frames as an array of shape (frame_count, bytes_per_frame) and the frame rate.
+    """
+    cell_bits = bits_per_cell(levels)
+    source_video = cv.VideoCapture(video_path)
+    if not source_video.isOpened():
+        raise Exception(f"Error opening video file '{video_path}'")
+
+    try:
+        source_fps = source_video.get(cv.CAP_PROP_FPS)
+        if not source_fps:
+            raise Exception(f"Could not determine the frame rate of '{video_path}'")
+        fps = fps or source_fps
+        source_frames_per_frame = source_fps / fps
+
+        packed_frames = []
+        source_index = 0
+        while True:
+            ret, frame = source_video.read()
+            if not ret:
+                break
+
+            # The source frame nearest to each output timestamp is used, so frames are
+            # skipped when lowering the frame rate and repeated when raising it
+            if int(len(packed_frames) * source_frames_per_frame + 0.5) <= source_index:
+                gray_frame = cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
+                small_frame = cv.resize(gray_frame, grid_size, interpolation=cv.INTER_AREA)
+                packed_frame = pack_levels(quantize_cells(small_frame, levels, threshold), cell_bits)
+                while int(len(packed_frames) * source_frames_per_frame + 0.5) <= source_index:
+                    packed_frames.append(packed_frame)
+            source_index += 1
+    finally:
+        source_video.release()
+
+    if not packed_frames:
+        raise Exception(f"No frames could be read from '{video_path}'")
+
+    return np.stack(packed_frames), fps
+
+def cache_file_name(source_hash, grid_size, fps, threshold=config.PIXEL_THRESHOLD, levels=2):
+    """
+    Builds the cache file name for a set of extraction parameters.
+
+    Args:
+        source_hash (str): SHA-256 hash of the source video or pixel data file the cells come from.
+        grid_size (tuple): Dimensions (columns, rows) of the tile grid.
+        fps (float): Frame rate of the pixel data.
+        threshold (int, optional): Grayscale threshold used for extraction with two levels.
+        levels (int, optional): Number of brightness levels per cell.
+
+    Returns:
+        str: The file name of the cache entry.
+    """
+    fps_label = f"{fps:g}".replace('.', '_')
+    # The threshold only matters for black and white cells, and their names stay as they were
+    quantization = f"-t{threshold}-v1" if levels == 2 else f"-l{levels}-v{PIXEL_DATA_VERSION}"
+    return (
+        f"pixel_data@{grid_size[0]}x{grid_size[1]}@{fps_label}fps"
+        f"{quantization}-{source_hash[:16]}{PIXEL_DATA_EXTENSION}"
+    )
+
+def get_pixel_data_path(grid_size, fps, video_path=None, threshold=config.PIXEL_THRESHOLD, levels=2):
+    """
+    Returns the path of cached pixel data for the given grid size and frame rate, extracting it from
+    the source video the first time it is requested.
+
+    Args:
+        grid_size (tuple): Dimensions (columns, rows) of the tile grid.
+        fps (float): Frame rate of the pixel data.
+        video_path (str, optional): Path to the source video. Defaults to config.SOURCE_VIDEO_FILE.
+        threshold (int, optional): Grayscale value above which a cell counts as white with two levels.
+        levels (int, optional): Number of brightness levels per cell.
+
+    Returns:
+        str: Path to the binary pixel data file.
+    """
+    video_path = video_path or config.SOURCE_VIDEO_FILE
+    if not os.path.exists(video_path):
+        raise FileNotFoundError(f"Source video '{video_path}' not found.")
+
+    cache_path = os.path.join(
+        config.PIXEL_CACHE_DIR, cache_file_name(hash_file(video_path), grid_size, fps, threshold, levels)
+    )
+    if not os.path.exists(cache_path):
+        os.makedirs(config.PIXEL_CACHE_DIR, exist_ok=True)
+        packed_frames, fps = extract_pixel_data(video_path, grid_size, fps, threshold, levels)
+        write_pixel_data(cache_path, packed_frames, grid_size, fps, bits_per_cell=bits_per_cell(levels))
+        print(f"Cached pixel data for a {grid_size[0]}x{grid_size[1]} grid at {fps:g}fps in '{cache_path}'.")
+
+    return cache_path
+
+def get_resampled_pixel_data_path(source_path, grid_size, levels):
+    """
+    Returns the path of cached multi-level pixel data resampled from a finer black and white grid,
+    creating it the first time it is requested. Every cell of the coarser grid averages the cells of
+    the finer grid it covers, which anti-aliases the silhouette's edges like extracting the levels
+    from the source video would.
+
+    Args:
+        source_path (str): Path to the finer pixel data file.
+        grid_size (tuple): Dimensions (columns, rows) of the coarser tile grid.
+        levels (int): Number of brightness levels per cell.
+
+    Returns:
+        str: Path to the binary pixel data file.
+    """
+    cell_bits = bits_per_cell(levels)
+    source = load_pixel_data(source_path)
+    fps = source.fps or 0
+    cache_path = os.path.join(
+        config.PIXEL_CACHE_DIR, cache_file_name(hash_file(source_path), grid_size, fps, levels=levels)
+    )
+    if not os.path.exists(cache_path):
+        os.makedirs(config.PIXEL_CACHE_DIR, exist_ok=True)
+        columns, rows = source.frame_dimensions
+        packed_frames = np.empty((len(source), (grid_size[0] * grid_size[1] * cell_bits + 7) // 8), dtype=np.uint8)
+        for index in range(len(source)):
+            fine_frame = source.frame_bits(index).reshape(rows, columns).astype(np.float32) / (source.levels - 1)
+            coverage = cv.resize(fine_frame, grid_size, interpolation=cv.INTER_AREA)
+            cells = np.rint(coverage * (levels - 1)).astype(np.uint8).reshape(-1)
+            packed_frames[index] = pack_levels(cells, cell_bits)
+        write_pixel_data(cache_path, packed_frames, grid_size, source.fps, source.first_frame, cell_bits)
+        print(f"Cached {levels}-level pixel data for a {grid_size[0]}x{grid_size[1]} grid in '{cache_path}'.")
+
+    return cache_path
+
+def find_levels_pixel_data(input_resolution, framerate, levels):
+    """
+    Finds multi-level pixel data for one of the input resolution and frame rate options. The levels are
+    extracted from the source video when it is available, and otherwise resampled from a shipped preset
+    with a finer grid at the same frame rate.
+
+    Args:
+        input_resolution (str): Key of config.INPUT_RESOLUTION_GRIDS, e.g. '48p'.
+        framerate (str): Key of config.FRAME_RATE_OPTIONS, e.g. '30fps'.
+        levels (int): Number of brightness levels per cell.
+
+    Returns:
+        str: Path to the pixel data file, or None if there is nothing to build it from.
+    """
+    grid_size = config.INPUT_RESOLUTION_GRIDS[input_resolution]
+    if os.path.exists(config.SOURCE_VIDEO_FILE):
+        return get_pixel_data_path(grid_size, config.FRAME_RATE_OPTIONS[framerate], levels=levels)
+
+    finer_resolutions = sorted(
+        (resolution for resolution, finer_grid in config.INPUT_RESOLUTION_GRIDS.items()
+         if finer_grid[0] > grid_size[0] and finer_grid[1] > grid_size[1]),
+        key=lambda resolution: config.INPUT_RESOLUTION_GRIDS[resolution][0], reverse=True
+    )
+    for resolution in finer_resolutions:
+        source_path = find_pixel_data_file(config.PIXEL_DATA_DIR, f"pixel_data@{resolution}{framerate}")
+        if source_path is not None:
+            return get_resampled_pixel_data_path(source_path, grid_size, levels)
+    return None
+
+def find_preset_pixel_data(input_resolution, framerate, levels=None):
+    """
+    Finds the pixel data for one of the input resolution and frame rate options, preferring the shipped
+    preset files and falling back to the cache when the source video is available.
+
+    Args:
+        input_resolution (str): Key of config.INPUT_RESOLUTION_GRIDS, e.g. '48p'.
+        framerate (str): Key of config.FRAME_RATE_OPTIONS, e.g. '30fps'.
+        levels (int, optional): Number of brightness levels per cell. Defaults to config.PIXEL_LEVELS.
+
+    Returns:
+        str: Path to the pixel data file.
+    """
+    levels = levels or config.PIXEL_LEVELS
+    if levels > 2:
+        pixel_data_path = find_levels_pixel_data(input_resolution, framerate, levels)
+        if pixel_data_path is not None:
+            return pixel_data_path
+        print(f"No source for {levels}-level pixel data at {input_resolution}{framerate}, using black and white cells.")
+
+    pixel_data_name = f"pixel_data@{input_resolution}{framerate}"
+    pixel_data_path = find_pixel_data_file(config.PIXEL_DATA_DIR, pixel_data_name)
+    if pixel_data_path is None and os.path.exists(config.SOURCE_VIDEO_FILE):
+        # No shipped preset for this combination, so extract it from the source video once
+        pixel_data_path = get_pixel_data_path(
+            config.INPUT_RESOLUTION_GRIDS[input_resolution],
+            config.FRAME_RATE_OPTIONS[framerate]
+        )
+    if pixel_data_path is None:
+        raise FileNotFoundError(f"Pixel data file '{pixel_data_name}' not found.")
+    return pixel_data_path
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (4, 5):
+        print("Usage: python pixel_cache.py <input_video_path> <columns>x<rows> <fps> [levels]")
+        sys.exit(1)
+    grid_match = re.fullmatch(r"(\d+)x(\d+)", sys.argv[2])
+    if not grid_match:
+        print("Grid size must look like 48x36.")
+        sys.exit(1)
+    grid_size = (int(grid_match.group(1)), int(grid_match.group(2)))
+    levels = int(sys.argv[4]) if len(sys.argv) == 5 else 2
+    print(get_pixel_data_path(grid_size, float(sys.argv[3]), video_path=sys.argv[1], levels=levels))
@@ -0,0 +1,349 @@
+import numpy as np
+import os
+import re
+import sys
+import pickle
+import struct
+import zlib
+
+PIXEL_DATA_MAGIC = b'BAPD'
+PIXEL_DATA_VERSION = 2
+PIXEL_DATA_EXTENSION = '.bapd'
+
+# magic, version, header size, frame count, first frame number, width, height, fps, bytes per frame, CRC32 of the payload,
+# bits per cell (added in version 2, version 1 files have zero padding there and one bit per cell)
+HEADER_STRUCT = struct.Struct('<4sHHIIHHdIIB')
+HEADER_SIZE = 64
+MAX_BITS_PER_CELL = 8
+
+def pack_levels(values, bits_per_cell=1):
+    """
+    Packs cell values of bits_per_cell bits each into bytes, most significant bit first. With one bit
+    per cell this is np.packbits.
+
+    Args:
+        values (numpy.ndarray): Cell values from 0 to 2 ** bits_per_cell - 1, one row per frame.
+        bits_per_cell (int, optional): Number of bits stored per cell.
+
+    Returns:
+        numpy.ndarray: The packed rows.
+    """
+    values = np.asarray(values, dtype=np.uint8)
+    if bits_per_cell == 1:
+        return np.packbits(values, axis=-1)
+    shifts = np.arange(bits_per_cell - 1, -1, -1, dtype=np.uint8)
+    bits = (values[..., None] >> shifts) & 1
+    return np.packbits(bits.reshape(*values.shape[:-1], -1), axis=-1)
+
+def unpack_levels(packed_frame, cell_count, bits_per_cell=1):
+    """
+    Unpacks the cell values of one frame packed with pack_levels.
+
+    Args:
+        packed_frame (numpy.ndarray): The packed bytes of the frame.
+        cell_count (int): Number of cells in the frame.
+        bits_per_cell (int, optional): Number of bits stored per cell.
+
+    Returns:
+        numpy.ndarray: A uint8 array with one value from 0 to 2 ** bits_per_cell - 1 per cell.
+    """
+    if bits_per_cell == 1:
+        return np.unpackbits(packed_frame, count=cell_count)
+    if 8 % bits_per_cell == 0:
+        # Cells never straddle a byte, so every byte is split into its cells with a few shifts
+        shifts = np.arange(8 - bits_per_cell, -1, -bits_per_cell, dtype=np.uint8)
+        values = (np.asarray(packed_frame)[:, None] >> shifts) & ((1 << bits_per_cell) - 1)
+        return values.reshape(-1)[:cell_count]
+    bits = np.unpackbits(packed_frame, count=cell_count * bits_per_cell).reshape(cell_count, bits_per_cell)
+    return np.bitwise_or.reduce(bits << np.arange(bits_per_cell - 1, -1, -1, dtype=np.uint8), axis=1)
+
+class PixelData:
+    """
+    Frame-by-frame pixel data backed by one contiguous array of packed bits, one row per frame.
+
+    Every cell holds one of `levels` brightness levels in bits_per_cell bits: with one bit a cell is
+    black or white, with more bits the anti-aliased edges of the source video are kept as shades in
+    between. Both the binary format and the legacy pickle files load into this class, so the rest of
+    the pipeline never has to care which format a file was stored in.
+    """
+    def __init__(self, packed_frames, frame_dimensions, fps=None, first_frame=0, path=None, bits_per_cell=1):
+        """
+        Args:
+            packed_frames (numpy.ndarray): Array of shape (frame_count, bytes_per_frame) holding pack_levels rows.
+            frame_dimensions (tuple): Dimensions (columns, rows) of a frame in tiles.
+            fps (float, optional): Frame rate of the pixel data.
+            first_frame (int, optional): Frame number of the first frame.
+            path (str, optional): File the data was loaded from.
+            bits_per_cell (int, optional): Number of bits stored per cell.
+        """
+        self.packed_frames = packed_frames
+        self.frame_dimensions = tuple(frame_dimensions)
+        self.fps = fps
+        self.first_frame = first_frame
+        self.path = path
+        self.bits_per_cell = bits_per_cell
+
+    @property
+    def frame_count(self):
+        return self.packed_frames.shape[0]
+
+    @property
+    def cells_per_frame(self):
+        return self.frame_dimensions[0] * self.frame_dimensions[1]
+
+    @property
+    def bits_per_frame(self):
+        return self.cells_per_frame * self.bits_per_cell
+
+    @property
+    def levels(self):
+        return 1 << self.bits_per_cell
+
+    def __len__(self):
+        return self.frame_count
+
+    def frame_numbers(self):
+        """
+        Returns:
+            range: The frame numbers of all frames, in order.
+        """
+        return range(self.first_frame, self.first_frame + self.frame_count)
+
+    def frame_bits(self, index):
+        """
+        Unpacks the cells of a single frame.
+
+        Args:
+            index (int): Position of the frame, counted from the first frame.
+
+        Returns:
+            numpy.ndarray: A uint8 array with one value per tile, from 0 (black) to levels - 1 (white).
+        """
+        return unpack_levels(self.packed_frames[index], self.cells_per_frame, self.bits_per_cell)
+
+    def items(self):
+        """
+        Iterates over the frames like the legacy pixel data dictionary did.
+
+        Yields:
+            tuple: The frame number and the unpacked bits of every frame.
+        """
+        for index, frame_number in enumerate(self.frame_numbers()):
+            yield frame_number, self.frame_bits(index)
+
+def read_header(path):
+    """
+    Reads and validates the header of a binary pixel data file.
+
+    Args:
+        path (str): Path to the pixel data file.
+
+    Returns:
+        dict: The header fields.
+    """
+    with open(path, 'rb') as file:
+        raw_header = file.read(HEADER_STRUCT.size)
+
+    if len(raw_header) < HEADER_STRUCT.size or raw_header[:4] != PIXEL_DATA_MAGIC:
+        raise Exception(f"'{path}' is not a pixel data file.")
+
+    magic, version, header_size, frame_count, first_frame, width, height, fps, bytes_per_frame, checksum, bits_per_cell = (
+        HEADER_STRUCT.unpack(raw_header)
+    )
+    if version > PIXEL_DATA_VERSION:
+        raise Exception(f"Pixel data file '{path}' uses format version {version}, which is newer than this program supports.")
+    bits_per_cell = bits_per_cell if version >= 2 else 1
+    if not 1 <= bits_per_cell <= MAX_BITS_PER_CELL:
+        raise Exception(f"Pixel data file '{path}' stores {bits_per_cell} bits per cell, which is not supported.")
+
+    return {
+        'version': version,
+        'header_size': header_size,
+        'frame_count': frame_count,
+        'first_frame': first_frame,
+        'frame_dimensions': (width, height),
+        'fps': fps or None,
+        'bytes_per_frame': bytes_per_frame,
+        'checksum': checksum,
+        'bits_per_cell': bits_per_cell
+    }
+
+def is_binary_pixel_data(path):
+    """
+    Checks whether a file is stored in the binary pixel data format.
+
+    Args:
+        path (str): Path to the pixel data file.
+
+    Returns:
+        bool: True if the file starts with the binary format's magic bytes.
+    """
+    with open(path, 'rb') as file:
+        return file.read(len(PIXEL_DATA_MAGIC)) == PIXEL_DATA_MAGIC
+
+def open_binary_pixel_data(path, verify=True):
+    """
+    Memory-maps a binary pixel data file. Frames are only read from disk when they are accessed.
+
+    Args:
+        path (str): Path to the pixel data file.
+        verify (bool, optional): Whether to check the payload against the stored checksum.
+
+    Returns:
+        PixelData: The memory-mapped pixel data.
+    """
+    header = read_header(path)
+    packed_frames = np.memmap(
+        path,
+        dtype=np.uint8,
+        mode='r',
+        offset=header['header_size'],
+        shape=(header['frame_count'], header['bytes_per_frame'])
+    )
+
+    if verify and zlib.crc32(packed_frames) != header['checksum']:
+        raise Exception(f"Pixel data file '{path}' is corrupted (checksum mismatch).")
+
+    return PixelData(
+        packed_frames, header['frame_dimensions'], header['fps'], header['first_frame'], path, header['bits_per_cell']
+    )
+
+def load_pickled_pixel_data(path, fps=None):
+    """
+    Loads a legacy pickle file of bitarrays and packs it into a single contiguous array.
+
+    Args:
+        path (str): Path to the pixel data pickle file.
+        fps (float, optional): Frame rate of the pixel data. Parsed from the file name if omitted.
+
+    Returns:
+        PixelData: The loaded pixel data.
+    """
+    with open(path, "rb") as file:
+        data = pickle.load(file)
+        pixel_data = data['pixel_data']
+        frame_dimensions = data['frame_dimensions']
+
+    frame_numbers = list(pixel_data.keys())
+    first_frame = int(frame_numbers[0]) if frame_numbers else 0
+    if frame_numbers != list(range(first_frame, first_frame + len(frame_numbers))):
+        raise Exception(f"Pixel data file '{path}' does not contain consecutive frame numbers.")
+
+    bits_per_frame = frame_dimensions[0] * frame_dimensions[1]
+    packed_frames = np.zeros((len(frame_numbers), (bits_per_frame + 7) // 8), dtype=np.uint8)
+    for index, bits in enumerate(pixel_data.values()):
+        frame_bits = np.unpackbits(np.frombuffer(bits.tobytes(), dtype=np.uint8), count=len(bits))[:bits_per_frame]
+        frame = np.zeros(bits_per_frame, dtype=np.uint8)
+        frame[:len(frame_bits)] = frame_bits
+        packed_frames[index] = np.packbits(frame)
+
+    if fps is None:
+        fps = parse_fps_from_filename(path)
+
+    return PixelData(packed_frames, frame_dimensions, fps, first_frame, path)
+
+def load_pixel_data(path, verify=True):
+    """
+    Loads pixel data from either the binary format or a legacy pickle file.
+
+    Args:
+        path (str): Path to the pixel data file.
+        verify (bool, optional): Whether to check the checksum of binary files.
+
+    Returns:
+        PixelData: The loaded pixel data.
+    """
+    if is_binary_pixel_data(path):
+        return open_binary_pixel_data(path, verify=verify)
+    return load_pickled_pixel_data(path)
+
+def write_pixel_data(path, packed_frames, frame_dimensions, fps=None, first_frame=0, bits_per_cell=1):
+    """
+    Writes packed frames to a binary pixel data file.
+
+    Args:
+        path (str): Path of the file to write.
+        packed_frames (numpy.ndarray): Array of shape (frame_count, bytes_per_frame) holding pack_levels rows.
+        frame_dimensions (tuple): Dimensions (columns, rows) of a frame in tiles.
+        fps (float, optional): Frame rate of the pixel data.
+        first_frame (int, optional): Frame number of the first frame.
+        bits_per_cell (int, optional): Number of bits stored per cell.
+    """
+    packed_frames = np.ascontiguousarray(packed_frames, dtype=np.uint8)
+    frame_count, bytes_per_frame = packed_frames.shape
+    header = HEADER_STRUCT.pack(
+        PIXEL_DATA_MAGIC,
+        # One bit per cell is still written as version 1, so older builds keep reading those files
+        PIXEL_DATA_VERSION if bits_per_cell > 1 else 1,
+        HEADER_SIZE,
+        frame_count,
+        first_frame,
+        frame_dimensions[0],
+        frame_dimensions[1],
+        float(fps or 0),
+        bytes_per_frame,
+        zlib.crc32(packed_frames),
+        bits_per_cell
+    )
+
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as file:
+        file.write(header.ljust(HEADER_SIZE, b'\0'))
+        file.write(packed_frames.tobytes())
+    os.replace(temp_path, path)
+
+def parse_fps_from_filename(path):
+    """
+    Extracts the frame rate from a pixel data file name such as 'pixel_data@48p30fps.pkl'.
+
+    Args:
+        path (str): Path to the pixel data file.
+
+    Returns:
+        int: The frame rate, or None if the name does not contain one.
+    """
+    match = re.search(r"(\d+)fps", os.path.basename(path))
+    return int(match.group(1)) if match else None
+
+def convert_pickle(pkl_path, output_path=None, fps=None):
+    """
+    Converts a legacy pickle file of bitarrays into the binary pixel data format.
+
+    Args:
+        pkl_path (str): Path to the pixel data pickle file.
+        output_path (str, optional): Path of the binary file. Defaults to the pickle path with the binary extension.
+        fps (float, optional): Frame rate of the pixel data. Parsed from the file name if omitted.
+
+    Returns:
+        str: Path of the written binary file.
+    """
+    if output_path is None:
+        output_path = os.path.splitext(pkl_path)[0] + PIXEL_DATA_EXTENSION
+
+    pixel_data = load_pickled_pixel_data(pkl_path, fps)
+    write_pixel_data(output_path, pixel_data.packed_frames, pixel_data.frame_dimensions, pixel_data.fps, pixel_data.first_frame)
+    return output_path
+
+def find_pixel_data_file(pixel_data_dir, name):
+    """
+    Finds a pixel data file by name, preferring the binary format over the legacy pickle.
+
+    Args:
+        pixel_data_dir (str): Directory containing the pixel data files.
+        name (str): File name without extension, e.g. 'pixel_data@48p30fps'.
+
+    Returns:
+        str: Path to the pixel data file, or None if neither format exists.
+    """
+    for extension in (PIXEL_DATA_EXTENSION, '.pkl'):
+        path = os.path.join(pixel_data_dir, name + extension)
+        if os.path.exists(path):
+            return path
+    return None
+
+if __name__ == '__main__':
+    if len(sys.argv) not in (2, 3):
+        print("Usage: python pixel_data.py <input_pkl_file> [output_file]")
+        sys.exit(1)
+    output_file = convert_pickle(sys.argv[1], sys.argv[2] if len(sys.argv) == 3 else None)
+    print(f"Pixel data converted to '{output_file}'.")
@@ -0,0 +1,105 @@
+import time
+import threading
+import collections
+
+RENDER_STAGE = 'render'
+ENCODE_STAGE = 'encode'
+
+RenderProgress = collections.namedtuple(
+    'RenderProgress', ['stage', 'frames_done', 'total_frames', 'frames_per_second', 'eta_seconds']
+)
+RenderProgress.__doc__ = """
+Snapshot of a render's progress passed to progress callbacks.
+
+Fields:
+    stage (str): RENDER_STAGE while frames are composed, ENCODE_STAGE while ffmpeg finishes the video.
+    frames_done (int): Number of frames finished in this stage.
+    total_frames (int): Number of frames in the render, or None if unknown.
+    frames_per_second (float): Average throughput of this stage so far.
+    eta_seconds (float): Estimated time until the stage completes, or None if unknown.
+"""
+
+class ProgressTracker:
+    """
+    Turns frame counts from one stage of a render into RenderProgress updates for a callback.
+
+    Updates are rate-limited so that a fast render does not flood the callback (and the GUI event
+    queue behind it); the final update of a stage is always delivered.
+    """
+    def __init__(self, callback, stage, total_frames=None, min_interval=0.1, start_frames=0):
+        """
+        Args:
+            callback (callable): Called with a RenderProgress, or None to disable reporting.
+            stage (str): The stage being tracked.
+            total_frames (int, optional): Number of frames in the render.
+            min_interval (float, optional): Minimum time in seconds between two updates.
+            start_frames (int, optional): Frames already finished when tracking starts, excluded from the throughput.
+        """
+        self.callback = callback
+        self.stage = stage
+        self.total_frames = total_frames
+        self.min_interval = min_interval
+        self.frames_done = start_frames
+        self.start_frames = start_frames
+        self.start_time = time.perf_counter()
+        self.last_report_time = None
+        self.lock = threading.Lock()
+
+    def advance(self, frames):
+        """
+        Records that more frames have been finished.
+
+        Args:
+            frames (int): Number of newly finished frames.
+        """
+        with self.lock:
+            self.update(self.frames_done + frames)
+
+    def update(self, frames_done):
+        """
+        Records the total number of frames finished so far.
+
+        Args:
+            frames_done (int): Number of frames finished in this stage.
+        """
+        self.frames_done = frames_done
+        now = time.perf_counter()
+        finished = self.total_frames is not None and frames_done >= self.total_frames
+        if self.last_report_time is not None and now - self.last_report_time < self.min_interval and not finished:
+            return
+        self.last_report_time = now
+        self.report(now)
+
+    def report(self, now=None):
+        """
+        Sends the current progress to the callback.
+
+        Args:
+            now (float, optional): Current time from time.perf_counter().
+        """
+        if self.callback is None:
+            return
+        elapsed = (now or time.perf_counter()) - self.start_time
+        frames_per_second = (self.frames_done - self.start_frames) / elapsed if elapsed > 0 else 0.0
+        eta_seconds = None
+        if self.total_frames is not None and frames_per_second > 0:
+            eta_seconds = max(0.0, (self.total_frames - self.frames_done) / frames_per_second)
+        self.callback(RenderProgress(self.stage, self.frames_done, self.total_frames, frames_per_second, eta_seconds))
+
+def format_progress(progress):
+    """
+    Formats a progress update for display.
+
+    Args:
+        progress (RenderProgress): The progress update.
+
+    Returns:
+        str: A one-line summary such as 'Rendering: 1200/6572 frames · 85.3 fps · ETA 1:03'.
+    """
+    stage_label = 'Rendering' if progress.stage == RENDER_STAGE else 'Encoding'
+    total = f"/{progress.total_frames}" if progress.total_frames is not None else ''
+    text = f"{stage_label}: {progress.frames_done}{total} frames · {progress.frames_per_second:.1f} fps"
+    if progress.eta_seconds is not None:
+        minutes, seconds = divmod(int(progress.eta_seconds), 60)
+        text += f" · ETA {minutes}:{seconds:02d}"
+    return text
@@ -0,0 +1,175 @@
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+import config
+import pixel_cache
+import tiles
+import video_generator
+
+# Bumped whenever a change to the renderer makes earlier cached videos outdated
+RESULT_CACHE_VERSION = 4
+VIDEO_EXTENSION = '.mp4'
+PREVIEW_EXTENSION = '.png'
+
+def hash_image(image):
+    """
+    Computes the SHA-256 hash of an image's decoded pixels, so the same picture saved in another
+    format or with other metadata maps to the same cache entry.
+
+    Args:
+        image (str, PIL.Image.Image or numpy.ndarray): Path to the image file, an already opened image,
+            or an image array in the channel order of cv.imread.
+
+    Returns:
+        str: The hex digest of the image.
+    """
+    img = tiles.open_user_image(image)
+    digest = hashlib.sha256(f"{img.size}".encode())
+    digest.update(np.asarray(img).data)
+    return digest.hexdigest()
+
+def render_settings():
+    """
+    Collects the configured settings that change the frames or the encoding of a video, so a video
+    rendered with other settings is never returned from the cache.
+
+    Returns:
+        dict: The settings, as JSON-serializable values.
+    """
+    return {
+        'encoder': video_generator.video_encoder_arguments(),
+        'segments': config.ENCODE_SEGMENTS,
+        'checkpoint_segment_seconds': config.CHECKPOINT_SEGMENT_SECONDS,
+        'keyframe_interval_seconds': config.KEYFRAME_INTERVAL_SECONDS,
+        'pixel_format': config.STREAM_PIXEL_FORMAT,
+        'pixel_levels': config.PIXEL_LEVELS,
+        'render_mode': config.RENDER_MODE
+    }
+
+def result_key(image, pixel_data_path, output_resolution, fps, audio_path=None):
+    """
+    Builds the cache key of a finished video from its inputs and the render settings of render_settings.
+
+    Args:
+        image (str, PIL.Image.Image or numpy.ndarray): Path to the user's image, an already opened image,
+            or an image array in the channel order of cv.imread.
+        pixel_data_path (str): Path to the pixel data file.
+        output_resolution (tuple): Requested output resolution (width, height).
+        fps (float): Frames per second of the video.
+        audio_path (str, optional): Path to the audio file, or None for a silent video.
+
+    Returns:
+        str: The hex digest identifying the video.
+    """
+    settings = {
+        'version': RESULT_CACHE_VERSION,
+        'image': hash_image(image),
+        'pixel_data': pixel_cache.hash_file(pixel_data_path),
+        'output_resolution': list(output_resolution),
+        'fps': fps,
+        'audio': pixel_cache.hash_file(audio_path) if audio_path else None,
+        'settings': render_settings()
+    }
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()
+
+def entry_path(key, extension=VIDEO_EXTENSION, cache_dir=None):
+    """
+    Returns the path of a cache entry.
+
+    Args:
+        key (str): The cache key from result_key.
+        extension (str, optional): VIDEO_EXTENSION for the video or PREVIEW_EXTENSION for its preview image.
+        cache_dir (str, optional): Cache directory. Defaults to config.RESULT_CACHE_DIR.
+
+    Returns:
+        str: Path to the entry.
+    """
+    return os.path.join(cache_dir or config.RESULT_CACHE_DIR, key + extension)
+
+def lookup(key, output_video_path, preview_path=None, cache_dir=None):
+    """
+    Copies a cached video to the output path if the cache holds one for the key.
+
+    Args:
+        key (str): The cache key from result_key.
+        output_video_path (str): Path to save the output video file.
+        preview_path (str, optional): Where to copy the cached preview image of the video.
+        cache_dir (str, optional): Cache directory. Defaults to config.RESULT_CACHE_DIR.
+
+    Returns:
+        bool: True if the video was found in the cache.
+    """
+    video_path = entry_path(key, VIDEO_EXTENSION, cache_dir)
+    if not os.path.exists(video_path):
+        return False
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_video_path)), exist_ok=True)
+    shutil.copyfile(video_path, output_video_path)
+    # The modification time is the entry's last use, which eviction goes by
+    os.utime(video_path)
+
+    cached_preview_path = entry_path(key, PREVIEW_EXTENSION, cache_dir)
+    if preview_path and os.path.exists(cached_preview_path):
+        shutil.copyfile(cached_preview_path, preview_path)
+    return True
+
+def store(key, video_path, preview_path=None, cache_dir=None, max_bytes=None):
+    """
+    Adds a finished video to the cache and evicts the least recently used entries beyond the size limit.
+
+    Args:
+        key (str): The cache key from result_key.
+        video_path (str): Path to the finished video.
+        preview_path (str, optional): Path to the video's preview image, cached along with it.
+        cache_dir (str, optional): Cache directory. Defaults to config.RESULT_CACHE_DIR.
+        max_bytes (int, optional): Size limit of the cache. Defaults to config.RESULT_CACHE_MAX_BYTES.
+    """
+    cache_dir = cache_dir or config.RESULT_CACHE_DIR
+    max_bytes = config.RESULT_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    if os.path.getsize(video_path) > max_bytes:
+        return
+
+    os.makedirs(cache_dir, exist_ok=True)
+    entries = [(video_path, VIDEO_EXTENSION)]
+    if preview_path and os.path.exists(preview_path):
+        entries.append((preview_path, PREVIEW_EXTENSION))
+    # The preview is copied first, so a complete video entry always has its preview next to it
+    for source_path, extension in reversed(entries):
+        target_path = entry_path(key, extension, cache_dir)
+        temp_path = f"{target_path}.{os.getpid()}.tmp"
+        shutil.copyfile(source_path, temp_path)
+        os.replace(temp_path, target_path)
+
+    evict(max_bytes, cache_dir)
+
+def evict(max_bytes, cache_dir=None):
+    """
+    Deletes the least recently used videos until the cache fits in the size limit.
+
+    Args:
+        max_bytes (int): Size limit of the cache.
+        cache_dir (str, optional): Cache directory. Defaults to config.RESULT_CACHE_DIR.
+    """
+    cache_dir = cache_dir or config.RESULT_CACHE_DIR
+    entries = []
+    for name in os.listdir(cache_dir):
+        key, extension = os.path.splitext(name)
+        if extension != VIDEO_EXTENSION:
+            continue
+        stat = os.stat(os.path.join(cache_dir, name))
+        preview_file = entry_path(key, PREVIEW_EXTENSION, cache_dir)
+        preview_size = os.path.getsize(preview_file) if os.path.exists(preview_file) else 0
+        entries.append((stat.st_mtime, key, stat.st_size + preview_size))
+
+    total_bytes = sum(size for _, _, size in entries)
+    for _, key, size in sorted(entries):
+        if total_bytes <= max_bytes:
+            break
+        for extension in (VIDEO_EXTENSION, PREVIEW_EXTENSION):
+            try:
+                os.remove(entry_path(key, extension, cache_dir))
+            except FileNotFoundError:
+                pass
+        total_bytes -= size
@@ -0,0 +1,188 @@
+import collections
+import concurrent.futures
+import os
+import sys
+import time
+import config
+
+PROCESS_BACKEND = 'process'
+THREAD_BACKEND = 'thread'
+AUTO_BACKEND = 'auto'
+WORKER_BACKENDS = (AUTO_BACKEND, PROCESS_BACKEND, THREAD_BACKEND)
+
+WorkerPlan = collections.namedtuple('WorkerPlan', ['backend', 'workers', 'reason'])
+WorkerPlan.__doc__ = """
+The worker pool chosen for a render.
+
+Attributes:
+    backend (str): PROCESS_BACKEND or THREAD_BACKEND.
+    workers (int): Number of workers.
+    reason (str): What the choice was based on, for the log.
+"""
+
+def available_cores():
+    """
+    Returns the number of CPU cores this process may run on.
+
+    Returns:
+        int: The number of usable cores.
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return max(1, len(os.sched_getaffinity(0)))
+    return max(1, os.cpu_count() or 1)
+
+def available_memory():
+    """
+    Returns the physical memory that can be used without swapping.
+
+    Returns:
+        int: The available memory in bytes, or None if it cannot be determined.
+    """
+    if sys.platform == 'win32':
+        import ctypes
+
+        class MemoryStatus(ctypes.Structure):
+            _fields_ = [
+                ('dwLength', ctypes.c_ulong),
+                ('dwMemoryLoad', ctypes.c_ulong),
+                ('ullTotalPhys', ctypes.c_ulonglong),
+                ('ullAvailPhys', ctypes.c_ulonglong),
+                ('ullTotalPageFile', ctypes.c_ulonglong),
+                ('ullAvailPageFile', ctypes.c_ulonglong),
+                ('ullTotalVirtual', ctypes.c_ulonglong),
+                ('ullAvailVirtual', ctypes.c_ulonglong),
+                ('ullAvailExtendedVirtual', ctypes.c_ulonglong)
+            ]
+
+        status = MemoryStatus()
+        status.dwLength = ctypes.sizeof(MemoryStatus)
+        if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+            return status.ullAvailPhys
+        return None
+
+    # MemAvailable counts reclaimable page cache, which the free page count below leaves out
+    try:
+        with open('/proc/meminfo') as file:
+            for line in file:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+def time_tasks(run_task, tasks):
+    """
+    Runs tasks side by side, one thread each, and measures how long they take together.
+
+    Args:
+        run_task (callable): The task function of the render.
+        tasks (list): The tasks to run.
+
+    Returns:
+        float: The wall-clock time in seconds.
+    """
+    start_time = time.perf_counter()
+    if len(tasks) == 1:
+        run_task(tasks[0])
+    else:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(tasks)) as executor:
+            for future in [executor.submit(run_task, task) for task in tasks]:
+                future.result()
+    return time.perf_counter() - start_time
+
+def calibration_tasks(make_task, frame_count, task_count, frames_per_task):
+    """
+    Builds calibration tasks spread evenly over the video, since the first frames of Bad Apple are
+    plain black and much cheaper than the rest.
+
+    Args:
+        make_task (callable): Builds the task for a (start, stop) range of frames.
+        frame_count (int): Number of frames in the render.
+        task_count (int): Number of tasks.
+        frames_per_task (int): Number of frames per task.
+
+    Returns:
+        list: The tasks.
+    """
+    tasks = []
+    for index in range(task_count):
+        start = max(0, min(frame_count * (index + 1) // (task_count + 1), frame_count - frames_per_task))
+        tasks.append(make_task(start, start + frames_per_task))
+    return tasks
+
+def plan_workers(run_task, make_task, frame_count, worker_bytes, backend=None, workers=None):
+    """
+    Chooses the backend and size of the worker pool of a render.
+
+    A few frames are rendered in the calling thread to time a frame, and again on several threads
+    side by side to see how well rendering scales on threads. NumPy and OpenCV release the GIL while
+    they copy tiles and write images, so threads can scale well while avoiding the start-up cost of
+    spawned processes. The number of workers is then limited by the free cores, the free memory and
+    the amount of work, so a short render does not start workers that would sit idle, and the backend
+    with the lower estimated render time is chosen.
+
+    Args:
+        run_task (callable): The task function of the render, run with the result of make_task.
+        make_task (callable): Builds the task for a (start, stop) range of frames.
+        frame_count (int): Number of frames in the render.
+        worker_bytes (int): Memory one worker needs for its frames and caches.
+        backend (str, optional): One of WORKER_BACKENDS. Defaults to config.WORKER_BACKEND.
+        workers (int, optional): Number of workers instead of sizing the pool. Defaults to config.NUM_WORKERS.
+
+    Returns:
+        WorkerPlan: The chosen worker pool.
+    """
+    backend = backend or config.WORKER_BACKEND
+    workers = workers or config.NUM_WORKERS
+    if backend not in WORKER_BACKENDS:
+        raise Exception(f"Unknown worker backend '{backend}'. Choose one of {', '.join(WORKER_BACKENDS)}.")
+    if backend != AUTO_BACKEND and workers:
+        return WorkerPlan(backend, workers, "set by the user")
+
+    calibration_start = time.perf_counter()
+    cores = available_cores()
+    memory = available_memory()
+    frames_per_task = max(1, min(config.CALIBRATION_FRAMES, frame_count))
+
+    # Opens the pixel data and attaches the tiles, so the timed runs only measure rendering
+    run_task(make_task(0, 1))
+    serial_time = time_tasks(run_task, calibration_tasks(make_task, frame_count, 1, frames_per_task))
+    seconds_per_frame = serial_time / frames_per_task
+    render_seconds = seconds_per_frame * frame_count
+
+    def worker_limit(worker_backend):
+        if workers:
+            return workers
+        limit = min(config.NUM_PROCESSES, cores, max(1, int(render_seconds / config.MIN_SECONDS_PER_WORKER)))
+        if memory is not None:
+            per_worker = worker_bytes + (config.WORKER_PROCESS_BYTES if worker_backend == PROCESS_BACKEND else 0)
+            limit = min(limit, int(memory * config.WORKER_MEMORY_SHARE // per_worker))
+        return max(1, limit)
+
+    thread_workers = worker_limit(THREAD_BACKEND)
+    process_workers = worker_limit(PROCESS_BACKEND)
+
+    thread_count = min(thread_workers, config.CALIBRATION_THREADS)
+    thread_efficiency = 1.0
+    scaling_text = "one worker"
+    if thread_count > 1:
+        parallel_time = time_tasks(run_task, calibration_tasks(make_task, frame_count, thread_count, frames_per_task))
+        speedup = thread_count * serial_time / parallel_time
+        thread_efficiency = min(1.0, max(0.0, (speedup - 1) / (thread_count - 1)))
+        scaling_text = f"{thread_count} threads {thread_efficiency:.0%} efficient"
+
+    thread_seconds = render_seconds / (1 + (thread_workers - 1) * thread_efficiency)
+    process_seconds = config.PROCESS_STARTUP_SECONDS + render_seconds / process_workers
+    if backend == AUTO_BACKEND:
+        backend = THREAD_BACKEND if thread_seconds <= process_seconds else PROCESS_BACKEND
+
+    memory_text = f"{memory / 1024 ** 2:.0f} MB free" if memory is not None else "free memory unknown"
+    reason = (
+        f"{seconds_per_frame * 1000:.1f} ms per frame, {scaling_text}, "
+        f"{cores} cores, {memory_text}; estimated {thread_seconds:.1f}s on threads and "
+        f"{process_seconds:.1f}s on processes (calibrated in {time.perf_counter() - calibration_start:.1f}s)"
+    )
+    return WorkerPlan(backend, thread_workers if backend == THREAD_BACKEND else process_workers, reason)
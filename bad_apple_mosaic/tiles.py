@@ -0,0 +1,161 @@
+import cv2 as cv
+import numpy as np
+from PIL import Image
+
+# Contrast and brightness factors of the darkened tile used for the black pixels of the video
+DARKEN_CONTRAST = 2.0
+DARKEN_BRIGHTNESS = 0.1
+
+def cv_array_to_bgr(array):
+    """
+    Converts an image array as returned by cv.imread, in grayscale, BGR or BGRA, to 3-channel BGR.
+
+    Args:
+        array (numpy.ndarray): The image array.
+
+    Returns:
+        numpy.ndarray: The image as a uint8 BGR array.
+    """
+    array = np.asarray(array)
+    if array.dtype != np.uint8:
+        raise Exception(f"Image arrays must be uint8, not {array.dtype}.")
+    if array.ndim == 2:
+        return cv.cvtColor(array, cv.COLOR_GRAY2BGR)
+    if array.ndim == 3 and array.shape[2] == 4:
+        return cv.cvtColor(array, cv.COLOR_BGRA2BGR)
+    if array.ndim == 3 and array.shape[2] == 3:
+        return array
+    raise Exception(f"Unsupported image array of shape {array.shape}.")
+
+def open_user_image(image):
+    """
+    Opens the user's image as an RGB PIL image.
+
+    Args:
+        image (str, PIL.Image.Image or numpy.ndarray): Path to the image file, an already opened image,
+            or an image array in the channel order of cv.imread.
+
+    Returns:
+        PIL.Image.Image: The image in RGB mode.
+    """
+    if isinstance(image, np.ndarray):
+        return Image.fromarray(cv.cvtColor(cv_array_to_bgr(image), cv.COLOR_BGR2RGB))
+    if isinstance(image, Image.Image):
+        return image.convert("RGB")
+    with Image.open(image) as img:
+        return img.convert("RGB")
+
+def resize_to_tile(image, tile_size):
+    """
+    Shrinks the user's image to a tile before doing anything else with it. JPEG files are decoded
+    at a reduced scale straight away, and all other images are area-averaged down to the tile, so a
+    large upload never goes through color conversion or enhancement at its full resolution.
+
+    Args:
+        image (str, PIL.Image.Image or numpy.ndarray): Path to the image file, an already opened image,
+            or an image array in the channel order of cv.imread.
+        tile_size (tuple): Size (width, height) of each tile.
+
+    Returns:
+        numpy.ndarray: The tile as a BGR array.
+    """
+    if isinstance(image, np.ndarray):
+        return cv.resize(cv_array_to_bgr(image), tile_size, interpolation=cv.INTER_AREA)
+
+    opened = not isinstance(image, Image.Image)
+    img = Image.open(image) if opened else image
+    try:
+        if opened:
+            # Only JPEG supports this: the decoder skips detail finer than the requested size. Twice the tile
+            # size is decoded, so the area resize below still averages the detail the scaled decode leaves out.
+            # An image passed in by the caller is left as it is, since draft changes how it is loaded
+            img.draft("RGB", (tile_size[0] * 2, tile_size[1] * 2))
+        rgb_img = img if img.mode in ("RGB", "L") else img.convert("RGB")
+        tile = cv.resize(np.asarray(rgb_img), tile_size, interpolation=cv.INTER_AREA)
+    finally:
+        if opened:
+            img.close()
+    return cv.cvtColor(tile, cv.COLOR_GRAY2BGR if tile.ndim == 2 else cv.COLOR_RGB2BGR)
+
+def darken_tile(tile):
+    """
+    Creates the darkened grayscale tile used for the black pixels of the video from the user tile.
+    The tile is converted to grayscale, its contrast is raised by DARKEN_CONTRAST around its mean
+    gray value and its brightness is scaled by DARKEN_BRIGHTNESS.
+
+    Args:
+        tile (numpy.ndarray): The user tile as a BGR array.
+
+    Returns:
+        numpy.ndarray: The darkened grayscale tile as a 3-channel BGR array.
+    """
+    gray = cv.cvtColor(tile, cv.COLOR_BGR2GRAY).astype(np.float32)
+    # Contrast is scaled around the rounded mean gray value, like ImageEnhance.Contrast
+    mean = np.floor(gray.mean() + 0.5)
+    contrasted = np.clip(mean + DARKEN_CONTRAST * (gray - mean), 0, 255).astype(np.uint8)
+    darkened = np.clip(contrasted * np.float32(DARKEN_BRIGHTNESS), 0, 255).astype(np.uint8)
+    return cv.cvtColor(darkened, cv.COLOR_GRAY2BGR)
+
+def build_palette(user_img_array, gray_user_img_array, levels=2):
+    """
+    Builds the tile shades for every brightness level of the pixel data, blending evenly from the
+    darkened tile at level 0 to the user tile at the top level. It is built once per render, so
+    composing a frame is a single gather of the palette by the frame's cell values.
+
+    Args:
+        user_img_array (numpy.ndarray): User image array.
+        gray_user_img_array (numpy.ndarray): Grayscale user image array.
+        levels (int, optional): Number of brightness levels per cell.
+
+    Returns:
+        numpy.ndarray: The shades stacked along a new first axis, [gray, user] for two levels.
+    """
+    if levels == 2:
+        return np.stack((gray_user_img_array, user_img_array))
+    weights = np.linspace(0.0, 1.0, levels, dtype=np.float32).reshape(levels, 1, 1, 1)
+    gray = gray_user_img_array.astype(np.float32)
+    shades = gray + weights * (user_img_array.astype(np.float32) - gray)
+    return np.rint(shades).astype(np.uint8)
+
+def build_yuv_palette(palette):
+    """
+    Converts a palette of BGR tiles to the planes of yuv420p frames, with the BT.601 limited range
+    conversion ffmpeg applies to BGR input. Tiles of even size cover whole 2x2 chroma blocks, so a
+    frame composed plane by plane equals the conversion of the composed BGR frame.
+
+    Args:
+        palette (numpy.ndarray): The BGR tile shades, from build_palette.
+
+    Returns:
+        list: The Y, U and V palettes, one single-channel tile plane per shade. The chroma planes
+            have half the tile width and height.
+    """
+    count, tile_height, tile_width = palette.shape[:3]
+    if tile_width % 2 or tile_height % 2:
+        raise Exception(f"Tiles of {tile_width}x{tile_height} cannot be split into YUV 4:2:0 planes, the tile size must be even.")
+
+    planes = np.stack([cv.cvtColor(tile, cv.COLOR_BGR2YUV_I420) for tile in palette]).reshape(count, -1)
+    luma_size = tile_width * tile_height
+    chroma_size = luma_size // 4
+    return [
+        np.ascontiguousarray(planes[:, :luma_size]).reshape(count, tile_height, tile_width, 1),
+        np.ascontiguousarray(planes[:, luma_size:luma_size + chroma_size]).reshape(count, tile_height // 2, tile_width // 2, 1),
+        np.ascontiguousarray(planes[:, luma_size + chroma_size:]).reshape(count, tile_height // 2, tile_width // 2, 1)
+    ]
+
+def load_user_tiles(image, tile_size):
+    """
+    Builds the user tile and the darkened tile for a render in memory, without the upload.png and
+    gray_upload.png round-trip through the upload directory. The image is shrunk to the tile first
+    and the darkened tile is made from the user tile, so the cost does not grow with the upload's size.
+
+    Args:
+        image (str, PIL.Image.Image or numpy.ndarray): Path to the user's image, an already opened image,
+            or an image array in the channel order of cv.imread.
+        tile_size (tuple): Size (width, height) of each tile.
+
+    Returns:
+        tuple: The user image array and the grayscale user image array, both at the tile size.
+    """
+    user_img_array = resize_to_tile(image, tile_size)
+    return user_img_array, darken_tile(user_img_array)
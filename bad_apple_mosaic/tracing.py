@@ -0,0 +1,413 @@
+import collections
+import contextlib
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+import config
+
+# The trace being recorded in this process: the RenderTrace of the parent, or the WorkerTrace of a spawned worker
+_recorder = None
+_recorder_lock = threading.Lock()
+
+def timestamp():
+    """
+    Returns the current time in microseconds, the unit of Chrome trace events. Wall-clock time is used
+    so the events of spawned workers line up with those of the parent.
+
+    Returns:
+        int: The time in microseconds.
+    """
+    return time.time_ns() // 1000
+
+def memory_usage():
+    """
+    Returns the resident memory of the current process.
+
+    Returns:
+        tuple: The resident set size and its peak so far in bytes. Either is None if it cannot be measured here.
+    """
+    if sys.platform == 'win32':
+        import ctypes
+
+        class MemoryCounters(ctypes.Structure):
+            _fields_ = [
+                ('cb', ctypes.c_ulong),
+                ('PageFaultCount', ctypes.c_ulong),
+                ('PeakWorkingSetSize', ctypes.c_size_t),
+                ('WorkingSetSize', ctypes.c_size_t),
+                ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                ('PagefileUsage', ctypes.c_size_t),
+                ('PeakPagefileUsage', ctypes.c_size_t)
+            ]
+
+        counters = MemoryCounters()
+        counters.cb = ctypes.sizeof(MemoryCounters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return counters.WorkingSetSize, counters.PeakWorkingSetSize
+        return None, None
+
+    rss = peak = None
+    try:
+        with open('/proc/self/status') as file:
+            for line in file:
+                if line.startswith('VmRSS:'):
+                    rss = int(line.split()[1]) * 1024
+                elif line.startswith('VmHWM:'):
+                    peak = int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    if peak is None:
+        try:
+            import resource
+            # ru_maxrss is in KiB on Linux and in bytes on macOS
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+        except ImportError:
+            pass
+    return rss, peak
+
+def enable_profile(profile):
+    """
+    Starts a cProfile profiler on the current thread. Only one profiler can run at a time on some
+    Python versions, in which case the thread is left unprofiled.
+
+    Args:
+        profile (cProfile.Profile): The profiler.
+
+    Returns:
+        bool: Whether the profiler was started.
+    """
+    try:
+        profile.enable()
+        return True
+    except ValueError:
+        return False
+
+class TraceRecorder:
+    """
+    Collects Chrome trace events from the threads of one process.
+    """
+    def __init__(self, path, profile=False):
+        """
+        Args:
+            path (str): Path of the trace file of the render.
+            profile (bool, optional): Whether cProfile profiles are recorded along with the trace.
+        """
+        self.path = path
+        self.profile = profile
+        self.pid = os.getpid()
+        self.events = []
+        self.lock = threading.Lock()
+        self.named_threads = set()
+
+    def add(self, event):
+        """
+        Records an event of the current thread, naming the thread the first time it records one.
+
+        Args:
+            event (dict): The trace event, without its process and thread ids.
+        """
+        thread_id = threading.get_ident()
+        event['pid'] = self.pid
+        event['tid'] = thread_id
+        with self.lock:
+            if thread_id not in self.named_threads:
+                self.named_threads.add(thread_id)
+                self.events.append({
+                    'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': thread_id,
+                    'args': {'name': threading.current_thread().name}
+                })
+            self.events.append(event)
+
+    def sample_memory(self):
+        """
+        Records the resident memory of the process and its peak so far as a counter event.
+        """
+        rss, peak = memory_usage()
+        sample = {name: round(value / 1024 ** 2, 1) for name, value in (('rss_mb', rss), ('peak_rss_mb', peak)) if value is not None}
+        if sample:
+            self.add({'name': 'memory', 'ph': 'C', 'ts': timestamp(), 'args': sample})
+
+    def profile_path(self, label):
+        """
+        Returns where a cProfile profile of this render is saved.
+
+        Args:
+            label (str): What was profiled, like 'parent' or 'worker-1234'.
+
+        Returns:
+            str: The path of the .prof file, next to the trace.
+        """
+        return f"{os.path.splitext(self.path)[0]}.{label}.prof"
+
+class RenderTrace(TraceRecorder):
+    """
+    Records the trace of a render in the parent process and writes it as a Chrome trace file, which
+    chrome://tracing and ui.perfetto.dev open. Memory is sampled in a background thread while the
+    trace is open, and the events that spawned workers save next to the trace are merged into it.
+    """
+    def __init__(self, name, trace_dir=None, profile=None, memory_interval=None):
+        """
+        Args:
+            name (str): Name of the render, used for the file name of the trace.
+            trace_dir (str, optional): Directory of the trace file. Defaults to config.TRACE_DIR.
+            profile (bool, optional): Whether cProfile profiles are recorded. Defaults to config.TRACE_PROFILE.
+            memory_interval (float, optional): Seconds between memory samples. Defaults to config.TRACE_MEMORY_INTERVAL.
+        """
+        trace_dir = trace_dir or config.TRACE_DIR
+        file_name = f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.json"
+        super().__init__(os.path.join(trace_dir, file_name), config.TRACE_PROFILE if profile is None else profile)
+        self.name = name
+        self.memory_interval = memory_interval or config.TRACE_MEMORY_INTERVAL
+        self.stopped = threading.Event()
+        self.sampler = threading.Thread(target=self._sample_memory, name='trace memory sampler', daemon=True)
+        self.parent_profile = None
+        # Profiles of thread workers, which run in this process, by thread id
+        self.thread_profiles = {}
+
+    @property
+    def descriptor(self):
+        """
+        tuple: The picklable (path, profile) settings that workers record their part of the trace with.
+        """
+        return (self.path, self.profile)
+
+    def __enter__(self):
+        global _recorder
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.events.append({'name': 'process_name', 'ph': 'M', 'pid': self.pid, 'args': {'name': f"{self.name} (parent)"}})
+        with _recorder_lock:
+            _recorder = self
+        self.sampler.start()
+        if self.profile:
+            self.parent_profile = cProfile.Profile()
+            if not enable_profile(self.parent_profile):
+                self.parent_profile = None
+        self.start_time = timestamp()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        global _recorder
+        self.add({
+            'name': self.name, 'cat': 'render', 'ph': 'X', 'ts': self.start_time, 'dur': timestamp() - self.start_time,
+            'args': {'failed': exc_type is not None}
+        })
+        if self.parent_profile is not None:
+            self.parent_profile.disable()
+            self.parent_profile.dump_stats(self.profile_path('parent'))
+        for thread_id, profile in self.thread_profiles.items():
+            profile.dump_stats(self.profile_path(f"thread-{thread_id}"))
+        self.stopped.set()
+        self.sampler.join()
+        with _recorder_lock:
+            _recorder = None
+        self.save()
+
+    def _sample_memory(self):
+        while True:
+            self.sample_memory()
+            if self.stopped.wait(self.memory_interval):
+                return
+
+    def thread_profile(self):
+        """
+        Returns the profiler of the current thread worker, creating it the first time.
+
+        Returns:
+            cProfile.Profile: The profiler.
+        """
+        with self.lock:
+            return self.thread_profiles.setdefault(threading.get_ident(), cProfile.Profile())
+
+    def save(self):
+        """
+        Merges the events saved by spawned workers into the trace, writes the trace file and prints
+        where it is, with the stages that took the longest.
+        """
+        events = list(self.events)
+        fragment_prefix = os.path.basename(self.path) + '.'
+        trace_dir = os.path.dirname(self.path)
+        for file_name in sorted(os.listdir(trace_dir)):
+            if file_name.startswith(fragment_prefix) and file_name.endswith('.part'):
+                fragment_path = os.path.join(trace_dir, file_name)
+                with open(fragment_path) as file:
+                    events.extend(json.loads(line) for line in file if line.strip())
+                os.remove(fragment_path)
+
+        # Total time, number and peak memory per stage and process, for reading the trace without a viewer
+        stages = collections.defaultdict(lambda: {'count': 0, 'total_ms': 0.0})
+        peak_rss_mb = collections.defaultdict(float)
+        for event in events:
+            if event['ph'] == 'X':
+                stages[event['name']]['count'] += 1
+                stages[event['name']]['total_ms'] += event['dur'] / 1000
+            elif event['ph'] == 'C' and event['name'] == 'memory':
+                pid = str(event['pid'])
+                peak_rss_mb[pid] = max(peak_rss_mb[pid], *event['args'].values())
+        summary = {
+            'render': self.name,
+            'stages': {name: {'count': stage['count'], 'total_ms': round(stage['total_ms'], 3)} for name, stage in stages.items()},
+            'peak_rss_mb': dict(peak_rss_mb)
+        }
+        with open(self.path, 'w') as file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms', 'otherData': summary}, file)
+
+        slowest = sorted(
+            (stage for stage in stages.items() if stage[0] != self.name), key=lambda stage: stage[1]['total_ms'], reverse=True
+        )[:5]
+        print(f"Wrote a trace of the render to '{self.path}'.")
+        if slowest:
+            print("Slowest stages, summed over threads: " + ", ".join(
+                f"{name} {stage['total_ms'] / 1000:.2f}s over {stage['count']}" for name, stage in slowest
+            ) + ".")
+
+class WorkerTrace(TraceRecorder):
+    """
+    Records the part of a trace that happens in a spawned worker process. Its events are appended to
+    a file next to the trace after every task, for the parent to merge once the render is done.
+    """
+    def __init__(self, path, profile=False):
+        """
+        Args:
+            path (str): Path of the trace file of the render.
+            profile (bool, optional): Whether the tasks of the worker are profiled with cProfile.
+        """
+        super().__init__(path, profile)
+        self.fragment_path = f"{path}.{self.pid}.part"
+        self.events.append({'name': 'process_name', 'ph': 'M', 'pid': self.pid, 'args': {'name': 'render worker'}})
+        self.worker_profile = cProfile.Profile() if profile else None
+
+    def flush(self):
+        """
+        Appends the events recorded since the last flush to the fragment file of the worker, and saves
+        its profile so far.
+        """
+        with self.lock:
+            events, self.events = self.events, []
+        with open(self.fragment_path, 'a') as file:
+            file.writelines(json.dumps(event) + '\n' for event in events)
+        if self.worker_profile is not None:
+            self.worker_profile.dump_stats(self.profile_path(f"worker-{self.pid}"))
+
+@contextlib.contextmanager
+def trace_render(name):
+    """
+    Traces a render when config.TRACE_DIR is set. A render started while another one is traced, like
+    the encode of a render that already traces its preparation, becomes part of that trace.
+
+    Args:
+        name (str): Name of the render.
+
+    Yields:
+        RenderTrace: The trace of the render, or None when tracing is off.
+    """
+    if not config.TRACE_DIR or _recorder is not None:
+        yield _recorder
+        return
+    with RenderTrace(name) as trace:
+        yield trace
+
+def job_trace():
+    """
+    Returns the settings that worker tasks record their part of the current trace with.
+
+    Returns:
+        tuple: The descriptor of the RenderTrace of this process, or None when no render is traced.
+    """
+    recorder = _recorder
+    if isinstance(recorder, RenderTrace):
+        return recorder.descriptor
+    return None
+
+@contextlib.contextmanager
+def span(name, **args):
+    """
+    Records the time a block takes as a complete event of the current trace, or does nothing when
+    this process records no trace.
+
+    Args:
+        name (str): Name of the stage.
+        **args: Details shown with the event, like the frames of a task.
+    """
+    recorder = _recorder
+    if recorder is None:
+        yield
+        return
+    start = timestamp()
+    try:
+        yield
+    finally:
+        recorder.add({'name': name, 'cat': 'stage', 'ph': 'X', 'ts': start, 'dur': timestamp() - start, 'args': args})
+
+def timed(iterable, name):
+    """
+    Records every step of an iterable as a span, for work that happens while a generator is advanced.
+
+    Args:
+        iterable (iterable): The iterable, like a generator of composed frames.
+        name (str): Name of the stage of every step.
+
+    Yields:
+        The items of the iterable.
+    """
+    recorder = _recorder
+    if recorder is None:
+        yield from iterable
+        return
+    iterator = iter(iterable)
+    while True:
+        start = timestamp()
+        item = next(iterator, StopIteration)
+        if item is StopIteration:
+            return
+        recorder.add({'name': name, 'cat': 'stage', 'ph': 'X', 'ts': start, 'dur': timestamp() - start, 'args': {}})
+        yield item
+
+@contextlib.contextmanager
+def worker_task(trace, name, **args):
+    """
+    Records a task of a worker as part of the trace of its render. Thread workers record straight
+    into the trace of the parent; a spawned worker keeps a WorkerTrace for the render and saves its
+    events when the task ends. Both sample their memory around every task.
+
+    Args:
+        trace (tuple): The descriptor of the trace from job_trace, or None when the render is not traced.
+        name (str): Name of the task.
+        **args: Details shown with the task, like its frames.
+    """
+    global _recorder
+    if trace is None:
+        if isinstance(_recorder, WorkerTrace):
+            # The render this worker traced before has ended
+            _recorder = None
+        yield
+        return
+
+    path, profile = trace
+    with _recorder_lock:
+        if _recorder is None or _recorder.path != path:
+            # A worker of a long-lived pool starts the trace of every render it takes part in anew
+            _recorder = WorkerTrace(path, profile)
+        recorder = _recorder
+
+    task_profile = None
+    if profile:
+        task_profile = recorder.thread_profile() if isinstance(recorder, RenderTrace) else recorder.worker_profile
+        if not enable_profile(task_profile):
+            task_profile = None
+    recorder.sample_memory()
+    try:
+        with span(name, **args):
+            yield
+    finally:
+        if task_profile is not None:
+            task_profile.disable()
+        recorder.sample_memory()
+        if isinstance(recorder, WorkerTrace):
+            recorder.flush()
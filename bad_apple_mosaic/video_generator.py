@@ -1,17 +1,49 @@
 import cv2 as cv
-import ffmpeg
 import numpy as np
 import os
 import sys
 import shutil
+import time
 import pickle
+import contextlib
+import fractions
+import collections
+import threading
 import concurrent.futures
 import multiprocessing as mp
+from multiprocessing import shared_memory
 import config
+import checkpoint
+import pixel_cache
+import scheduler
+import tiles
+import tracing
+from progress import ProgressTracker, RENDER_STAGE, ENCODE_STAGE
+from pixel_data import PixelData, load_pixel_data, is_binary_pixel_data
 import subprocess
 
 executor_reference = None
 
+# Pixel formats of streamed frames: composed as BGR images, or as the Y, U and V planes ffmpeg encodes
+BGR_PIXEL_FORMAT = 'bgr24'
+YUV_PIXEL_FORMAT = 'yuv420p'
+STREAM_PIXEL_FORMATS = (YUV_PIXEL_FORMAT, BGR_PIXEL_FORMAT)
+
+# Soundtracks encoded to AAC once at their full length are cached in config.PIXEL_CACHE_DIR.
+# The version is bumped whenever the audio encoding changes
+AUDIO_CACHE_EXTENSION = '.m4a'
+AUDIO_CACHE_VERSION = 2
+
+# Shared memory attachments and opened pixel data of the current worker process, shared by its threads
+_worker_cache = {}
+_worker_cache_lock = threading.Lock()
+# Frame rings of ended renders whose slots were still referenced, closed once they are released
+_stale_rings = []
+# Render job of every frame ring the current worker has attached to, by the name of the ring
+_worker_rings = {}
+# Row strip cache of the current worker, keyed by the job it belongs to. Thread workers each keep their own
+_worker_state = threading.local()
+
 def load_image_as_cv_array(path, size):
     """
     Loads an image from the specified path and resizes it to the given size.
@@ -25,42 +57,52 @@ def load_image_as_cv_array(path, size):
     """
     return cv.resize(cv.imread(path), size)
 
-def generate_frame(args):
+def frame_bits_to_array(bits):
     """
-    Generates a single frame by placing user images according to the pixel data.
+    Converts the pixel data of a single frame into a flat NumPy array of cell values.
 
     Args:
-        args (tuple): A tuple containing:
-            - frame_info (tuple): A key-value pair where key is frame number and value is bitarray of pixel data.
-            - tile_size (tuple): Size (width, height) of each tile.
-            - frame_dimensions (tuple): Dimensions (width, height) of the frame.
-            - user_img_array (numpy.ndarray): User image array.
-            - gray_user_img_array (numpy.ndarray): Grayscale user image array.
+        bits (bitarray or numpy.ndarray): Pixel data of the frame, one value per tile.
+
+    Returns:
+        numpy.ndarray: A uint8 array holding one value per tile, 0/1 for black and white pixel data.
     """
-    frame_info, tile_size, frame_dimensions, user_img_array, gray_user_img_array = args
-    key, value = frame_info
+    if isinstance(bits, np.ndarray):
+        return bits.astype(np.uint8, copy=False)
+    return np.unpackbits(np.frombuffer(bits.tobytes(), dtype=np.uint8), count=len(bits))
 
-    output_dir = config.PROCESSED_FRAMES_DIR
+def compose_frame_loop(bits, tile_size, frame_dimensions, user_img_array, gray_user_img_array, palette=None):
+    """
+    Reference compositing engine that places the tiles one by one in a Python loop.
 
-    frame_number = f"frame_{int(key):05d}.png"
-    frame_array = np.zeros((frame_dimensions[1], frame_dimensions[0], 3), dtype=np.uint8)
+    Args:
+        bits (bitarray or numpy.ndarray): Pixel data of the frame, one value per tile.
+        tile_size (tuple): Size (width, height) of each tile.
+        frame_dimensions (tuple): Dimensions (width, height) of the frame.
+        user_img_array (numpy.ndarray): User image array.
+        gray_user_img_array (numpy.ndarray): Grayscale user image array.
+        palette (numpy.ndarray, optional): Tile shade of every brightness level, from tiles.build_palette.
+            Defaults to the gray and the user tile.
+
+    Returns:
+        numpy.ndarray: The composed BGR frame.
+    """
+    if palette is None:
+        palette = (gray_user_img_array, user_img_array)
+    frame_array = np.zeros((frame_dimensions[1], frame_dimensions[0], palette[0].shape[2]), dtype=np.uint8)
 
     tile_width, tile_height = tile_size
     num_columns = frame_dimensions[0] // tile_width
 
     posx, posy = 0, 0
     idx = 0
-    num_pixels = len(value)
+    num_pixels = len(bits)
 
     for row in range(frame_dimensions[1] // tile_height):
         for col in range(num_columns):
             if idx >= num_pixels:
                 break
-            pixel = value[idx]
-            if pixel == 1:
-                frame_array[posy:posy + tile_height, posx:posx + tile_width] = user_img_array
-            else:
-                frame_array[posy:posy + tile_height, posx:posx + tile_width] = gray_user_img_array
+            frame_array[posy:posy + tile_height, posx:posx + tile_width] = palette[bits[idx]]
             posx += tile_width
             idx += 1
         posx = 0
@@ -68,69 +110,1377 @@ def generate_frame(args):
         if idx >= num_pixels:
             break
 
-    cv.imwrite(os.path.join(output_dir, frame_number), frame_array, [cv.IMWRITE_PNG_COMPRESSION, 1])
+    return frame_array
 
-def generate_frames(pixel_data_path, output_resolution):
+def compose_frame_vectorized(bits, tile_size, frame_dimensions, user_img_array, gray_user_img_array, palette=None):
     """
-    Generates all frames for the video by processing pixel data and user images.
+    Compositing engine that builds the whole frame with a single NumPy gather.
+
+    The frame's cell values are reshaped into the tile grid and used to index the palette of
+    tile shades followed by a black tile, which is then folded back into an image. Tiles
+    without pixel data stay black, exactly as in the reference loop.
 
     Args:
-        pixel_data_path (str): Path to the pixel data pickle file.
-        output_resolution (tuple): Desired output resolution (width, height) for the frames.
+        bits (bitarray or numpy.ndarray): Pixel data of the frame, one value per tile.
+        tile_size (tuple): Size (width, height) of each tile.
+        frame_dimensions (tuple): Dimensions (width, height) of the frame.
+        user_img_array (numpy.ndarray): User image array.
+        gray_user_img_array (numpy.ndarray): Grayscale user image array.
+        palette (numpy.ndarray, optional): Tile shade of every brightness level, from tiles.build_palette.
+            Defaults to the gray and the user tile.
+
+    Returns:
+        numpy.ndarray: The composed BGR frame.
     """
-    global executor_reference
+    if palette is None:
+        palette = np.stack((gray_user_img_array, user_img_array))
+    tile_width, tile_height = tile_size
+    num_columns = frame_dimensions[0] // tile_width
+    num_rows = frame_dimensions[1] // tile_height
+    num_tiles = num_columns * num_rows
+
+    tile_indices = frame_bits_to_array(bits)[:num_tiles]
+    if len(tile_indices) < num_tiles:
+        black_index = len(palette)
+        tile_indices = np.concatenate((tile_indices, np.full(num_tiles - len(tile_indices), black_index, dtype=np.uint8)))
+        palette = np.concatenate((palette, np.zeros_like(palette[:1])))
+
+    channels = palette.shape[3]
+    grid = palette[tile_indices.reshape(num_rows, num_columns)]
+    composed = grid.transpose(0, 2, 1, 3, 4).reshape(num_rows * tile_height, num_columns * tile_width, channels)
+
+    if composed.shape[:2] == (frame_dimensions[1], frame_dimensions[0]):
+        return composed
+    frame_array = np.zeros((frame_dimensions[1], frame_dimensions[0], channels), dtype=np.uint8)
+    frame_array[:composed.shape[0], :composed.shape[1]] = composed
+    return frame_array
+
+COMPOSITING_ENGINES = {
+    'loop': compose_frame_loop,
+    'vectorized': compose_frame_vectorized
+}
+
+def compose_frame(bits, tile_size, frame_dimensions, user_img_array, gray_user_img_array, engine=None, palette=None):
+    """
+    Composes a single frame with the selected compositing engine.
+
+    Args:
+        bits (bitarray or numpy.ndarray): Pixel data of the frame, one value per tile.
+        tile_size (tuple): Size (width, height) of each tile.
+        frame_dimensions (tuple): Dimensions (width, height) of the frame.
+        user_img_array (numpy.ndarray): User image array.
+        gray_user_img_array (numpy.ndarray): Grayscale user image array.
+        engine (str, optional): Name of the engine in COMPOSITING_ENGINES. Defaults to config.COMPOSITING_ENGINE.
+        palette (numpy.ndarray, optional): Tile shade of every brightness level, from tiles.build_palette.
+            Defaults to the gray and the user tile.
+
+    Returns:
+        numpy.ndarray: The composed BGR frame.
+    """
+    engine = engine or config.COMPOSITING_ENGINE
+    if engine not in COMPOSITING_ENGINES:
+        raise Exception(f"Unknown compositing engine '{engine}'. Available engines: {', '.join(COMPOSITING_ENGINES)}.")
+    return COMPOSITING_ENGINES[engine](
+        bits, tile_size, frame_dimensions, user_img_array, gray_user_img_array, palette=palette
+    )
+
+class RowStripCache:
+    """
+    Bounded LRU cache of composed pixel strips, one strip per row of tiles.
+
+    Rows of the tile grid repeat constantly in Bad Apple, both within a frame and across frames
+    (all black, all white and the same silhouette edges), so a row's cell values are used as the key
+    and its fully composed strip at the current tile size as the value. Frames are then assembled
+    by copying cached strips instead of gathering every tile again.
+    """
+    def __init__(self, tile_size, frame_dimensions, user_img_array, gray_user_img_array, max_bytes=None, palette=None):
+        """
+        Args:
+            tile_size (tuple): Size (width, height) of each tile.
+            frame_dimensions (tuple): Dimensions (width, height) of the frame.
+            user_img_array (numpy.ndarray): User image array.
+            gray_user_img_array (numpy.ndarray): Grayscale user image array.
+            max_bytes (int, optional): Memory limit of the cached strips. Defaults to config.ROW_CACHE_MAX_BYTES.
+            palette (numpy.ndarray, optional): Tile shade of every brightness level, from tiles.build_palette.
+                Defaults to the gray and the user tile.
+        """
+        self.tile_size = tile_size
+        self.frame_dimensions = frame_dimensions
+        self.user_img_array = user_img_array
+        self.gray_user_img_array = gray_user_img_array
+        self.max_bytes = config.ROW_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.num_columns = frame_dimensions[0] // tile_size[0]
+        self.num_rows = frame_dimensions[1] // tile_size[1]
+        self.num_tiles = self.num_columns * self.num_rows
+        self.tiles = palette if palette is not None else np.stack((gray_user_img_array, user_img_array))
+        self.strips = collections.OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def strip(self, row_indices):
+        """
+        Returns the composed strip of one row of tiles, composing and caching it on a miss.
+
+        Args:
+            row_indices (numpy.ndarray): The row's cell values, one per tile.
+
+        Returns:
+            numpy.ndarray: The strip of shape (tile_height, num_columns * tile_width, channels). It is shared
+                with the cache and must not be modified.
+        """
+        # Black and white rows are packed to a bit per tile, rows with more levels keep a byte per tile
+        key = np.packbits(row_indices).tobytes() if len(self.tiles) == 2 else row_indices.tobytes()
+        strip = self.strips.get(key)
+        if strip is not None:
+            self.strips.move_to_end(key)
+            self.hits += 1
+            return strip
+
+        self.misses += 1
+        tile_width, tile_height = self.tile_size
+        strip = self.tiles[row_indices].transpose(1, 0, 2, 3).reshape(tile_height, len(row_indices) * tile_width, -1)
+        if strip.nbytes <= self.max_bytes:
+            while self.nbytes + strip.nbytes > self.max_bytes:
+                _, evicted = self.strips.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+            self.strips[key] = strip
+            self.nbytes += strip.nbytes
+        return strip
+
+    def compose(self, bits, num_rows=None):
+        """
+        Composes a frame, or a horizontal strip of one, from cached row strips.
+
+        Args:
+            bits (bitarray or numpy.ndarray): Pixel data of the frame or strip, one bit per tile.
+            num_rows (int, optional): Number of tile rows of a strip. Defaults to the whole frame.
+
+        Returns:
+            numpy.ndarray: The composed BGR frame or strip.
+        """
+        num_rows = self.num_rows if num_rows is None else num_rows
+        num_tiles = num_rows * self.num_columns
+        tile_width, tile_height = self.tile_size
+        frame_width, frame_height = self.frame_dimensions
+        if num_rows != self.num_rows:
+            frame_height = num_rows * tile_height
+
+        tile_indices = frame_bits_to_array(bits)[:num_tiles]
+        if len(tile_indices) < num_tiles:
+            # Rows without pixel data are black, which the vectorized engine already handles
+            return compose_frame_vectorized(
+                tile_indices, self.tile_size, (frame_width, frame_height), self.user_img_array, self.gray_user_img_array,
+                palette=self.tiles
+            )
+
+        frame_shape = (frame_height, frame_width, self.tiles.shape[3])
+        if (self.num_columns * tile_width, num_rows * tile_height) == (frame_width, frame_height):
+            frame_array = np.empty(frame_shape, dtype=np.uint8)
+        else:
+            frame_array = np.zeros(frame_shape, dtype=np.uint8)
+
+        rows = tile_indices.reshape(num_rows, self.num_columns)
+        for row in range(num_rows):
+            frame_array[row * tile_height:(row + 1) * tile_height, :self.num_columns * tile_width] = self.strip(rows[row])
+        return frame_array
+
+def get_row_strip_cache(job, tiles, plane=0):
+    """
+    Returns the row strip cache of a render job inside a worker. The cache lives as long as the job,
+    so strips composed for one task are reused by every later task on the same worker.
+
+    Args:
+        job (dict): The render job from shared_render_job.
+        tiles (numpy.ndarray): The palette of tile shades, from gray to user tile.
+        plane (int, optional): Index of the Y, U or V plane of a yuv420p job that tiles belongs to.
+            Each plane has its own cache and a share of the memory limit by its size.
+
+    Returns:
+        RowStripCache: The cache, or None if the job has row caching disabled.
+    """
+    if not job['row_cache_bytes']:
+        return None
+    cache_key = (job['tiles'][0], job['tile_size'], job['frame_dimensions'], job['row_cache_bytes'])
+    row_strip_caches = getattr(_worker_state, 'row_strip_caches', None)
+    if row_strip_caches is None or row_strip_caches[0] != cache_key:
+        row_strip_caches = (cache_key, {})
+        _worker_state.row_strip_caches = row_strip_caches
+
+    caches = row_strip_caches[1]
+    if plane not in caches:
+        tile_size, frame_dimensions, max_bytes = job['tile_size'], job['frame_dimensions'], job['row_cache_bytes']
+        if job['pixel_format'] == YUV_PIXEL_FORMAT:
+            tile_size, frame_dimensions = yuv_plane_layouts(tile_size, frame_dimensions)[plane]
+            # The Y plane holds two thirds of a frame's bytes, the U and V planes a sixth each
+            max_bytes = max_bytes * (4 if plane == 0 else 1) // 6
+        caches[plane] = RowStripCache(tile_size, frame_dimensions, tiles[-1], tiles[0], max_bytes, palette=tiles)
+    return caches[plane]
+
+class DeltaRenderer:
+    """
+    Composes consecutive frames by repainting only the tiles that changed since the previous frame.
+
+    The first frame is composed in full with the selected compositing engine and kept as a frame buffer.
+    For every following frame the cell values are XORed against the previous frame's, and only the tiles
+    that changed are copied into the buffer. Most of Bad Apple is static from one frame to the next, so
+    this touches a small fraction of the frame instead of all of it.
+    """
+    def __init__(self, tile_size, frame_dimensions, user_img_array, gray_user_img_array, engine=None, row_cache=None,
+                 palette=None):
+        """
+        Args:
+            tile_size (tuple): Size (width, height) of each tile.
+            frame_dimensions (tuple): Dimensions (width, height) of the frame.
+            user_img_array (numpy.ndarray): User image array.
+            gray_user_img_array (numpy.ndarray): Grayscale user image array.
+            engine (str, optional): Name of the compositing engine used for full repaints.
+            row_cache (RowStripCache, optional): Cache used for full repaints instead of the engine.
+            palette (numpy.ndarray, optional): Tile shade of every brightness level, from tiles.build_palette.
+                Defaults to the gray and the user tile.
+        """
+        self.tile_size = tile_size
+        self.frame_dimensions = frame_dimensions
+        self.user_img_array = user_img_array
+        self.gray_user_img_array = gray_user_img_array
+        self.engine = engine
+        self.row_cache = row_cache
+        self.num_columns = frame_dimensions[0] // tile_size[0]
+        self.num_rows = frame_dimensions[1] // tile_size[1]
+        self.num_tiles = self.num_columns * self.num_rows
+        self.tiles = palette if palette is not None else np.stack((gray_user_img_array, user_img_array))
+        self.frame = None
+        self.grid = None
+        self.bits = None
+
+    def render(self, bits):
+        """
+        Composes the next frame into the frame buffer.
+
+        Args:
+            bits (bitarray or numpy.ndarray): Pixel data of the frame, one value per tile.
+
+        Returns:
+            tuple: The frame buffer and the number of tiles that were repainted. The buffer is
+                overwritten by the next call, so copy it if it has to outlive that.
+        """
+        tile_indices = frame_bits_to_array(bits)[:self.num_tiles]
+
+        if self.frame is None or len(tile_indices) < self.num_tiles:
+            # Partial frames leave black tiles, so they are always composed in full
+            if self.row_cache is not None:
+                self.frame = self.row_cache.compose(tile_indices, self.num_rows)
+            else:
+                self.frame = np.ascontiguousarray(compose_frame(
+                    tile_indices, self.tile_size, self.frame_dimensions,
+                    self.user_img_array, self.gray_user_img_array, self.engine, palette=self.tiles
+                ))
+            tile_width, tile_height = self.tile_size
+            self.grid = self.frame[:self.num_rows * tile_height, :self.num_columns * tile_width].reshape(
+                self.num_rows, tile_height, self.num_columns, tile_width, self.frame.shape[2]
+            ).transpose(0, 2, 1, 3, 4)
+            self.bits = tile_indices if len(tile_indices) == self.num_tiles else None
+            return self.frame, self.num_tiles
+
+        changed = np.flatnonzero(tile_indices ^ self.bits)
+        if changed.size:
+            rows, columns = np.divmod(changed, self.num_columns)
+            self.grid[rows, columns] = self.tiles[tile_indices[changed]]
+        self.bits = tile_indices
+        return self.frame, changed.size
+
+def compose_frame_range(job, pixel_data, tiles, start, stop, row_cache=None, rows=None):
+    """
+    Composes a range of consecutive frames of a render job, or the same horizontal strip of each of them.
+
+    Args:
+        job (dict): The render job from shared_render_job.
+        pixel_data (PixelData): The pixel data of the render.
+        tiles (numpy.ndarray): The palette of tile shades, from gray to user tile.
+        start (int): Index of the first frame of the range.
+        stop (int): Index after the last frame of the range.
+        row_cache (RowStripCache, optional): Cache of composed row strips to build full frames from.
+        rows (tuple, optional): The (start, stop) tile rows of the strip to compose, from frame_strips.
+            Defaults to whole frames.
+
+    Yields:
+        tuple: The frame number, the composed BGR frame or strip and the number of tiles painted for it.
+            With delta rendering the frame is a buffer that is reused for the next frame of the range.
+    """
+    tile_width, tile_height = job['tile_size']
+    frame_dimensions = job['frame_dimensions']
+    frame_bits = pixel_data.frame_bits
+    if rows is not None:
+        num_columns = frame_dimensions[0] // tile_width
+        frame_dimensions = (frame_dimensions[0], (rows[1] - rows[0]) * tile_height)
+        frame_bits = lambda index: frame_bits_to_array(pixel_data.frame_bits(index))[rows[0] * num_columns:rows[1] * num_columns]
+
+    if job['delta']:
+        renderer = DeltaRenderer(
+            job['tile_size'], frame_dimensions, tiles[-1], tiles[0], job['engine'], row_cache, palette=tiles
+        )
+        for index in range(start, stop):
+            frame_array, tiles_painted = renderer.render(frame_bits(index))
+            yield pixel_data.first_frame + index, frame_array, tiles_painted
+    else:
+        num_rows = frame_dimensions[1] // tile_height
+        num_tiles = (frame_dimensions[0] // tile_width) * num_rows
+        for index in range(start, stop):
+            if row_cache is not None:
+                frame_array = row_cache.compose(frame_bits(index), num_rows)
+            else:
+                frame_array = compose_frame(
+                    frame_bits(index), job['tile_size'], frame_dimensions, tiles[-1], tiles[0],
+                    job['engine'], palette=tiles
+                )
+            yield pixel_data.first_frame + index, frame_array, num_tiles
+
+def yuv_plane_layouts(tile_size, frame_dimensions):
+    """
+    Works out the tile size and dimensions of the Y, U and V planes of a yuv420p frame. The chroma
+    planes have half the width and height of the frame, and so do their tiles.
+
+    Args:
+        tile_size (tuple): Size (width, height) of each tile.
+        frame_dimensions (tuple): Dimensions (width, height) of the frame.
+
+    Returns:
+        list: The tile size and frame dimensions of every plane.
+    """
+    chroma_layout = (
+        (tile_size[0] // 2, tile_size[1] // 2),
+        (frame_dimensions[0] // 2, frame_dimensions[1] // 2)
+    )
+    return [(tuple(tile_size), tuple(frame_dimensions)), chroma_layout, chroma_layout]
+
+def compose_yuv_frame_range(job, pixel_data, planes, start, stop, row_caches, frame_buffer=None, rows=None):
+    """
+    Composes a range of consecutive frames of a yuv420p render job. Each plane is composed from its
+    own palette of tile planes like a BGR frame from its tiles, with delta rendering and row caching,
+    and the planes are then packed one after the other into the frame.
+
+    A horizontal strip of the frames covers the same tile rows in every plane, so it is packed into
+    three separate parts of the frame buffer, one per plane.
+
+    Args:
+        job (dict): The render job from shared_render_job.
+        pixel_data (PixelData): The pixel data of the render.
+        planes (list): The Y, U and V palettes, from tiles.build_yuv_palette.
+        start (int): Index of the first frame of the range.
+        stop (int): Index after the last frame of the range.
+        row_caches (list): The row strip cache of every plane, or None for each plane without one.
+        frame_buffer (callable, optional): Returns the flat array to pack a frame into from its index, such
+            as its slot of a frame ring. Defaults to a new array for every frame or strip.
+        rows (tuple, optional): The (start, stop) tile rows of the strip to compose, from frame_strips.
+            Defaults to whole frames.
+
+    Yields:
+        tuple: The frame number, the frame buffer or a flat array of the Y, U and V planes of the strip,
+            and the number of tiles painted for it.
+    """
+    plane_frames = [
+        compose_frame_range(
+            dict(job, tile_size=tile_size, frame_dimensions=frame_dimensions), pixel_data, palette, start, stop,
+            row_cache, rows
+        )
+        for (tile_size, frame_dimensions), palette, row_cache
+        in zip(yuv_plane_layouts(job['tile_size'], job['frame_dimensions']), planes, row_caches)
+    ]
+    frame_width, frame_height = job['frame_dimensions']
+    luma_size = frame_width * frame_height
+    chroma_size = luma_size // 4
+    # Offsets of the strip in the Y plane; tile rows are even, so the chroma planes hold a quarter of them
+    luma_start, luma_stop = 0, luma_size
+    if rows is not None:
+        luma_start, luma_stop = (row * job['tile_size'][1] * frame_width for row in rows)
+    chroma_start, chroma_stop = luma_start // 4, luma_stop // 4
+    strip_size = (luma_stop - luma_start) * 3 // 2
+    frame_regions = (
+        (luma_start, luma_stop),
+        (luma_size + chroma_start, luma_size + chroma_stop),
+        (luma_size + chroma_size + chroma_start, luma_size + chroma_size + chroma_stop)
+    )
+    strip_regions = (
+        (0, luma_stop - luma_start),
+        (luma_stop - luma_start, luma_stop - luma_start + chroma_stop - chroma_start),
+        (luma_stop - luma_start + chroma_stop - chroma_start, strip_size)
+    )
+
+    for index, ((frame_number, y_plane, tiles_painted), (_, u_plane, _), (_, v_plane, _)) in enumerate(zip(*plane_frames), start):
+        if frame_buffer is not None:
+            frame_array, regions = frame_buffer(index), frame_regions
+        else:
+            frame_array, regions = np.empty(strip_size, dtype=np.uint8), strip_regions
+        for (region_start, region_stop), plane in zip(regions, (y_plane, u_plane, v_plane)):
+            frame_array[region_start:region_stop] = plane.reshape(-1)
+        yield frame_number, frame_array, tiles_painted
+
+def yuv_frame_to_bgr(frame_array, frame_dimensions):
+    """
+    Converts a frame composed by compose_yuv_frame_range back to a BGR image.
+
+    Args:
+        frame_array (numpy.ndarray): The flat Y, U and V planes of the frame.
+        frame_dimensions (tuple): Dimensions (width, height) of the frame.
+
+    Returns:
+        numpy.ndarray: The BGR frame.
+    """
+    frame_width, frame_height = frame_dimensions
+    return cv.cvtColor(frame_array.reshape(frame_height * 3 // 2, frame_width), cv.COLOR_YUV2BGR_I420)
+
+def create_process_pool(max_workers=None):
+    """
+    Creates the process pool that composes frames.
+
+    Workers are always spawned rather than forked. A forked worker would inherit the parent's end of an
+    ffmpeg stdin pipe, and ffmpeg would then never see the end of the stream while the pool is alive.
+
+    Args:
+        max_workers (int, optional): Number of worker processes. Defaults to config.NUM_PROCESSES.
+
+    Returns:
+        concurrent.futures.ProcessPoolExecutor: The new process pool.
+    """
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=max_workers or config.NUM_PROCESSES,
+        mp_context=mp.get_context("spawn")
+    )
+
+def create_render_executor(pixel_data, tile_size, frame_dimensions, user_img_array, gray_user_img_array, engine=None,
+                           output_dir=None, backend=None, max_workers=None, pixel_format=None):
+    """
+    Plans the worker pool of a render with a short calibration run and creates it. The choice of a
+    process or thread pool and its size is printed.
+
+    Args:
+        pixel_data (PixelData): The pixel data of the render.
+        tile_size (tuple): Size (width, height) of each tile.
+        frame_dimensions (tuple): Dimensions (width, height) of the frame.
+        user_img_array (numpy.ndarray): User image array.
+        gray_user_img_array (numpy.ndarray): Grayscale user image array.
+        engine (str, optional): Name of the compositing engine to use.
+        output_dir (str, optional): Directory of a render that writes PNG frames, so the calibration
+            times writing them too. Calibration frames are written there like any other frame.
+        backend (str, optional): One of scheduler.WORKER_BACKENDS. Defaults to config.WORKER_BACKEND.
+        max_workers (int, optional): Number of workers. Defaults to config.NUM_WORKERS, or a size
+            chosen from the calibration run.
+        pixel_format (str, optional): One of STREAM_PIXEL_FORMATS for the frames of a streamed render. Defaults to BGR frames.
+
+    Returns:
+        tuple: The new process or thread pool, and the scheduler.WorkerPlan it was created from.
+    """
+    frame_bytes = frame_size(frame_dimensions, pixel_format)
+
+    with shared_render_job(
+        pixel_data, tile_size, frame_dimensions, user_img_array, gray_user_img_array, engine, pixel_format=pixel_format
+    ) as job:
+        if output_dir is None:
+            # Streamed frames go into the frame ring, so a worker only holds the strip it composes
+            run_task, make_task = compose_frame_strips, lambda start, stop: (job, start, stop)
+            worker_bytes = job['row_cache_bytes'] + 2 * frame_bytes // len(job['strips'])
+        else:
+            run_task, make_task = generate_frame_range, lambda start, stop: (job, start, stop, output_dir)
+            worker_bytes = job['row_cache_bytes'] + frame_bytes * (config.TASK_CHUNKSIZE + 2)
+        with tracing.span('calibrate'):
+            plan = scheduler.plan_workers(run_task, make_task, len(pixel_data), worker_bytes, backend, max_workers)
+
+    print(f"Rendering on {plan.workers} {plan.backend} worker{'s' if plan.workers != 1 else ''}: {plan.reason}.")
+    if plan.backend == scheduler.THREAD_BACKEND:
+        return concurrent.futures.ThreadPoolExecutor(max_workers=plan.workers, thread_name_prefix='render'), plan
+    return create_process_pool(plan.workers), plan
+
+def share_array(array):
+    """
+    Copies an array into a new shared memory block that worker processes can attach to by name.
+
+    Args:
+        array (numpy.ndarray): The array to share.
+
+    Returns:
+        tuple: The SharedMemory block (owned by the caller, who must close and unlink it)
+            and a picklable descriptor (name, shape, dtype) for attach_shared_array.
+    """
+    shm = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+def attach_shared_array(descriptor, writeable=False):
+    """
+    Attaches to an array shared with share_array. Attachments are cached for the lifetime of the worker,
+    so each block is mapped once per process rather than once per task.
+
+    Args:
+        descriptor (tuple): The descriptor returned by share_array.
+        writeable (bool, optional): Whether the worker writes to the array, like the slots of a frame ring.
+
+    Returns:
+        numpy.ndarray: A view of the shared array, read-only unless writeable is set.
+    """
+    name, shape, dtype = descriptor
+    with _worker_cache_lock:
+        if name in _worker_cache:
+            # Blocks in use move to the end, so the stale ones are closed first
+            _worker_cache[name] = _worker_cache.pop(name)
+        else:
+            # Only the most recently used blocks are kept open, enough for the current and the previous job
+            while len(_worker_cache) >= 12:
+                stale_name = next(iter(_worker_cache))
+                stale_shm, stale_array = _worker_cache.pop(stale_name)
+                del stale_array
+                if stale_shm is not None:
+                    try:
+                        stale_shm.close()
+                    except BufferError:
+                        pass
+            shm = shared_memory.SharedMemory(name=name)
+            array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+            array.flags.writeable = writeable
+            _worker_cache[name] = (shm, array)
+        return _worker_cache[name][1]
+
+def detach_shared_array(name):
+    """
+    Closes the cached attachment of a shared array in the current process, if there is one.
+
+    Args:
+        name (str): Name of the shared memory block.
+    """
+    with _worker_cache_lock:
+        cached = _worker_cache.pop(name, None)
+    if cached is not None and cached[0] is not None:
+        try:
+            cached[0].close()
+        except BufferError:
+            pass
+
+def load_job_pixel_data(pixel_source):
+    """
+    Opens the pixel data of a render job inside a worker.
+
+    Args:
+        pixel_source (tuple): Either ('file', path) for a memory-mappable binary file, or
+            ('shm', descriptor, frame_dimensions, fps, first_frame, bits_per_cell) for pixel data shared by the parent.
+
+    Returns:
+        PixelData: The pixel data of the job.
+    """
+    if pixel_source[0] == 'file':
+        path = pixel_source[1]
+        with _worker_cache_lock:
+            if path not in _worker_cache:
+                _worker_cache[path] = (None, load_pixel_data(path, verify=False))
+            return _worker_cache[path][1]
 
-    output_dir = config.PROCESSED_FRAMES_DIR
-    os.makedirs(output_dir, exist_ok=True)
+    _, descriptor, frame_dimensions, fps, first_frame, bits_per_cell = pixel_source
+    return PixelData(attach_shared_array(descriptor), frame_dimensions, fps, first_frame, bits_per_cell=bits_per_cell)
+
+@contextlib.contextmanager
+def shared_render_job(pixel_data, tile_size, frame_dimensions, user_img_array, gray_user_img_array, engine=None,
+                      delta=None, row_cache_bytes=None, pixel_format=None, frame_budget=None):
+    """
+    Publishes the tiles and pixel data of a render to shared memory for the lifetime of the context.
+
+    The yielded job only holds names and sizes, so sending it with every task costs a few hundred bytes
+    instead of a copy of both tile images. Binary pixel data files are memory-mapped by the workers
+    directly; pickled pixel data is packed into shared memory once.
+
+    Args:
+        pixel_data (PixelData): The pixel data of the render.
+        tile_size (tuple): Size (width, height) of each tile.
+        frame_dimensions (tuple): Dimensions (width, height) of the frame.
+        user_img_array (numpy.ndarray): User image array.
+        gray_user_img_array (numpy.ndarray): Grayscale user image array.
+        engine (str, optional): Name of the compositing engine to use.
+        delta (bool, optional): Whether workers only repaint changed tiles. Defaults to config.DELTA_RENDERING.
+        row_cache_bytes (int, optional): Memory limit of each worker's row strip cache, 0 to disable it.
+            Defaults to config.ROW_CACHE_MAX_BYTES.
+        pixel_format (str, optional): One of STREAM_PIXEL_FORMATS for the composed frames. Defaults to BGR
+            frames; for yuv420p frames the tiles are converted to Y, U and V planes here, once per render.
+        frame_budget (int, optional): Memory in bytes a worker may use for the frame it composes, which
+            sets the strips of the job. Defaults to config.WORKER_FRAME_BUDGET.
+
+    Yields:
+        dict: The picklable render job passed to the workers.
+    """
+    pixel_format = pixel_format or BGR_PIXEL_FORMAT
+    if pixel_format not in STREAM_PIXEL_FORMATS:
+        raise Exception(f"Unknown pixel format '{pixel_format}'. Choose one of {', '.join(STREAM_PIXEL_FORMATS)}.")
+
+    shared_blocks = []
+    try:
+        # The palette holds a tile shade per brightness level of the pixel data, [gray, user] for black and white
+        palette = tiles.build_palette(user_img_array, gray_user_img_array, pixel_data.levels)
+        tiles_shm, tiles_descriptor = share_array(palette)
+        shared_blocks.append(tiles_shm)
 
-    with open(pixel_data_path, "rb") as file:
-        data = pickle.load(file)
-        pixel_data = data['pixel_data']
-        frame_dimensions = data['frame_dimensions']
+        yuv_descriptors = None
+        if pixel_format == YUV_PIXEL_FORMAT:
+            yuv_descriptors = []
+            for plane in tiles.build_yuv_palette(palette):
+                plane_shm, plane_descriptor = share_array(plane)
+                shared_blocks.append(plane_shm)
+                yuv_descriptors.append(plane_descriptor)
+
+        if pixel_data.path and is_binary_pixel_data(pixel_data.path):
+            pixel_source = ('file', pixel_data.path)
+        else:
+            pixels_shm, pixels_descriptor = share_array(np.asarray(pixel_data.packed_frames))
+            shared_blocks.append(pixels_shm)
+            pixel_source = (
+                'shm', pixels_descriptor, pixel_data.frame_dimensions, pixel_data.fps, pixel_data.first_frame,
+                pixel_data.bits_per_cell
+            )
+
+        yield {
+            'pixel_source': pixel_source,
+            'tiles': tiles_descriptor,
+            'tile_size': tile_size,
+            'frame_dimensions': frame_dimensions,
+            'engine': engine or config.COMPOSITING_ENGINE,
+            'delta': config.DELTA_RENDERING if delta is None else delta,
+            'row_cache_bytes': config.ROW_CACHE_MAX_BYTES if row_cache_bytes is None else row_cache_bytes,
+            'pixel_format': pixel_format,
+            'yuv_tiles': yuv_descriptors,
+            'strips': frame_strips(tile_size, frame_dimensions, pixel_format, frame_budget),
+            'trace': tracing.job_trace()
+        }
+    finally:
+        for shm in shared_blocks:
+            shm.close()
+            shm.unlink()
+
+class FrameRing:
+    """
+    A ring of preallocated frame slots in shared memory between the render workers and the encoder.
+    Workers compose frames straight into the slots and the encoder writes them to ffmpeg from there,
+    so a frame is never pickled or copied through the parent on its way to the encoder.
+    """
+    def __init__(self, slot_count, frame_shape):
+        """
+        Args:
+            slot_count (int): Number of frame slots.
+            frame_shape (tuple): Shape of a composed frame, from frame_shape.
+        """
+        shape = (slot_count, *frame_shape)
+        self.shm = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape))))
+        self.slots = np.ndarray(shape, dtype=np.uint8, buffer=self.shm.buf)
+        # Picklable descriptor for attach_shared_array in the workers
+        self.descriptor = (self.shm.name, shape, np.dtype(np.uint8).str)
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def slot(self, index):
+        """
+        Returns the slot of a frame.
+
+        Args:
+            index (int): Index of the frame in the pixel data.
+
+        Returns:
+            numpy.ndarray: The slot, shared with the workers.
+        """
+        return self.slots[index % len(self.slots)]
+
+    def close(self):
+        """
+        Frees the shared memory of the ring. A ring whose slots are still referenced, like after an
+        error while writing a frame, is freed by a later call once they are released.
+        """
+        self.slots = None
+        # Thread workers attach to the ring in this process
+        detach_shared_array(self.shm.name)
+        self.shm.unlink()
+        _stale_rings.append(self.shm)
+        for shm in list(_stale_rings):
+            try:
+                shm.close()
+                _stale_rings.remove(shm)
+            except BufferError:
+                pass
+
+def frame_ranges(frame_count, chunksize):
+    """
+    Splits the frames of a render into consecutive ranges, one per task.
+
+    Args:
+        frame_count (int): Number of frames to render.
+        chunksize (int): Maximum number of frames per range.
+
+    Yields:
+        tuple: The (start, stop) frame indices of every range.
+    """
+    chunksize = max(1, chunksize)
+    for start in range(0, frame_count, chunksize):
+        yield start, min(start + chunksize, frame_count)
+
+def render_task_frames(job, start, stop, stats, frame_buffer=None, rows=None):
+    """
+    Composes the frames of one pool task and counts the work it took.
+
+    Args:
+        job (dict): The render job from shared_render_job.
+        start (int): Index of the first frame of the task.
+        stop (int): Index after the last frame of the task.
+        stats (collections.Counter): Updated with the tiles painted and the row cache hits and misses.
+        frame_buffer (callable, optional): Returns the array to pack a yuv420p frame into from its index.
+            BGR frames are composed by the engines and left to the caller.
+        rows (tuple, optional): The (start, stop) tile rows of the strip of every frame the task composes,
+            one of job['strips']. Defaults to whole frames.
+
+    Yields:
+        tuple: The frame number and composed frame or strip, a BGR image or the flat planes of a yuv420p
+            frame. yuv420p strips are packed into their parts of the frame buffer, if there is one.
+    """
+    with tracing.span('open job'):
+        pixel_data = load_job_pixel_data(job['pixel_source'])
+        if job['pixel_format'] == YUV_PIXEL_FORMAT:
+            planes = [attach_shared_array(descriptor) for descriptor in job['yuv_tiles']]
+            row_caches = [get_row_strip_cache(job, palette, plane) for plane, palette in enumerate(planes)]
+            frames = compose_yuv_frame_range(job, pixel_data, planes, start, stop, row_caches, frame_buffer, rows)
+        else:
+            tiles = attach_shared_array(job['tiles'])
+            row_caches = [get_row_strip_cache(job, tiles)]
+            frames = compose_frame_range(job, pixel_data, tiles, start, stop, row_caches[0], rows)
+    row_caches = [row_cache for row_cache in row_caches if row_cache is not None]
+    hits = sum(row_cache.hits for row_cache in row_caches)
+    misses = sum(row_cache.misses for row_cache in row_caches)
+
+    for frame_number, frame_array, tiles_painted in tracing.timed(frames, 'compose frame'):
+        stats['tiles_painted'] += tiles_painted
+        yield frame_number, frame_array
+
+    if row_caches:
+        stats['row_cache_hits'] += sum(row_cache.hits for row_cache in row_caches) - hits
+        stats['row_cache_misses'] += sum(row_cache.misses for row_cache in row_caches) - misses
+
+def compose_frame_strips(task):
+    """
+    Composes a range of frames inside a worker strip by strip, the way a streamed render does, and
+    drops them. The calibration run of a streamed render times its tasks, so no worker holds more
+    than a strip however large the frames are.
 
+    Args:
+        task (tuple): The render job from shared_render_job and the (start, stop) frame indices.
+
+    Returns:
+        collections.Counter: The work it took to compose the frames.
+    """
+    job, start, stop = task
+    stats = collections.Counter()
+    with tracing.worker_task(job['trace'], 'render task', start=start, stop=stop):
+        for rows in job['strips']:
+            collections.deque(render_task_frames(job, start, stop, stats, rows=rows), maxlen=0)
+    return stats
+
+def generate_frame_range(task):
+    """
+    Composes a range of frames inside a worker and writes them as PNG files.
+
+    Args:
+        task (tuple): The render job from shared_render_job, the (start, stop) frame indices and the output directory.
+
+    Returns:
+        collections.Counter: The work it took to compose the frames.
+    """
+    job, start, stop, output_dir = task
+    stats = collections.Counter()
+    with tracing.worker_task(job['trace'], 'render task', start=start, stop=stop):
+        for frame_number, frame_array in render_task_frames(job, start, stop, stats):
+            with tracing.span('write png'):
+                cv.imwrite(os.path.join(output_dir, f"frame_{frame_number:05d}.png"), frame_array, [cv.IMWRITE_PNG_COMPRESSION, 1])
+    return stats
+
+def render_ring_range(task):
+    """
+    Composes a range of frames, or one horizontal strip of each of them, inside a worker into their
+    slots of a frame ring. yuv420p frames are packed straight into their slots, BGR frames are copied
+    in once they are composed.
+
+    Args:
+        task (tuple): The render job from shared_render_job, the (start, stop) frame indices, the
+            descriptor of the FrameRing and the (start, stop) tile rows of the strip, or None for whole frames.
+
+    Returns:
+        collections.Counter: The work it took to compose the frames.
+    """
+    job, start, stop, ring_descriptor, rows = task
+    # The rings of earlier renders are closed, so a long-lived pool does not keep their memory
+    for name, ring_job in list(_worker_rings.items()):
+        if ring_job != job['tiles'][0]:
+            _worker_rings.pop(name, None)
+            detach_shared_array(name)
+    _worker_rings[ring_descriptor[0]] = job['tiles'][0]
+    ring = attach_shared_array(ring_descriptor, writeable=True)
+    slot = lambda index: ring[index % len(ring)]
+    strip_slot = slot
+    if rows is not None:
+        tile_height = job['tile_size'][1]
+        strip_slot = lambda index: slot(index)[rows[0] * tile_height:rows[1] * tile_height]
+    stats = collections.Counter()
+    with tracing.worker_task(job['trace'], 'render task', start=start, stop=stop, rows=rows):
+        for index, (_, frame_array) in enumerate(render_task_frames(job, start, stop, stats, frame_buffer=slot, rows=rows), start):
+            if not np.may_share_memory(frame_array, ring):
+                strip_slot(index)[...] = frame_array
+    return stats
+
+def report_dispatch(frame_count, task_count, chunksize, task, elapsed, stats=None, strips=None):
+    """
+    Prints how the frames of a render were dispatched to the worker pool.
+
+    Args:
+        frame_count (int): Number of frames rendered.
+        task_count (int): Number of tasks submitted.
+        chunksize (int): Maximum number of frames per task.
+        task (tuple): A representative task, measured for its pickled size.
+        elapsed (float): Wall-clock time of the render in seconds.
+        stats (collections.Counter, optional): The summed work counters returned by the tasks.
+        strips (list, optional): The strips every frame was composed in, from frame_strips.
+    """
+    task_bytes = len(pickle.dumps(task, protocol=pickle.HIGHEST_PROTOCOL))
+    print(
+        f"Rendered {frame_count} frames in {task_count} tasks of up to {chunksize} frames "
+        f"({task_bytes} bytes sent per task) in {elapsed:.1f}s."
+    )
+    if strips and len(strips) > 1:
+        strip_rows = max(stop - start for start, stop in strips)
+        print(f"Composed every frame in {len(strips)} strips of up to {strip_rows} tile rows to stay within the worker frame budget.")
+    if not stats or not frame_count:
+        return
+
+    job = task[0]
+    tile_width, tile_height = job['tile_size']
+    num_tiles = (job['frame_dimensions'][0] // tile_width) * (job['frame_dimensions'][1] // tile_height)
+    print(f"Repainted {stats['tiles_painted'] / (frame_count * num_tiles):.1%} of all tiles.")
+    row_lookups = stats['row_cache_hits'] + stats['row_cache_misses']
+    if row_lookups:
+        print(f"Row strip cache hit rate: {stats['row_cache_hits'] / row_lookups:.1%} of {row_lookups} rows.")
+
+def compute_tile_layout(frame_dimensions, output_resolution, min_tile_size=None, even_tiles=False):
+    """
+    Works out the tile size for a pixel data grid and shrinks the output resolution to fit the tiles exactly.
+
+    Args:
+        frame_dimensions (tuple): Dimensions (columns, rows) of the pixel data grid.
+        output_resolution (tuple): Desired output resolution (width, height) for the frames.
+        min_tile_size (int, optional): Smallest allowed tile width and height. Defaults to config.MIN_TILE_SIZE.
+        even_tiles (bool, optional): Round the tile width and height down to even numbers, as yuv420p
+            frames are composed from tiles that cover whole 2x2 chroma blocks.
+
+    Returns:
+        tuple: The tile size and the adjusted frame dimensions.
+    """
     num_columns = frame_dimensions[0]
     num_rows = frame_dimensions[1]
 
     tile_width = output_resolution[0] // num_columns
     tile_height = output_resolution[1] // num_rows
+    if even_tiles:
+        tile_width -= tile_width % 2
+        tile_height -= tile_height % 2
     tile_size = (tile_width, tile_height)
 
-    if tile_width < config.MIN_TILE_SIZE or tile_height < config.MIN_TILE_SIZE:
+    min_tile_size = config.MIN_TILE_SIZE if min_tile_size is None else min_tile_size
+    if tile_width < min_tile_size or tile_height < min_tile_size:
         raise Exception("The calculated tile size is too small. Please select a higher output resolution or lower input resolution.")
-    
+
     adjusted_frame_dimensions = (tile_width * num_columns, tile_height * num_rows)
 
-    if adjusted_frame_dimensions != output_resolution:
+    if max(adjusted_frame_dimensions) > config.MAX_OUTPUT_DIMENSION:
+        raise Exception(
+            f"The output resolution of {adjusted_frame_dimensions[0]}x{adjusted_frame_dimensions[1]} is too large to encode, "
+            f"videos can be at most {config.MAX_OUTPUT_DIMENSION} pixels wide and high. Please select a lower output resolution."
+        )
+    # Frames are composed in strips of whole tile rows, so one row has to fit in a worker's frame budget
+    row_bytes = 2 * frame_size((adjusted_frame_dimensions[0], tile_height))
+    if row_bytes > config.WORKER_FRAME_BUDGET:
+        raise Exception(
+            f"The calculated tile size is too large: a row of tiles takes {row_bytes / 1024 ** 2:.0f} MB to compose, more than "
+            f"the {config.WORKER_FRAME_BUDGET / 1024 ** 2:.0f} MB of WORKER_FRAME_BUDGET. Please select a lower output resolution or higher input resolution."
+        )
+
+    if adjusted_frame_dimensions != tuple(output_resolution):
         print(f"Adjusted output resolution from {output_resolution} to {adjusted_frame_dimensions} to fit tiles exactly.")
-        output_resolution = adjusted_frame_dimensions
 
-    user_img_array = load_image_as_cv_array(os.path.join(config.UPLOAD_DIR, "upload.png"), tile_size)
-    gray_user_img_array = load_image_as_cv_array(os.path.join(config.UPLOAD_DIR, "gray_upload.png"), tile_size)
+    return tile_size, adjusted_frame_dimensions
+
+def prepare_render(pixel_data_path, output_resolution, grid_size=None, fps=None, image=None, even_tiles=False):
+    """
+    Loads the pixel data and the user tiles and works out the tile layout for a render.
+
+    Args:
+        pixel_data_path (str): Path to the pixel data file, in the binary or the legacy pickle format.
+            If None, pixel data for grid_size and fps is taken from the pixel data cache.
+        output_resolution (tuple): Desired output resolution (width, height) for the frames.
+        grid_size (tuple, optional): Dimensions (columns, rows) of the tile grid when no pixel data file is given.
+        fps (float, optional): Frame rate of the pixel data when no pixel data file is given.
+        image (str, PIL.Image.Image or numpy.ndarray, optional): The user's image. Defaults to the files saved in config.UPLOAD_DIR.
+        even_tiles (bool, optional): Round the tile size down to even numbers for yuv420p frames.
+
+    Returns:
+        tuple: The PixelData, tile size, adjusted frame dimensions, user image array and grayscale user image array.
+    """
+    if pixel_data_path is None:
+        if grid_size is None or fps is None:
+            raise Exception("Either a pixel data file or a grid size and frame rate must be given.")
+        pixel_data_path = pixel_cache.get_pixel_data_path(grid_size, fps)
 
-    executor = concurrent.futures.ProcessPoolExecutor(max_workers=config.NUM_PROCESSES)
+    with tracing.span('load pixel data'):
+        pixel_data = load_pixel_data(pixel_data_path)
+    tile_size, adjusted_frame_dimensions = compute_tile_layout(
+        pixel_data.frame_dimensions, output_resolution, even_tiles=even_tiles
+    )
+
+    with tracing.span('load tiles'):
+        if image is not None:
+            user_img_array, gray_user_img_array = tiles.load_user_tiles(image, tile_size)
+        else:
+            user_img_array = load_image_as_cv_array(os.path.join(config.UPLOAD_DIR, "upload.png"), tile_size)
+            gray_user_img_array = load_image_as_cv_array(os.path.join(config.UPLOAD_DIR, "gray_upload.png"), tile_size)
+
+    return pixel_data, tile_size, adjusted_frame_dimensions, user_img_array, gray_user_img_array
+
+def render_preview(image, pixel_data_path, preview_resolution=None, frame_count=None):
+    """
+    Renders a handful of frames sampled across the video at a reduced resolution, fast enough to show
+    right after an image is selected. The frames go through the same compositing code as a full render,
+    in the calling process, so no worker pool has to be started.
+
+    Args:
+        image (str, PIL.Image.Image or numpy.ndarray): Path to the user's image, an already opened image,
+            or an image array in the channel order of cv.imread.
+        pixel_data_path (str): Path to the pixel data file.
+        preview_resolution (tuple, optional): Resolution (width, height) of the preview. Defaults to config.PREVIEW_RESOLUTION.
+        frame_count (int, optional): Number of frames to sample. Defaults to config.PREVIEW_SAMPLE_COUNT.
+
+    Returns:
+        list: The frame number and composed BGR frame of every sampled frame.
+    """
+    preview_resolution = preview_resolution or config.PREVIEW_RESOLUTION
+    frame_count = frame_count or config.PREVIEW_SAMPLE_COUNT
+
+    pixel_data = load_pixel_data(pixel_data_path, verify=False)
+    tile_size, frame_dimensions = compute_tile_layout(pixel_data.frame_dimensions, preview_resolution, min_tile_size=1)
+
+    user_img_array, gray_user_img_array = tiles.load_user_tiles(image, tile_size)
+
+    # Samples are spread evenly over the video, skipping its black first and last frames
+    indices = np.linspace(0, len(pixel_data) - 1, frame_count + 2).astype(int)[1:-1].tolist()
+    palette = tiles.build_palette(user_img_array, gray_user_img_array, pixel_data.levels)
+    return [
+        (pixel_data.first_frame + index, compose_frame(
+            pixel_data.frame_bits(index), tile_size, frame_dimensions, user_img_array, gray_user_img_array, palette=palette
+        ))
+        for index in indices
+    ]
+
+def generate_frames(pixel_data_path, output_resolution, engine=None, chunksize=None, grid_size=None, fps=None,
+                    progress_callback=None, image=None):
+    """
+    Generates all frames for the video by processing pixel data and user images.
+
+    Args:
+        pixel_data_path (str): Path to the pixel data file, in the binary or the legacy pickle format.
+            If None, pixel data for grid_size and fps is taken from the pixel data cache.
+        output_resolution (tuple): Desired output resolution (width, height) for the frames.
+        engine (str, optional): Name of the compositing engine to use. Defaults to config.COMPOSITING_ENGINE.
+        chunksize (int, optional): Number of frames per pool task. Defaults to config.TASK_CHUNKSIZE.
+        grid_size (tuple, optional): Dimensions (columns, rows) of the tile grid when no pixel data file is given.
+        fps (float, optional): Frame rate of the pixel data when no pixel data file is given.
+        progress_callback (callable, optional): Called with a RenderProgress as frames are finished.
+        image (str, PIL.Image.Image or numpy.ndarray, optional): The user's image, turned into tiles in memory.
+            Defaults to the files saved in config.UPLOAD_DIR.
+    """
+    with tracing.trace_render('frames'):
+        output_dir = config.PROCESSED_FRAMES_DIR
+        chunksize = chunksize or config.TASK_CHUNKSIZE
+
+        pixel_data, tile_size, adjusted_frame_dimensions, user_img_array, gray_user_img_array = prepare_render(
+            pixel_data_path, output_resolution, grid_size, fps, image
+        )
+        if len(frame_strips(tile_size, adjusted_frame_dimensions)) > 1:
+            print("Frames this large are written as whole PNG images, which is over the worker frame budget. Stream the render to stay within it.")
+
+        # Frames finished by an interrupted render of the same inputs are kept and skipped
+        manifest = checkpoint.RenderManifest(output_dir, checkpoint.render_inputs(
+            pixel_data, tile_size, adjusted_frame_dimensions, user_img_array, gray_user_img_array
+        ))
+        ranges = [
+            (start, stop) for start, stop in frame_ranges(len(pixel_data), chunksize)
+            if not (manifest.is_complete(start, stop) and all(
+                os.path.exists(os.path.join(output_dir, f"frame_{pixel_data.first_frame + index:05d}.png"))
+                for index in range(start, stop)
+            ))
+        ]
+        frames_skipped = len(pixel_data) - sum(stop - start for start, stop in ranges)
+        if frames_skipped:
+            print(f"Resuming render: {frames_skipped} of {len(pixel_data)} frames are already finished.")
+        if ranges:
+            render_frame_files(
+                pixel_data, tile_size, adjusted_frame_dimensions, user_img_array, gray_user_img_array, engine,
+                output_dir, ranges, chunksize, manifest, ProgressTracker(
+                    progress_callback, RENDER_STAGE, len(pixel_data), start_frames=frames_skipped
+                )
+            )
+
+        frame_number = config.PREVIEW_FRAME_NUMBER
+        frame_filename = f"frame_{frame_number:05d}.png"
+        frame_path = os.path.join(output_dir, frame_filename)
+        if os.path.exists(frame_path):
+            shutil.copyfile(frame_path, config.VIDEO_PREVIEW_FILE)
+        else:
+            print(f"Frame {frame_number} not found at {frame_path}. Cannot create video preview.")
+
+def render_frame_files(pixel_data, tile_size, frame_dimensions, user_img_array, gray_user_img_array, engine, output_dir,
+                       ranges, chunksize, manifest, tracker):
+    """
+    Renders ranges of frames as PNG files on a new worker pool, and records every finished range in the manifest.
+
+    Args:
+        pixel_data (PixelData): The pixel data of the render.
+        tile_size (tuple): Size (width, height) of each tile.
+        frame_dimensions (tuple): Dimensions (width, height) of the frame.
+        user_img_array (numpy.ndarray): User image array.
+        gray_user_img_array (numpy.ndarray): Grayscale user image array.
+        engine (str): Name of the compositing engine to use, or None for config.COMPOSITING_ENGINE.
+        output_dir (str): Directory the frames are written to.
+        ranges (list): The (start, stop) frame indices of every task, none of them finished yet.
+        chunksize (int): Maximum number of frames per task.
+        manifest (checkpoint.RenderManifest): The manifest of the frames in output_dir.
+        tracker (ProgressTracker): Advanced by every finished range.
+    """
+    global executor_reference
+
+    executor, plan = create_render_executor(
+        pixel_data, tile_size, frame_dimensions, user_img_array, gray_user_img_array, engine, output_dir
+    )
     executor_reference = executor
 
     try:
-        pool_inputs = [
-            (frame_info, tile_size, adjusted_frame_dimensions, user_img_array, gray_user_img_array)
-            for frame_info in pixel_data.items()
-        ]
-        list(executor.map(generate_frame, pool_inputs))
+        with shared_render_job(pixel_data, tile_size, frame_dimensions, user_img_array, gray_user_img_array, engine) as job:
+            start_time = time.perf_counter()
+            tasks = ((job, start, stop, output_dir) for start, stop in ranges)
+            stats = collections.Counter()
+            # Frames go straight to disk, so only the number of pending tasks has to be bounded
+            for (start, stop), task_stats in zip(ranges, ordered_results(executor, generate_frame_range, tasks, plan.workers * 2)):
+                stats.update(task_stats)
+                manifest.mark_complete(start, stop)
+                tracker.advance(stop - start)
+            report_dispatch(
+                sum(stop - start for start, stop in ranges), len(ranges), chunksize, (job, *ranges[0], output_dir),
+                time.perf_counter() - start_time, stats
+            )
     finally:
         executor.shutdown(wait=True)
         executor_reference = None
 
-    frame_number = 250
-    frame_filename = f"frame_{frame_number:05d}.png"
-    frame_path = os.path.join(output_dir, frame_filename)
-    if os.path.exists(frame_path):
-        shutil.copyfile(frame_path, config.VIDEO_PREVIEW_FILE)
-    else:
-        print(f"Frame {frame_number} not found at {frame_path}. Cannot create video preview.")
+def ordered_results(executor, fn, inputs, max_in_flight):
+    """
+    Submits work to an executor and yields the results in submission order, keeping at most
+    max_in_flight tasks pending so that finished frames never pile up in memory.
+
+    Args:
+        executor (concurrent.futures.Executor): The executor to submit the work to.
+        fn (callable): The function to run for every input.
+        inputs (iterable): The inputs to pass to fn, one task per input.
+        max_in_flight (int): Maximum number of submitted but not yet consumed tasks.
+
+    Yields:
+        The result of fn for every input, in the order of inputs.
+    """
+    pending = collections.deque()
+    for item in inputs:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= max_in_flight:
+            with tracing.span('wait for workers'):
+                result = pending.popleft().result()
+            yield result
+    while pending:
+        with tracing.span('wait for workers'):
+            result = pending.popleft().result()
+        yield result
+
+def ordered_result_groups(executor, fn, input_groups, max_in_flight):
+    """
+    Submits groups of tasks to an executor and yields the results of every group once all of its tasks
+    are done, in submission order, keeping at most max_in_flight groups pending. The tasks of a group
+    run side by side, like the strips of the same frames.
+
+    Args:
+        executor (concurrent.futures.Executor): The executor to submit the work to.
+        fn (callable): The function to run for every input.
+        input_groups (iterable): Lists of inputs to pass to fn, one task per input.
+        max_in_flight (int): Maximum number of submitted but not yet consumed groups.
+
+    Yields:
+        list: The results of fn for the inputs of every group, in the order of input_groups. If the
+            generator is closed early, the tasks not yet started are cancelled and the running ones are
+            waited for, so none of them outlives memory the caller frees afterwards.
+    """
+    pending = collections.deque()
+    try:
+        for inputs in input_groups:
+            pending.append([executor.submit(fn, item) for item in inputs])
+            if len(pending) >= max_in_flight:
+                with tracing.span('wait for workers'):
+                    results = [future.result() for future in pending.popleft()]
+                yield results
+        while pending:
+            with tracing.span('wait for workers'):
+                results = [future.result() for future in pending.popleft()]
+            yield results
+    finally:
+        futures = [future for group in pending for future in group]
+        for future in futures:
+            future.cancel()
+        concurrent.futures.wait(futures)
+
+def frame_shape(frame_dimensions, pixel_format=None):
+    """
+    Returns the array shape of a composed frame.
+
+    Args:
+        frame_dimensions (tuple): Dimensions (width, height) of the frame.
+        pixel_format (str, optional): One of STREAM_PIXEL_FORMATS. Defaults to BGR frames.
+
+    Returns:
+        tuple: The shape, (height, width, 3) for BGR frames and the flat size of the Y, U and V planes for yuv420p.
+    """
+    if pixel_format == YUV_PIXEL_FORMAT:
+        return (frame_dimensions[0] * frame_dimensions[1] * 3 // 2,)
+    return (frame_dimensions[1], frame_dimensions[0], 3)
+
+def frame_size(frame_dimensions, pixel_format=None):
+    """
+    Returns the size in bytes of a composed frame.
+
+    Args:
+        frame_dimensions (tuple): Dimensions (width, height) of the frame.
+        pixel_format (str, optional): One of STREAM_PIXEL_FORMATS. Defaults to BGR frames.
+
+    Returns:
+        int: The frame size in bytes.
+    """
+    return int(np.prod(frame_shape(frame_dimensions, pixel_format)))
+
+def frame_strips(tile_size, frame_dimensions, pixel_format=None, frame_budget=None):
+    """
+    Splits frames that are too large for the memory budget of a worker into horizontal strips of whole
+    tile rows, of about the same height each. A strip is composed next to a temporary copy of its tiles,
+    so it may take up half of the budget.
+
+    Args:
+        tile_size (tuple): Size (width, height) of each tile.
+        frame_dimensions (tuple): Dimensions (width, height) of the frame.
+        pixel_format (str, optional): One of STREAM_PIXEL_FORMATS. Defaults to BGR frames.
+        frame_budget (int, optional): Memory in bytes a worker may use for the frame it composes.
+            Defaults to config.WORKER_FRAME_BUDGET.
+
+    Returns:
+        list: The (start, stop) tile rows of every strip, or [None] when whole frames fit in the budget.
+    """
+    frame_budget = config.WORKER_FRAME_BUDGET if frame_budget is None else frame_budget
+    num_rows = frame_dimensions[1] // tile_size[1]
+    strip_count = min(num_rows, -(-2 * frame_size(frame_dimensions, pixel_format) // max(1, frame_budget)))
+    if strip_count <= 1:
+        return [None]
+    bounds = [num_rows * strip // strip_count for strip in range(strip_count + 1)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def render_window(frame_dimensions, chunksize=None, max_in_flight=None, memory_budget=None, segments=1, pixel_format=None,
+                  workers=None):
+    """
+    Works out the slots of the frame ring of a render, which bound how far rendering may run ahead of
+    the encoder. Every slot is committed memory once the ring has wrapped around, so without a
+    configured slot count the rings hold two tasks per worker, and at least one whole task for every
+    segment, as long as they fit in the memory budget. Tasks are only made smaller when the budget or
+    the configured slots leave less than that, so that every worker and every segment still has a task
+    to work on, and the rings of all segments together stay within the budget.
+
+    Args:
+        frame_dimensions (tuple): Dimensions (width, height) of the frame.
+        chunksize (int, optional): Number of frames per pool task. Defaults to config.TASK_CHUNKSIZE.
+        max_in_flight (int, optional): Maximum number of frames rendered ahead of the encoder. Defaults to
+            config.FRAME_RING_SLOTS, or two tasks per worker within the memory budget.
+        memory_budget (int, optional): Memory in bytes for frames in flight. Defaults to config.RENDER_MEMORY_BUDGET.
+        segments (int, optional): Number of segments sharing the slots, each with a ring of its own.
+        pixel_format (str, optional): One of STREAM_PIXEL_FORMATS. Defaults to BGR frames.
+        workers (int, optional): Number of workers of the pool. Defaults to config.NUM_PROCESSES.
+
+    Returns:
+        tuple: The number of frames per task and the number of slots of the ring of every segment. Every
+            segment gets at least one slot, so there should be no more segments than frames in flight.
+    """
+    chunksize = chunksize or config.TASK_CHUNKSIZE
+    workers = workers or config.NUM_PROCESSES
+    segments = max(1, segments)
+    if max_in_flight is None:
+        max_in_flight = config.FRAME_RING_SLOTS
+    if max_in_flight is None:
+        memory_budget = config.RENDER_MEMORY_BUDGET if memory_budget is None else memory_budget
+        max_in_flight = min(memory_budget // frame_size(frame_dimensions, pixel_format), max(2 * workers, segments) * chunksize)
+    max_in_flight = max(1, max_in_flight)
+    chunksize = max(1, min(chunksize, max_in_flight // workers, max_in_flight // segments))
+    return chunksize, max(1, max_in_flight // chunksize // segments) * chunksize
+
+def ring_frames(executor, job, ring, start, stop, chunksize, stats, first_frame=0):
+    """
+    Renders a range of frames on the pool into a frame ring and yields them in order as a bounded
+    pipeline. Frame i is composed into slot i modulo the number of slots, and a task is only
+    submitted once the frames that held its slots before have been handed out, so a full ring holds
+    back new work until the encoder catches up. Tasks are created lazily, so memory use does not
+    depend on the length of the range. Frames of a job with several strips are composed by one task
+    per strip, which all write into the same slots.
+
+    Args:
+        executor (concurrent.futures.Executor): The process or thread pool that composes the frames.
+        job (dict): The render job from shared_render_job.
+        ring (FrameRing): The ring the frames are composed into.
+        start (int): Index of the first frame.
+        stop (int): Index after the last frame.
+        chunksize (int): Number of frames per pool task, which must not exceed the number of slots.
+        stats (collections.Counter): Updated with the work counters returned by the tasks.
+        first_frame (int, optional): Frame number of the first frame of the pixel data.
+
+    Yields:
+        tuple: The frame number and the slot holding the frame, for every frame in the range. The slot
+            is reused once the frames after it are requested, so it must be written out before then.
+            The generator must be closed before the ring, so no task still writes into a freed ring.
+    """
+    ranges = [(start + range_start, start + range_stop) for range_start, range_stop in frame_ranges(stop - start, chunksize)]
+    task_groups = (
+        [(job, range_start, range_stop, ring.descriptor, rows) for rows in job['strips']] for range_start, range_stop in ranges
+    )
+    with contextlib.closing(ordered_result_groups(executor, render_ring_range, task_groups, len(ring) // chunksize)) as results:
+        for (range_start, range_stop), group_stats in zip(ranges, results):
+            for task_stats in group_stats:
+                stats.update(task_stats)
+            for index in range(range_start, range_stop):
+                yield first_frame + index, ring.slot(index)
+
+def stream_pixel_format(tile_size, pixel_format=None):
+    """
+    Chooses the pixel format frames are streamed to ffmpeg in. yuv420p frames need even tiles, so
+    a render with odd tiles falls back to BGR frames.
+
+    Args:
+        tile_size (tuple): Size (width, height) of each tile.
+        pixel_format (str, optional): One of STREAM_PIXEL_FORMATS. Defaults to config.STREAM_PIXEL_FORMAT.
+
+    Returns:
+        str: The pixel format to stream.
+    """
+    pixel_format = pixel_format or config.STREAM_PIXEL_FORMAT
+    if pixel_format not in STREAM_PIXEL_FORMATS:
+        raise Exception(f"Unknown pixel format '{pixel_format}'. Choose one of {', '.join(STREAM_PIXEL_FORMATS)}.")
+    if pixel_format == YUV_PIXEL_FORMAT and (tile_size[0] % 2 or tile_size[1] % 2):
+        print(f"Tiles of {tile_size[0]}x{tile_size[1]} cannot be split into yuv420p planes, streaming BGR frames instead.")
+        return BGR_PIXEL_FORMAT
+    return pixel_format
+
+def stream_input_arguments(frame_dimensions, fps, pixel_format):
+    """
+    Builds the ffmpeg arguments that read the streamed frames from stdin. yuv420p frames are sent as
+    a Y4M stream, which ffmpeg encodes as it is without a colour conversion.
+
+    Args:
+        frame_dimensions (tuple): Dimensions (width, height) of the frame.
+        fps (int): Frames per second for the output video.
+        pixel_format (str): One of STREAM_PIXEL_FORMATS.
+
+    Returns:
+        list: The input arguments.
+    """
+    if pixel_format == YUV_PIXEL_FORMAT:
+        # Size and frame rate are read from the stream header
+        return ['-f', 'yuv4mpegpipe', '-i', '-']
+    return [
+        '-f', 'rawvideo',
+        '-pix_fmt', BGR_PIXEL_FORMAT,
+        '-s', f"{frame_dimensions[0]}x{frame_dimensions[1]}",
+        '-framerate', str(fps),
+        '-i', '-'
+    ]
+
+def write_stream_header(stream, frame_dimensions, fps, pixel_format):
+    """
+    Writes the Y4M stream header before the first yuv420p frame. Raw BGR streams have no header.
+
+    Args:
+        stream (file): The stdin of the ffmpeg process.
+        frame_dimensions (tuple): Dimensions (width, height) of the frame.
+        fps (int): Frames per second for the output video.
+        pixel_format (str): One of STREAM_PIXEL_FORMATS.
+    """
+    if pixel_format == YUV_PIXEL_FORMAT:
+        frame_rate = fractions.Fraction(fps).limit_denominator(1001)
+        # Chroma samples are averaged over 2x2 blocks, which is the centred siting of C420jpeg
+        stream.write(
+            f"YUV4MPEG2 W{frame_dimensions[0]} H{frame_dimensions[1]} "
+            f"F{frame_rate.numerator}:{frame_rate.denominator} Ip A1:1 C420jpeg\n".encode()
+        )
+
+def write_stream_frame(stream, frame_array, pixel_format):
+    """
+    Writes a composed frame to ffmpeg.
+
+    Args:
+        stream (file): The stdin of the ffmpeg process.
+        frame_array (numpy.ndarray): The composed frame.
+        pixel_format (str): One of STREAM_PIXEL_FORMATS.
+    """
+    if pixel_format == YUV_PIXEL_FORMAT:
+        stream.write(b'FRAME\n')
+    stream.write(np.ascontiguousarray(frame_array).data)
+
+def write_stream_frames(stream, frames, frame_dimensions, pixel_format, tracker, preview_path=None, cancelled=None):
+    """
+    Writes rendered frames to ffmpeg in order. This is the single writer of a render or segment, which
+    empties the slots of its frame ring as the workers fill them.
+
+    Args:
+        stream (file): The stdin of the ffmpeg process.
+        frames (iterable): The frame number and composed frame of every frame, from ring_frames.
+        frame_dimensions (tuple): Dimensions (width, height) of the frame.
+        pixel_format (str): One of STREAM_PIXEL_FORMATS.
+        tracker (ProgressTracker): Advanced by every frame written.
+        preview_path (str, optional): Where to save config.PREVIEW_FRAME_NUMBER as a preview image.
+        cancelled (threading.Event, optional): Stops the render when set.
+    """
+    for key, frame_array in frames:
+        if cancelled is not None and cancelled.is_set():
+            raise Exception("Render cancelled.")
+        if preview_path and key == config.PREVIEW_FRAME_NUMBER:
+            save_preview(preview_path, frame_array, frame_dimensions, pixel_format)
+        with tracing.span('write frame'):
+            write_stream_frame(stream, frame_array, pixel_format)
+        tracker.advance(1)
+
+def save_preview(preview_path, frame_array, frame_dimensions, pixel_format):
+    """
+    Saves a streamed frame as the preview image.
+
+    Args:
+        preview_path (str): Where to save the image.
+        frame_array (numpy.ndarray): The composed frame.
+        frame_dimensions (tuple): Dimensions (width, height) of the frame.
+        pixel_format (str): One of STREAM_PIXEL_FORMATS.
+    """
+    if pixel_format == YUV_PIXEL_FORMAT:
+        frame_array = yuv_frame_to_bgr(frame_array, frame_dimensions)
+    cv.imwrite(preview_path, frame_array)
 
 def get_ffmpeg_executable():
     """
     Retrieves the path to the ffmpeg executable, adjusting for whether the script is frozen (compiled) or not.
+    Outside Windows, or if the bundled ffmpeg.exe is missing, an ffmpeg found on the PATH is used instead.
 
     Returns:
         str: Absolute path to the ffmpeg executable.
@@ -142,9 +1492,79 @@ def get_ffmpeg_executable():
         base_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
         ffmpeg_exe = os.path.join(base_path, 'ffmpeg.exe')
     ffmpeg_exe = os.path.abspath(ffmpeg_exe)
+    if os.name != 'nt' or not os.path.exists(ffmpeg_exe):
+        # The bundled ffmpeg.exe only runs on Windows; elsewhere use an ffmpeg installed on the PATH
+        ffmpeg_exe = shutil.which('ffmpeg') or ffmpeg_exe
     return ffmpeg_exe
 
-def generate_video(frames_dir, fps, output_video_path, audio_path):
+def start_ffmpeg_process(ffmpeg_cmd, stdin=None):
+    """
+    Starts an ffmpeg process without opening a console window on Windows.
+
+    Args:
+        ffmpeg_cmd (list): The full ffmpeg command line.
+        stdin (int, optional): Value for the process's stdin, e.g. subprocess.PIPE when streaming frames.
+
+    Returns:
+        subprocess.Popen: The running ffmpeg process.
+    """
+    creationflags = 0
+    if os.name == 'nt':
+        creationflags = subprocess.CREATE_NO_WINDOW
+
+    return subprocess.Popen(
+        ffmpeg_cmd,
+        stdin=stdin,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        creationflags=creationflags
+    )
+
+class FFmpegMonitor:
+    """
+    Drains the output of an ffmpeg process in background threads, so it can never block on a full
+    pipe, and forwards the frame counts from its -progress output to a ProgressTracker.
+    """
+    def __init__(self, process, tracker=None):
+        """
+        Args:
+            process (subprocess.Popen): An ffmpeg process started with '-progress pipe:1'.
+            tracker (ProgressTracker, optional): Receives the number of encoded frames. Can be set later.
+        """
+        self.process = process
+        self.tracker = tracker
+        self.frames_encoded = 0
+        self.stderr_chunks = []
+        self.threads = [
+            threading.Thread(target=self._read_progress, daemon=True),
+            threading.Thread(target=lambda: self.stderr_chunks.append(process.stderr.read()), daemon=True)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def _read_progress(self):
+        for line in iter(self.process.stdout.readline, b''):
+            key, _, value = line.decode(errors='replace').strip().partition('=')
+            if key == 'frame' and value.isdigit():
+                self.frames_encoded = int(value)
+                if self.tracker is not None:
+                    self.tracker.update(self.frames_encoded)
+
+    def wait(self):
+        """
+        Waits for ffmpeg to exit.
+
+        Raises:
+            Exception: If ffmpeg exited with an error.
+        """
+        self.process.wait()
+        for thread in self.threads:
+            thread.join()
+
+        if self.process.returncode != 0:
+            raise Exception(f"FFmpeg error: {b''.join(self.stderr_chunks).decode(errors='replace')}")
+
+def generate_video(frames_dir, fps, output_video_path, audio_path, progress_callback=None):
     """
     Generates the final video by combining frames and audio using ffmpeg.
 
@@ -152,7 +1572,8 @@ def generate_video(frames_dir, fps, output_video_path, audio_path):
         frames_dir (str): Directory containing the generated frames.
         fps (int): Frames per second for the output video.
         output_video_path (str): Path to save the output video file.
-        audio_path (str): Path to the audio file to be added to the video.
+        audio_path (str): Path to the audio file to be added to the video, or None for a silent video.
+        progress_callback (callable, optional): Called with a RenderProgress as ffmpeg encodes frames.
     """
     try:
         output_dir = os.path.dirname(output_video_path)
@@ -161,54 +1582,541 @@ def generate_video(frames_dir, fps, output_video_path, audio_path):
         ffmpeg_exe = get_ffmpeg_executable()
 
         input_pattern = os.path.join(frames_dir, "frame_%05d.png")
+        total_frames = len([name for name in os.listdir(frames_dir) if name.startswith('frame_')])
+        with tracing.trace_render(os.path.splitext(os.path.basename(output_video_path))[0]):
+            audio_inputs, audio_outputs = audio_arguments(audio_path, total_frames, fps)
+            ffmpeg_cmd = [
+                ffmpeg_exe,
+                '-y',
+                '-progress', 'pipe:1',
+                '-nostats',
+                '-framerate', str(fps),
+                '-i', input_pattern,
+                *audio_inputs,
+                *video_encoder_arguments(),
+                *audio_outputs,
+                output_video_path
+            ]
+
+            with tracing.span('encode video'):
+                process = start_ffmpeg_process(ffmpeg_cmd)
+                FFmpegMonitor(process, ProgressTracker(progress_callback, ENCODE_STAGE, total_frames)).wait()
+
+    except Exception as e:
+        # The frames and their manifest are kept, so a retry only has to encode them again
+        raise e
+
+    cleanup()
+
+def audio_cache_file_name(source_hash):
+    """
+    Builds the cache file name of an encoded soundtrack.
+
+    Args:
+        source_hash (str): SHA-256 hash of the audio file.
+
+    Returns:
+        str: The file name of the cache entry.
+    """
+    return f"audio-aac-v{AUDIO_CACHE_VERSION}-{source_hash[:16]}{AUDIO_CACHE_EXTENSION}"
+
+def get_encoded_audio_path(audio_path):
+    """
+    Returns the soundtrack encoded to AAC, encoding it the first time it is requested. The encoded audio
+    is cached next to the pixel data at its full length, so every later video only copies it into the
+    output instead of encoding the soundtrack again, whatever its length.
+
+    Args:
+        audio_path (str): Path to the audio file.
+
+    Returns:
+        str: Path to the encoded audio file.
+    """
+    cache_path = os.path.join(config.PIXEL_CACHE_DIR, audio_cache_file_name(pixel_cache.hash_file(audio_path)))
+    if not os.path.exists(cache_path):
+        os.makedirs(config.PIXEL_CACHE_DIR, exist_ok=True)
+        # Written under a temporary name, so an interrupted encode never leaves a truncated entry
+        temp_path = f"{cache_path}.{os.getpid()}.tmp"
         ffmpeg_cmd = [
-            ffmpeg_exe,
+            get_ffmpeg_executable(),
             '-y',
-            '-framerate', str(fps),
-            '-i', input_pattern,
+            '-progress', 'pipe:1',
+            '-nostats',
             '-i', audio_path,
-            '-c:v', 'libx264',
-            '-pix_fmt', 'yuv420p',
+            '-vn',
             '-c:a', 'aac',
             '-strict', 'experimental',
-            '-shortest',
-            output_video_path
+            '-f', 'mp4',
+            temp_path
         ]
+        try:
+            with tracing.span('encode audio'):
+                FFmpegMonitor(start_ffmpeg_process(ffmpeg_cmd)).wait()
+            os.replace(temp_path, cache_path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        print(f"Cached the soundtrack in '{cache_path}'.")
+
+    return cache_path
+
+def audio_arguments(audio_path, frame_count, fps):
+    """
+    Builds the ffmpeg arguments that add the soundtrack to the output video. The soundtrack is taken
+    from the audio cache already encoded, and copied into the output up to the end of the last frame.
+
+    The length of the output is set by the video's frame count. Ending it on the shortest stream would
+    drop the last frames whenever the AAC stream ends a little before the video.
+
+    Args:
+        audio_path (str): Path to the audio file, or None for a silent video.
+        frame_count (int): Number of frames in the video.
+        fps (float): Frames per second of the video.
+
+    Returns:
+        tuple: The extra input arguments and the audio output arguments.
+    """
+    if audio_path is None:
+        return [], ['-an']
+    audio_inputs = ['-t', f"{frame_count / fps:.6f}", '-i', get_encoded_audio_path(audio_path)]
+    return audio_inputs, ['-frames:v', str(frame_count), '-c:a', 'copy']
+
+def video_encoder_arguments(threads=None, keyframe_interval=None):
+    """
+    Builds the ffmpeg arguments that encode the video stream with libx264.
 
-        creationflags = 0
-        if os.name == 'nt':
-            creationflags = subprocess.CREATE_NO_WINDOW
+    Args:
+        threads (int, optional): Number of x264 threads. Defaults to config.X264_THREADS, or x264's own choice.
+        keyframe_interval (int, optional): Longest distance in frames between keyframes. x264 still adds
+            keyframes at scene cuts in between, as in an encode with its own default interval.
+
+    Returns:
+        list: The video output arguments.
+    """
+    video_outputs = ['-c:v', 'libx264', '-preset', config.X264_PRESET, '-crf', str(config.X264_CRF)]
+    threads = threads or config.X264_THREADS
+    if threads:
+        video_outputs += ['-threads', str(threads)]
+    if keyframe_interval:
+        video_outputs += ['-g', str(keyframe_interval)]
+    return video_outputs + ['-pix_fmt', 'yuv420p']
 
-        process = subprocess.Popen(
-            ffmpeg_cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            creationflags=creationflags
+def encode_stream(executor, pixel_data, tile_size, frame_dimensions, user_img_array, gray_user_img_array, fps,
+                  output_video_path, audio_path, engine=None, max_in_flight=None, chunksize=None, progress_callback=None,
+                  preview_path=None, segments=None, pixel_format=None, workers=None):
+    """
+    Renders all frames on an existing executor and pipes them into ffmpeg, as a Y4M stream of yuv420p
+    frames or as raw bgr24 video.
+
+    This is the part of stream_video that does not own any global state, so it can be called repeatedly
+    on a long-lived process pool and never touches the shared upload or frame directories.
+
+    Args:
+        executor (concurrent.futures.Executor): The process or thread pool that composes the frames.
+        pixel_data (PixelData): The pixel data of the render.
+        tile_size (tuple): Size (width, height) of each tile.
+        frame_dimensions (tuple): Dimensions (width, height) of the frame.
+        user_img_array (numpy.ndarray): User image array.
+        gray_user_img_array (numpy.ndarray): Grayscale user image array.
+        fps (int): Frames per second for the output video.
+        output_video_path (str): Path to save the output video file.
+        audio_path (str): Path to the audio file to be added to the video, or None for a silent video.
+        engine (str, optional): Name of the compositing engine to use. Defaults to config.COMPOSITING_ENGINE.
+        max_in_flight (int, optional): Maximum number of frames rendered ahead of the encoder.
+            Defaults to what fits in config.RENDER_MEMORY_BUDGET.
+        chunksize (int, optional): Number of frames per pool task. Defaults to config.TASK_CHUNKSIZE.
+        progress_callback (callable, optional): Called with a RenderProgress as frames are rendered, and
+            while ffmpeg finishes encoding after the last frame.
+        preview_path (str, optional): Where to save config.PREVIEW_FRAME_NUMBER as a preview image.
+        segments (int, optional): Number of segments encoded at a time by encode_segments. With 1 and no
+            config.CHECKPOINT_SEGMENT_SECONDS, the video is encoded in a single ffmpeg process without
+            checkpoints. Defaults to config.ENCODE_SEGMENTS.
+        pixel_format (str, optional): One of STREAM_PIXEL_FORMATS. Defaults to config.STREAM_PIXEL_FORMAT,
+            or BGR frames if the tiles are not even.
+        workers (int, optional): Number of workers of the executor, which the tasks and the frame ring are
+            sized for. Defaults to config.NUM_PROCESSES.
+    """
+    if not len(pixel_data):
+        raise Exception("The pixel data has no frames to render.")
+    segments = segments or config.ENCODE_SEGMENTS
+    pixel_format = stream_pixel_format(tile_size, pixel_format)
+    if segments > 1 or config.CHECKPOINT_SEGMENT_SECONDS:
+        return encode_segments(
+            executor, pixel_data, tile_size, frame_dimensions, user_img_array, gray_user_img_array, fps,
+            output_video_path, audio_path, engine=engine, max_in_flight=max_in_flight, chunksize=chunksize,
+            progress_callback=progress_callback, preview_path=preview_path, segments=segments,
+            pixel_format=pixel_format, workers=workers
         )
 
-        stdout, stderr = process.communicate()
+    chunksize, slot_count = render_window(frame_dimensions, chunksize, max_in_flight, pixel_format=pixel_format, workers=workers)
 
-        if process.returncode != 0:
-            raise Exception(f"FFmpeg error: {stderr.decode()}")
+    output_dir = os.path.dirname(output_video_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    audio_inputs, audio_outputs = audio_arguments(audio_path, len(pixel_data), fps)
+    ffmpeg_cmd = [
+        get_ffmpeg_executable(),
+        '-y',
+        '-progress', 'pipe:1',
+        '-nostats',
+        *stream_input_arguments(frame_dimensions, fps, pixel_format),
+        *audio_inputs,
+        *video_encoder_arguments(),
+        *audio_outputs,
+        output_video_path
+    ]
+
+    process = start_ffmpeg_process(ffmpeg_cmd, stdin=subprocess.PIPE)
+    monitor = FFmpegMonitor(process)
+
+    try:
+        with shared_render_job(
+            pixel_data, tile_size, frame_dimensions, user_img_array, gray_user_img_array, engine, pixel_format=pixel_format
+        ) as job, FrameRing(slot_count, frame_shape(frame_dimensions, pixel_format)) as ring:
+            start_time = time.perf_counter()
+            tracker = ProgressTracker(progress_callback, RENDER_STAGE, len(pixel_data))
+            stats = collections.Counter()
+            write_stream_header(process.stdin, frame_dimensions, fps, pixel_format)
+            with contextlib.closing(
+                ring_frames(executor, job, ring, 0, len(pixel_data), chunksize, stats, pixel_data.first_frame)
+            ) as frames:
+                write_stream_frames(process.stdin, frames, frame_dimensions, pixel_format, tracker, preview_path)
+            report_dispatch(
+                len(pixel_data), -(-len(pixel_data) // chunksize) * len(job['strips']), chunksize,
+                (job, 0, chunksize, ring.descriptor, job['strips'][0]), time.perf_counter() - start_time, stats,
+                job['strips']
+            )
+    except BrokenPipeError:
+        pass
+    except BaseException:
+        process.kill()
+        raise
+    finally:
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+
+    # Rendering is done; report the frames ffmpeg still has to flush through the encoder
+    frames_encoded = monitor.frames_encoded
+    monitor.tracker = ProgressTracker(progress_callback, ENCODE_STAGE, len(pixel_data), start_frames=frames_encoded)
+    monitor.tracker.update(frames_encoded)
+    with tracing.span('flush encoder'):
+        monitor.wait()
+
+def segment_bounds(frame_count, segments, keyframe_interval):
+    """
+    Splits the timeline into segments that start on keyframe boundaries.
+
+    Args:
+        frame_count (int): Number of frames in the video.
+        segments (int): Desired number of segments.
+        keyframe_interval (int): Distance in frames between keyframes.
+
+    Returns:
+        list: The (start, stop) frame indices of every segment. There can be fewer segments than requested
+            when the video is too short to give each of them a whole keyframe interval, and none without frames.
+    """
+    if frame_count <= 0:
+        return []
+    intervals = -(-frame_count // keyframe_interval)
+    segment_length = -(-intervals // max(1, segments)) * keyframe_interval
+    return [(start, min(start + segment_length, frame_count)) for start in range(0, frame_count, segment_length)]
+
+def plan_segments(frame_count, fps, segments):
+    """
+    Splits the timeline of a segmented encode into at least the given number of segments, and more
+    where config.CHECKPOINT_SEGMENT_SECONDS caps their length.
+
+    Args:
+        frame_count (int): Number of frames in the video.
+        fps (float): Frames per second of the video.
+        segments (int): Number of segments encoded at a time.
+
+    Returns:
+        list: The (start, stop) frame indices of every segment, from segment_bounds.
+    """
+    keyframe_interval = max(1, round(fps * config.KEYFRAME_INTERVAL_SECONDS))
+    if config.CHECKPOINT_SEGMENT_SECONDS:
+        checkpoint_frames = max(1, round(fps * config.CHECKPOINT_SEGMENT_SECONDS))
+        segments = max(segments, -(-frame_count // checkpoint_frames))
+    return segment_bounds(frame_count, segments, keyframe_interval)
+
+def concat_list_entry(path):
+    """
+    Formats a file for an ffmpeg concat demuxer list, escaping quotes in its path.
+
+    Args:
+        path (str): Path to the file.
+
+    Returns:
+        str: The line of the list.
+    """
+    escaped_path = os.path.abspath(path).replace('\\', '/').replace("'", "'\\''")
+    return f"file '{escaped_path}'\n"
+
+def encode_segments(executor, pixel_data, tile_size, frame_dimensions, user_img_array, gray_user_img_array, fps,
+                    output_video_path, audio_path, engine=None, max_in_flight=None, chunksize=None, progress_callback=None,
+                    preview_path=None, segments=None, pixel_format=None, workers=None):
+    """
+    Renders all frames on an existing executor and encodes the timeline as segments in ffmpeg processes
+    of their own, several at a time, which are then joined with the concat demuxer while the audio is
+    muxed in once.
+
+    Segments are whole multiples of the longest keyframe interval and start on a keyframe of their own,
+    which is where they are joined. Within a segment x264 places keyframes at scene cuts as in a single
+    encode, so the joined video only adds a keyframe at every join. No segment is longer than
+    config.CHECKPOINT_SEGMENT_SECONDS, and finished segments are recorded in a manifest next to the
+    output, so an interrupted render of the same inputs only encodes the rest.
+
+    Args:
+        executor (concurrent.futures.Executor): The process or thread pool that composes the frames.
+        pixel_data (PixelData): The pixel data of the render.
+        tile_size (tuple): Size (width, height) of each tile.
+        frame_dimensions (tuple): Dimensions (width, height) of the frame.
+        user_img_array (numpy.ndarray): User image array.
+        gray_user_img_array (numpy.ndarray): Grayscale user image array.
+        fps (int): Frames per second for the output video.
+        output_video_path (str): Path to save the output video file.
+        audio_path (str): Path to the audio file to be added to the video, or None for a silent video.
+        engine (str, optional): Name of the compositing engine to use. Defaults to config.COMPOSITING_ENGINE.
+        max_in_flight (int, optional): Maximum number of frames rendered ahead of the encoders, over all segments.
+            Defaults to what fits in config.RENDER_MEMORY_BUDGET.
+        chunksize (int, optional): Number of frames per pool task. Defaults to config.TASK_CHUNKSIZE.
+        progress_callback (callable, optional): Called with a RenderProgress as frames are rendered, and
+            while the encoders finish after the last frame.
+        preview_path (str, optional): Where to save config.PREVIEW_FRAME_NUMBER as a preview image.
+        segments (int, optional): Number of segments encoded at a time. The timeline is split into at least
+            this many. Defaults to config.ENCODE_SEGMENTS.
+        pixel_format (str, optional): One of STREAM_PIXEL_FORMATS. Defaults to config.STREAM_PIXEL_FORMAT,
+            or BGR frames if the tiles are not even.
+        workers (int, optional): Number of workers of the executor, which the tasks and the frame rings are
+            sized for. Defaults to config.NUM_PROCESSES.
+    """
+    if not len(pixel_data):
+        raise Exception("The pixel data has no frames to render.")
+    segments = segments or config.ENCODE_SEGMENTS
+    pixel_format = stream_pixel_format(tile_size, pixel_format)
+    keyframe_interval = max(1, round(fps * config.KEYFRAME_INTERVAL_SECONDS))
+    # Every segment encoded at a time needs a ring slot of its own, so frames too large for the budget get fewer
+    _, frames_in_flight = render_window(frame_dimensions, chunksize, max_in_flight, pixel_format=pixel_format, workers=workers)
+    parallel_segments = min(segments, frames_in_flight)
+    bounds = plan_segments(len(pixel_data), fps, parallel_segments)
+    parallel_segments = min(parallel_segments, len(bounds))
+    threads = config.X264_THREADS or max(1, (os.cpu_count() or 1) // parallel_segments)
+    # The ring slots are shared out between the segments encoded at a time, so memory use does not grow with their number
+    chunksize, slot_count = render_window(
+        frame_dimensions, chunksize, max_in_flight, segments=parallel_segments, pixel_format=pixel_format, workers=workers
+    )
+
+    output_dir = os.path.dirname(output_video_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    segments_dir = output_video_path + '.segments'
+    segment_path = lambda start: os.path.join(segments_dir, f"segment_{start:05d}.mp4")
+
+    manifest = checkpoint.RenderManifest(segments_dir, checkpoint.render_inputs(
+        pixel_data, tile_size, frame_dimensions, user_img_array, gray_user_img_array,
+        fps=fps, segments=bounds, encoder=video_encoder_arguments(keyframe_interval=keyframe_interval),
+        pixel_format=pixel_format
+    ))
+    pending_bounds = [
+        (start, stop) for start, stop in bounds
+        if not (manifest.is_complete(start, stop) and os.path.exists(segment_path(start)))
+    ]
+    frames_skipped = len(pixel_data) - sum(stop - start for start, stop in pending_bounds)
+    if frames_skipped:
+        print(f"Resuming render: {len(bounds) - len(pending_bounds)} of {len(bounds)} segments are already encoded.")
+    preview_index = config.PREVIEW_FRAME_NUMBER - pixel_data.first_frame
+    if preview_path and 0 <= preview_index < len(pixel_data) and not any(
+        start <= preview_index < stop for start, stop in pending_bounds
+    ):
+        # The preview frame is in a segment that is already encoded, so it is composed on its own
+        cv.imwrite(preview_path, compose_frame(
+            pixel_data.frame_bits(preview_index), tile_size, frame_dimensions, user_img_array, gray_user_img_array,
+            engine=engine, palette=tiles.build_palette(user_img_array, gray_user_img_array, pixel_data.levels)
+        ))
+
+    manifest_lock = threading.Lock()
+    render_tracker = ProgressTracker(progress_callback, RENDER_STAGE, len(pixel_data), start_frames=frames_skipped)
+    monitors = []
+    stats = collections.Counter()
+    cancelled = threading.Event()
+
+    def encode_segment(job, start, stop):
+        ffmpeg_cmd = [
+            get_ffmpeg_executable(),
+            '-y',
+            '-progress', 'pipe:1',
+            '-nostats',
+            *stream_input_arguments(frame_dimensions, fps, pixel_format),
+            *video_encoder_arguments(threads, keyframe_interval),
+            '-an',
+            segment_path(start)
+        ]
+        process = start_ffmpeg_process(ffmpeg_cmd, stdin=subprocess.PIPE)
+        monitor = FFmpegMonitor(process)
+        monitors.append(monitor)
+
+        segment_stats = collections.Counter()
+        try:
+            with FrameRing(slot_count, frame_shape(frame_dimensions, pixel_format)) as ring:
+                write_stream_header(process.stdin, frame_dimensions, fps, pixel_format)
+                with contextlib.closing(
+                    ring_frames(executor, job, ring, start, stop, chunksize, segment_stats, pixel_data.first_frame)
+                ) as frames:
+                    write_stream_frames(
+                        process.stdin, frames, frame_dimensions, pixel_format, render_tracker, preview_path, cancelled
+                    )
+        except BrokenPipeError:
+            pass
+        except BaseException:
+            process.kill()
+            raise
+        finally:
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+
+        with tracing.span('flush encoder', start=start, stop=stop):
+            monitor.wait()
+        with manifest_lock:
+            stats.update(segment_stats)
+            manifest.mark_complete(start, stop)
+
+    start_time = time.perf_counter()
+    with shared_render_job(
+        pixel_data, tile_size, frame_dimensions, user_img_array, gray_user_img_array, engine, pixel_format=pixel_format
+    ) as job:
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(1, min(parallel_segments, len(pending_bounds))), thread_name_prefix='segment'
+        ) as segment_executor:
+            futures = [segment_executor.submit(encode_segment, job, start, stop) for start, stop in pending_bounds]
+            try:
+                encode_tracker = None
+                while True:
+                    done, not_done = concurrent.futures.wait(futures, timeout=0.2, return_when=concurrent.futures.FIRST_EXCEPTION)
+                    for future in done:
+                        # Stops the other segments and raises the first error
+                        future.result()
+                    if not not_done:
+                        break
+                    if render_tracker.frames_done >= len(pixel_data):
+                        # Rendering is done; report the frames the encoders still have to flush
+                        frames_encoded = frames_skipped + sum(monitor.frames_encoded for monitor in monitors)
+                        if encode_tracker is None:
+                            encode_tracker = ProgressTracker(progress_callback, ENCODE_STAGE, len(pixel_data), start_frames=frames_encoded)
+                        encode_tracker.update(frames_encoded)
+            except BaseException:
+                cancelled.set()
+                for monitor in monitors:
+                    monitor.process.kill()
+                raise
+
+        if pending_bounds:
+            task_count = sum(-(-(stop - start) // chunksize) for start, stop in pending_bounds) * len(job['strips'])
+            report_dispatch(
+                len(pixel_data) - frames_skipped, task_count, chunksize, (job, 0, chunksize, None, job['strips'][0]),
+                time.perf_counter() - start_time, stats, job['strips']
+            )
+
+    concat_list_path = os.path.join(segments_dir, 'segments.txt')
+    with open(concat_list_path, 'w') as file:
+        file.writelines(concat_list_entry(segment_path(start)) for start, _ in bounds)
+
+    audio_inputs, audio_outputs = audio_arguments(audio_path, len(pixel_data), fps)
+    ffmpeg_cmd = [
+        get_ffmpeg_executable(),
+        '-y',
+        '-progress', 'pipe:1',
+        '-nostats',
+        '-f', 'concat',
+        '-safe', '0',
+        '-i', concat_list_path,
+        *audio_inputs,
+        '-c:v', 'copy',
+        *audio_outputs,
+        output_video_path
+    ]
+    with tracing.span('join segments'):
+        FFmpegMonitor(start_ffmpeg_process(ffmpeg_cmd)).wait()
+    shutil.rmtree(segments_dir, ignore_errors=True)
+
+def stream_video(pixel_data_path, output_resolution, fps, output_video_path, audio_path, engine=None, max_in_flight=None,
+                 chunksize=None, grid_size=None, progress_callback=None, segments=None, image=None):
+    """
+    Renders all frames and pipes them straight into ffmpeg, so rendering and encoding overlap and no
+    intermediate frames are written to disk.
+
+    Args:
+        pixel_data_path (str): Path to the pixel data file, in the binary or the legacy pickle format.
+            If None, pixel data for grid_size at the output frame rate is taken from the pixel data cache.
+        output_resolution (tuple): Desired output resolution (width, height) for the frames.
+        fps (int): Frames per second for the output video.
+        output_video_path (str): Path to save the output video file.
+        audio_path (str): Path to the audio file to be added to the video.
+        engine (str, optional): Name of the compositing engine to use. Defaults to config.COMPOSITING_ENGINE.
+        max_in_flight (int, optional): Maximum number of frames rendered ahead of the encoder.
+            Defaults to what fits in config.RENDER_MEMORY_BUDGET.
+        chunksize (int, optional): Number of frames per pool task. Defaults to config.TASK_CHUNKSIZE.
+        grid_size (tuple, optional): Dimensions (columns, rows) of the tile grid when no pixel data file is given.
+        progress_callback (callable, optional): Called with a RenderProgress as frames are rendered, and
+            while ffmpeg finishes encoding after the last frame.
+        segments (int, optional): Number of segments encoded in parallel. Defaults to config.ENCODE_SEGMENTS.
+        image (str, PIL.Image.Image or numpy.ndarray, optional): The user's image, turned into tiles in memory.
+            Defaults to the files saved in config.UPLOAD_DIR.
+    """
+    global executor_reference
+
+    try:
+        with tracing.trace_render(os.path.splitext(os.path.basename(output_video_path))[0]):
+            pixel_data, tile_size, adjusted_frame_dimensions, user_img_array, gray_user_img_array = prepare_render(
+                pixel_data_path, output_resolution, grid_size, fps, image,
+                even_tiles=config.STREAM_PIXEL_FORMAT == YUV_PIXEL_FORMAT
+            )
+            pixel_format = stream_pixel_format(tile_size)
+
+            executor, plan = create_render_executor(
+                pixel_data, tile_size, adjusted_frame_dimensions, user_img_array, gray_user_img_array, engine,
+                pixel_format=pixel_format
+            )
+            executor_reference = executor
+
+            try:
+                encode_stream(
+                    executor, pixel_data, tile_size, adjusted_frame_dimensions, user_img_array, gray_user_img_array, fps,
+                    output_video_path, audio_path, engine=engine, max_in_flight=max_in_flight, chunksize=chunksize,
+                    progress_callback=progress_callback, preview_path=config.VIDEO_PREVIEW_FILE, segments=segments,
+                    pixel_format=pixel_format, workers=plan.workers
+                )
+            finally:
+                executor.shutdown(wait=True, cancel_futures=True)
+                executor_reference = None
 
-    except Exception as e:
-        raise e
     finally:
-        cleanup()
+        # Streamed renders never write frames, so the checkpointed frames of an interrupted png render stay
+        cleanup(keep_frames=True)
 
-def cleanup():
+def cleanup(keep_frames=False):
     """
     Cleans up temporary directories and files used during the video generation process.
+
+    Args:
+        keep_frames (bool, optional): Leave PROCESSED_FRAMES_DIR and its manifest in place, so an
+            interrupted png render of the same inputs can still resume from them.
     """
     try:
         shutil.rmtree(config.UPLOAD_DIR)
     except Exception:
         pass
 
-    try:
-        shutil.rmtree(config.PROCESSED_FRAMES_DIR)
-    except Exception:
-        pass
+    if not keep_frames:
+        try:
+            shutil.rmtree(config.PROCESSED_FRAMES_DIR)
+        except Exception:
+            pass
 
     try:
         shutil.rmtree(config.PYCACHE_DIR)
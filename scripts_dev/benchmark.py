@@ -0,0 +1,330 @@
+import argparse
+import collections
+import glob
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2 as cv
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'bad_apple_mosaic')))
+
+import config
+import video_generator
+from fixtures import synthetic_tiles
+from pixel_data import load_pixel_data
+
+STAGES = ['load', 'compose', 'write', 'dispatch', 'encode']
+DEFAULT_RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_results')
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+def reset_peak_rss():
+    """
+    Resets the peak RSS of the current process where the OS allows it (Linux), so every stage
+    reports its own peak instead of the peak of the whole benchmark run.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as file:
+            file.write('5')
+    except OSError:
+        pass
+
+def peak_rss_mb(children=False):
+    """
+    Returns the peak resident set size of this process, or of its finished child processes.
+
+    Args:
+        children (bool, optional): Report the largest finished child process instead.
+
+    Returns:
+        float: Peak RSS in MiB, or None if it cannot be measured on this platform.
+    """
+    if resource is not None:
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+        # ru_maxrss is in KiB on Linux and in bytes on macOS
+        scale = 1 if sys.platform == 'darwin' else 1024
+        return usage.ru_maxrss * scale / (1024 * 1024)
+    if psutil is not None and not children:
+        memory_info = psutil.Process().memory_info()
+        return getattr(memory_info, 'peak_wset', memory_info.rss) / (1024 * 1024)
+    return None
+
+def find_presets(pixel_data_dir):
+    """
+    Lists the shipped pixel data presets, preferring the binary file when both formats exist.
+
+    Args:
+        pixel_data_dir (str): Directory containing the pixel data files.
+
+    Returns:
+        dict: Preset name (e.g. '48p30fps') mapped to the paths of its files, binary first.
+    """
+    presets = {}
+    for path in sorted(glob.glob(os.path.join(pixel_data_dir, 'pixel_data@*'))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        presets.setdefault(name.split('@', 1)[1], []).append(path)
+    for paths in presets.values():
+        paths.sort(key=lambda path: not path.endswith('.bapd'))
+    return presets
+
+def sample_indices(frame_count, num_frames):
+    """
+    Picks frames spread evenly over the whole clip, so quiet and busy passages are both measured.
+
+    Args:
+        frame_count (int): Number of frames in the pixel data.
+        num_frames (int): Number of frames to sample.
+
+    Returns:
+        list: The sampled frame indices.
+    """
+    return sorted(set(np.linspace(0, frame_count - 1, min(num_frames, frame_count)).astype(int).tolist()))
+
+def timed(stage, fn, frames, **details):
+    """
+    Runs one benchmark stage and measures its throughput and memory.
+
+    Args:
+        stage (str): Name of the stage.
+        fn (callable): The work to measure.
+        frames (int): Number of frames processed by fn, used for frames/sec.
+        **details: Extra fields describing the case.
+
+    Returns:
+        dict: The result record of the stage.
+    """
+    reset_peak_rss()
+    start_time = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start_time
+    record = {
+        'stage': stage,
+        **details,
+        'frames': frames,
+        'seconds': round(elapsed, 4),
+        'frames_per_second': round(frames / elapsed, 2) if elapsed > 0 else None,
+        'peak_rss_mb': peak_rss_mb()
+    }
+    print(f"{stage:<9} {json.dumps(details, sort_keys=True):<80} {record['frames_per_second']!s:>10} fps")
+    return record
+
+def bench_load(results, preset, paths, args):
+    """
+    Measures how fast each file of a preset loads, in frames/sec.
+    """
+    for path in paths:
+        pixel_data = load_pixel_data(path)
+        results.append(timed(
+            'load', lambda: [load_pixel_data(path) for _ in range(args.repeat)], len(pixel_data) * args.repeat,
+            preset=preset, format=os.path.splitext(path)[1]
+        ))
+
+def bench_compose(results, preset, pixel_data, resolution_name, tile_size, frame_dimensions, indices, args):
+    """
+    Measures per-frame composition with every selected compositing engine.
+    """
+    user_tile, gray_tile = synthetic_tiles(tile_size)
+    bits = [pixel_data.frame_bits(index) for index in indices]
+    for engine in args.engines:
+        results.append(timed(
+            'compose',
+            lambda: [video_generator.compose_frame(frame_bits, tile_size, frame_dimensions, user_tile, gray_tile, engine) for frame_bits in bits],
+            len(bits), preset=preset, resolution=resolution_name, engine=engine
+        ))
+
+def bench_write(results, preset, pixel_data, resolution_name, tile_size, frame_dimensions, indices, args):
+    """
+    Measures writing composed frames as PNG files against writing them as raw bytes.
+    """
+    user_tile, gray_tile = synthetic_tiles(tile_size)
+    frames = [
+        video_generator.compose_frame(pixel_data.frame_bits(index), tile_size, frame_dimensions, user_tile, gray_tile)
+        for index in indices[:args.write_frames]
+    ]
+    with tempfile.TemporaryDirectory() as temp_dir:
+        def write_png():
+            for number, frame in enumerate(frames):
+                cv.imwrite(os.path.join(temp_dir, f"frame_{number:05d}.png"), frame, [cv.IMWRITE_PNG_COMPRESSION, 1])
+
+        def write_raw():
+            with open(os.path.join(temp_dir, 'frames.raw'), 'wb') as file:
+                for frame in frames:
+                    file.write(frame.tobytes())
+
+        results.append(timed('write', write_png, len(frames), preset=preset, resolution=resolution_name, format='png'))
+        results.append(timed('write', write_raw, len(frames), preset=preset, resolution=resolution_name, format='raw'))
+
+def bench_dispatch(results, preset, pixel_data, resolution_name, tile_size, frame_dimensions, args):
+    """
+    Measures rendering through the process pool into a shared frame ring, including task dispatch and
+    handing the frames out in order, the way a streamed render does.
+    """
+    user_tile, gray_tile = synthetic_tiles(tile_size)
+    frame_count = min(args.frames, len(pixel_data))
+
+    def dispatch():
+        with video_generator.create_process_pool() as executor:
+            with video_generator.shared_render_job(pixel_data, tile_size, frame_dimensions, user_tile, gray_tile) as job:
+                chunksize, slot_count = video_generator.render_window(frame_dimensions, args.chunksize)
+                with video_generator.FrameRing(slot_count, video_generator.frame_shape(frame_dimensions)) as ring:
+                    frames = video_generator.ring_frames(executor, job, ring, 0, frame_count, chunksize, collections.Counter())
+                    collections.deque(frames, maxlen=0)
+
+    record = timed('dispatch', dispatch, frame_count, preset=preset, resolution=resolution_name, chunksize=args.chunksize)
+    record['children_peak_rss_mb'] = peak_rss_mb(children=True)
+    results.append(record)
+
+def bench_encode(results, preset, pixel_data, resolution_name, tile_size, frame_dimensions, indices, args):
+    """
+    Measures libx264 encoding of raw frames piped into ffmpeg.
+    """
+    if args.ffmpeg is None:
+        return
+    user_tile, gray_tile = synthetic_tiles(tile_size)
+    frames = [
+        video_generator.compose_frame(pixel_data.frame_bits(index), tile_size, frame_dimensions, user_tile, gray_tile)
+        for index in indices[:args.encode_frames]
+    ]
+
+    def encode():
+        process = subprocess.Popen(
+            [
+                args.ffmpeg, '-y', '-loglevel', 'error',
+                '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f"{frame_dimensions[0]}x{frame_dimensions[1]}",
+                '-framerate', str(pixel_data.fps or 30), '-i', '-',
+                '-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-f', 'null', os.devnull
+            ],
+            stdin=subprocess.PIPE
+        )
+        for frame in frames:
+            process.stdin.write(frame.tobytes())
+        process.stdin.close()
+        if process.wait() != 0:
+            raise Exception("FFmpeg error during the encode benchmark.")
+
+    results.append(timed('encode', encode, len(frames), preset=preset, resolution=resolution_name, codec='libx264'))
+
+def find_ffmpeg(requested):
+    """
+    Locates an ffmpeg executable for the encode stage.
+
+    Args:
+        requested (str): Path given on the command line, or None.
+
+    Returns:
+        str: Path to ffmpeg, or None if none could be found.
+    """
+    for candidate in (requested, video_generator.get_ffmpeg_executable(), shutil.which('ffmpeg')):
+        if candidate and os.path.exists(candidate):
+            return candidate
+    return None
+
+def compare(current, baseline_path):
+    """
+    Prints the speed-up of every case relative to a previous results file.
+
+    Args:
+        current (list): Result records of this run.
+        baseline_path (str): Path to a results file written by an earlier run.
+    """
+    with open(baseline_path) as file:
+        baseline = json.load(file)['results']
+
+    def case_key(record):
+        return tuple(sorted((key, str(value)) for key, value in record.items() if key not in (
+            'frames', 'seconds', 'frames_per_second', 'peak_rss_mb', 'children_peak_rss_mb'
+        )))
+
+    baseline_by_case = {case_key(record): record for record in baseline}
+    print(f"\nComparison with '{baseline_path}':")
+    for record in current:
+        old = baseline_by_case.get(case_key(record))
+        if old and old['frames_per_second'] and record['frames_per_second']:
+            ratio = record['frames_per_second'] / old['frames_per_second']
+            print(f"{' '.join(value for _, value in case_key(record)):<70} {ratio:6.2f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the rendering and encoding stages of Bad Appleify.")
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    parser.add_argument('--presets', nargs='+', help="Pixel data presets to run, e.g. 48p30fps. Defaults to all shipped presets.")
+    parser.add_argument('--resolutions', nargs='+', choices=list(config.OUTPUT_RESOLUTION_DIMENSIONS), default=list(config.OUTPUT_RESOLUTION_DIMENSIONS))
+    parser.add_argument('--engines', nargs='+', choices=list(video_generator.COMPOSITING_ENGINES), default=list(video_generator.COMPOSITING_ENGINES))
+    parser.add_argument('--frames', type=int, default=200, help="Frames per compose and dispatch case.")
+    parser.add_argument('--write-frames', type=int, default=30, help="Frames per write case.")
+    parser.add_argument('--encode-frames', type=int, default=60, help="Frames per encode case.")
+    parser.add_argument('--repeat', type=int, default=3, help="Repetitions of the load stage.")
+    parser.add_argument('--chunksize', type=int, default=config.TASK_CHUNKSIZE)
+    parser.add_argument('--ffmpeg', help="Path to ffmpeg for the encode stage.")
+    parser.add_argument('--output', help="Results file. Defaults to a timestamped file in scripts_dev/benchmark_results.")
+    parser.add_argument('--compare', help="Results file of an earlier run to compare against.")
+    args = parser.parse_args()
+    args.ffmpeg = find_ffmpeg(args.ffmpeg)
+    if 'encode' in args.stages and args.ffmpeg is None:
+        print("ffmpeg not found, skipping the encode stage.")
+
+    presets = find_presets(config.PIXEL_DATA_DIR)
+    if args.presets:
+        presets = {name: paths for name, paths in presets.items() if name in args.presets}
+
+    results = []
+    for preset, paths in presets.items():
+        if 'load' in args.stages:
+            bench_load(results, preset, paths, args)
+
+        pixel_data = load_pixel_data(paths[0])
+        indices = sample_indices(len(pixel_data), args.frames)
+        for resolution_name in args.resolutions:
+            try:
+                tile_size, frame_dimensions = video_generator.compute_tile_layout(
+                    pixel_data.frame_dimensions, config.OUTPUT_RESOLUTION_DIMENSIONS[resolution_name]
+                )
+            except Exception as e:
+                print(f"Skipping {preset} at {resolution_name}: {e}")
+                continue
+            case = (preset, pixel_data, resolution_name, tile_size, frame_dimensions)
+            if 'compose' in args.stages:
+                bench_compose(results, *case, indices, args)
+            if 'write' in args.stages:
+                bench_write(results, *case, indices, args)
+            if 'dispatch' in args.stages:
+                bench_dispatch(results, *case, args)
+            if 'encode' in args.stages:
+                bench_encode(results, *case, indices, args)
+
+    output_path = args.output or os.path.join(DEFAULT_RESULTS_DIR, time.strftime("benchmark_%Y%m%d_%H%M%S.json"))
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, 'w') as file:
+        json.dump({
+            'created': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'machine': {
+                'platform': platform.platform(),
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'opencv': cv.__version__,
+                'cpu_count': os.cpu_count(),
+                'num_processes': config.NUM_PROCESSES
+            },
+            'results': results
+        }, file, indent=2)
+    print(f"\nResults saved to '{output_path}'.")
+
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == '__main__':
+    main()
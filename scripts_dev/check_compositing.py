@@ -0,0 +1,181 @@
+import argparse
+import collections
+import concurrent.futures
+import itertools
+import os
+import sys
+
+import cv2 as cv
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'bad_apple_mosaic')))
+
+import tiles
+import video_generator
+from fixtures import synthetic_pixel_data, synthetic_tiles
+
+def compare_frames(name, frames, expected):
+    """
+    Compares composed frames with the reference frames.
+
+    Returns:
+        list: A description of the first mismatch, or nothing if every frame is bit-exact.
+    """
+    if len(frames) != len(expected):
+        return [f"{name}: composed {len(frames)} frames, expected {len(expected)}"]
+    for index, (frame, expected_frame) in enumerate(zip(frames, expected)):
+        if frame.shape != expected_frame.shape:
+            return [f"{name}: frame {index} has shape {frame.shape}, expected {expected_frame.shape}"]
+        if not np.array_equal(frame, expected_frame):
+            mismatches = np.count_nonzero(frame != expected_frame)
+            return [f"{name}: frame {index} differs in {mismatches} of {frame.size} values"]
+    return []
+
+def check_frame_ranges(pixel_data, tile_size, frame_dimensions, user_tile, gray_tile, palette, strips, chunksize, expected):
+    """
+    Composes the frames with compose_frame_range, with and without delta rendering and the row strip
+    cache, as whole frames and in strips, and compares them with the reference frames.
+
+    Returns:
+        tuple: The number of cases checked and descriptions of every problem found.
+    """
+    problems = []
+    cases = 0
+    strip_row_bytes = frame_dimensions[0] * tile_size[1] * 3
+    for delta, row_cached, frame_strips in itertools.product((False, True), (False, True), ([None], strips)):
+        job = {'tile_size': tile_size, 'frame_dimensions': frame_dimensions, 'engine': 'vectorized', 'delta': delta}
+        # A cache of a few rows keeps evicting, so misses and hits both happen
+        row_cache = None
+        if row_cached:
+            row_cache = video_generator.RowStripCache(
+                tile_size, frame_dimensions, user_tile, gray_tile, 4 * strip_row_bytes, palette=palette
+            )
+        frames = [np.zeros_like(frame) for frame in expected]
+        for rows in frame_strips:
+            for start, stop in video_generator.frame_ranges(len(pixel_data), chunksize):
+                composed = video_generator.compose_frame_range(job, pixel_data, palette, start, stop, row_cache, rows)
+                for index, (_, frame_array, _) in enumerate(composed, start):
+                    if rows is None:
+                        frames[index][...] = frame_array
+                    else:
+                        frames[index][rows[0] * tile_size[1]:rows[1] * tile_size[1]] = frame_array
+        name = f"compose_frame_range delta={delta} row_cache={row_cached} strips={len(frame_strips)}"
+        problems += compare_frames(name, frames, expected)
+        cases += 1
+    return cases, problems
+
+def check_ring(executor, workers, pixel_data, tile_size, frame_dimensions, user_tile, gray_tile, pixel_format, frame_budget,
+               chunksize, expected):
+    """
+    Renders the frames through a shared render job and a frame ring on the pool, the way a streamed
+    render does, with and without delta rendering and the row strip cache, as whole frames and in
+    strips, and compares them with the reference frames.
+
+    Returns:
+        tuple: The number of cases checked and descriptions of every problem found.
+    """
+    problems = []
+    cases = 0
+    row_cache_bytes = 4 * frame_dimensions[0] * tile_size[1] * 3
+    frame_shape = video_generator.frame_shape(frame_dimensions, pixel_format)
+    for delta, row_cache_bytes, budget in itertools.product((False, True), (0, row_cache_bytes), (None, frame_budget)):
+        with video_generator.shared_render_job(
+            pixel_data, tile_size, frame_dimensions, user_tile, gray_tile, 'vectorized', delta=delta,
+            row_cache_bytes=row_cache_bytes, pixel_format=pixel_format, frame_budget=budget
+        ) as job:
+            task_chunksize, slot_count = video_generator.render_window(
+                frame_dimensions, chunksize, pixel_format=pixel_format, workers=workers
+            )
+            with video_generator.FrameRing(slot_count, frame_shape) as ring:
+                frames = [
+                    frame_array.copy() for _, frame_array in video_generator.ring_frames(
+                        executor, job, ring, 0, len(pixel_data), task_chunksize, collections.Counter()
+                    )
+                ]
+            name = f"frame ring {pixel_format} delta={delta} row_cache={bool(row_cache_bytes)} strips={len(job['strips'])}"
+        problems += compare_frames(name, frames, expected)
+        cases += 1
+    return cases, problems
+
+def check_compositing(executor, workers, levels, tile_size, grid_size, frame_count, chunksize):
+    """
+    Checks every compositing path against the loop reference for one tile layout and number of levels.
+
+    Returns:
+        tuple: The number of cases checked and descriptions of every problem found.
+    """
+    pixel_data = synthetic_pixel_data(levels, frame_count, grid_size, seed=levels)
+    frame_dimensions = (tile_size[0] * grid_size[0], tile_size[1] * grid_size[1])
+    user_tile, gray_tile = synthetic_tiles(tile_size)
+    palette = tiles.build_palette(user_tile, gray_tile, pixel_data.levels)
+    label = f"{levels} levels, {tile_size[0]}x{tile_size[1]} tiles"
+
+    expected = [
+        video_generator.compose_frame_loop(pixel_data.frame_bits(index), tile_size, frame_dimensions, user_tile, gray_tile, palette)
+        for index in range(len(pixel_data))
+    ]
+    vectorized = [
+        video_generator.compose_frame_vectorized(pixel_data.frame_bits(index), tile_size, frame_dimensions, user_tile, gray_tile, palette)
+        for index in range(len(pixel_data))
+    ]
+    problems = compare_frames(f"{label}: vectorized engine", vectorized, expected)
+    cases = 1
+
+    # A budget of two thirds of a frame splits every frame into three strips
+    frame_budget = 2 * video_generator.frame_size(frame_dimensions) // 3
+    strips = video_generator.frame_strips(tile_size, frame_dimensions, frame_budget=frame_budget)
+    range_cases, range_problems = check_frame_ranges(
+        pixel_data, tile_size, frame_dimensions, user_tile, gray_tile, palette, strips, chunksize, expected
+    )
+    ring_cases, ring_problems = check_ring(
+        executor, workers, pixel_data, tile_size, frame_dimensions, user_tile, gray_tile,
+        video_generator.BGR_PIXEL_FORMAT, frame_budget, chunksize, expected
+    )
+    cases += range_cases + ring_cases
+    problems += [f"{label}: {problem}" for problem in range_problems + ring_problems]
+
+    if tile_size[0] % 2 == 0 and tile_size[1] % 2 == 0:
+        # Tiles cover whole chroma blocks, so the planes equal the conversion of the reference frame
+        expected_yuv = [cv.cvtColor(frame, cv.COLOR_BGR2YUV_I420).reshape(-1) for frame in expected]
+        yuv_budget = 2 * video_generator.frame_size(frame_dimensions, video_generator.YUV_PIXEL_FORMAT) // 3
+        yuv_cases, yuv_problems = check_ring(
+            executor, workers, pixel_data, tile_size, frame_dimensions, user_tile, gray_tile,
+            video_generator.YUV_PIXEL_FORMAT, yuv_budget, chunksize, expected_yuv
+        )
+        cases += yuv_cases
+        problems += [f"{label}: {problem}" for problem in yuv_problems]
+    return cases, problems
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check that every compositing path is bit-exact against the loop reference."
+    )
+    parser.add_argument('--frames', type=int, default=24, help="Number of synthetic frames per case.")
+    parser.add_argument('--chunksize', type=int, default=5, help="Frames per task, so delta rendering restarts within the clip.")
+    parser.add_argument('--backend', choices=['thread', 'process'], default='thread', help="Worker pool of the frame ring cases.")
+    parser.add_argument('--workers', type=int, default=2)
+    args = parser.parse_args()
+
+    grid_size = (16, 12)
+    problems = []
+    cases = 0
+    if args.backend == 'process':
+        executor = video_generator.create_process_pool(args.workers)
+    else:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=args.workers)
+    with executor:
+        for levels, tile_size in itertools.product((2, 16), ((6, 4), (5, 3))):
+            layout_cases, layout_problems = check_compositing(
+                executor, args.workers, levels, tile_size, grid_size, args.frames, args.chunksize
+            )
+            cases += layout_cases
+            problems += layout_problems
+
+    if problems:
+        for problem in problems:
+            print(f"FAIL: {problem}")
+        sys.exit(1)
+    print(f"All {cases} checks passed: every compositing path matches the loop reference.")
+
+if __name__ == '__main__':
+    main()
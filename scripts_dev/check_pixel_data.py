@@ -0,0 +1,119 @@
+import argparse
+import os
+import pickle
+import sys
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+from bitarray import bitarray
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'bad_apple_mosaic')))
+
+import config
+from fixtures import synthetic_pixel_data
+from pixel_data import convert_pickle, find_pixel_data_file, load_pixel_data, write_pixel_data
+
+def write_legacy_pickle(path, pixel_data):
+    """
+    Writes black and white pixel data as a legacy pickle file of bitarrays.
+
+    Args:
+        path (str): Path of the file to write.
+        pixel_data (PixelData): Pixel data with one bit per cell.
+    """
+    frames = OrderedDict()
+    for frame_number, bits in pixel_data.items():
+        frame_bits = bitarray(endian='big')
+        frame_bits.frombytes(np.packbits(bits).tobytes())
+        del frame_bits[len(bits):]
+        frames[frame_number] = frame_bits
+    with open(path, 'wb') as file:
+        pickle.dump({'pixel_data': frames, 'frame_dimensions': pixel_data.frame_dimensions}, file)
+
+def compare_pixel_data(name, pixel_data, expected):
+    """
+    Compares the frames and settings of two pixel data files.
+
+    Returns:
+        list: Descriptions of every difference found.
+    """
+    problems = []
+    for field in ('frame_dimensions', 'first_frame', 'bits_per_cell', 'frame_count'):
+        if getattr(pixel_data, field) != getattr(expected, field):
+            problems.append(f"{name}: {field} is {getattr(pixel_data, field)}, expected {getattr(expected, field)}")
+    if problems:
+        return problems
+    for index in range(len(expected)):
+        if not np.array_equal(pixel_data.frame_bits(index), expected.frame_bits(index)):
+            return [f"{name}: frame {index} differs"]
+    return []
+
+def check_pixel_data_formats(temp_dir, frame_count, grid_size):
+    """
+    Round-trips synthetic pixel data through the legacy pickle and the binary format, with one bit
+    and with four bits per cell.
+
+    Returns:
+        tuple: The number of cases checked and descriptions of every problem found.
+    """
+    problems = []
+    pixel_data = synthetic_pixel_data(2, frame_count, grid_size)
+    pixel_data.first_frame = 1
+    pkl_path = os.path.join(temp_dir, 'pixel_data@check30fps.pkl')
+    write_legacy_pickle(pkl_path, pixel_data)
+    bapd_path = convert_pickle(pkl_path)
+    binary = load_pixel_data(bapd_path)
+    problems += compare_pixel_data(".pkl to .bapd", binary, load_pixel_data(pkl_path))
+    problems += compare_pixel_data(".pkl to .bapd", binary, pixel_data)
+    if binary.fps != 30:
+        problems.append(f".pkl to .bapd: fps is {binary.fps}, expected 30")
+
+    levels_data = synthetic_pixel_data(16, frame_count, grid_size)
+    levels_path = os.path.join(temp_dir, 'pixel_data@check16.bapd')
+    write_pixel_data(
+        levels_path, levels_data.packed_frames, levels_data.frame_dimensions, levels_data.fps, bits_per_cell=levels_data.bits_per_cell
+    )
+    problems += compare_pixel_data("16 levels .bapd", load_pixel_data(levels_path), levels_data)
+    return 2, problems
+
+def check_presets(pixel_data_dir):
+    """
+    Checks that every shipped preset with both a pickle and a binary file holds the same frames in both.
+
+    Returns:
+        tuple: The number of cases checked and descriptions of every problem found.
+    """
+    problems = []
+    cases = 0
+    names = sorted({os.path.splitext(name)[0] for name in os.listdir(pixel_data_dir) if name.startswith('pixel_data@')})
+    for name in names:
+        pkl_path = os.path.join(pixel_data_dir, name + '.pkl')
+        bapd_path = find_pixel_data_file(pixel_data_dir, name)
+        if not os.path.exists(pkl_path) or bapd_path is None or bapd_path == pkl_path:
+            continue
+        problems += compare_pixel_data(name, load_pixel_data(bapd_path), load_pixel_data(pkl_path))
+        cases += 1
+    return cases, problems
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that pixel data survives the legacy pickle and the binary file format.")
+    parser.add_argument('--frames', type=int, default=24, help="Number of synthetic frames per case.")
+    parser.add_argument('--skip-presets', action='store_true', help="Do not compare the shipped .pkl and .bapd presets.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        cases, problems = check_pixel_data_formats(temp_dir, args.frames, (16, 12))
+    if not args.skip_presets and os.path.isdir(config.PIXEL_DATA_DIR):
+        preset_cases, preset_problems = check_presets(config.PIXEL_DATA_DIR)
+        cases += preset_cases
+        problems += preset_problems
+
+    if problems:
+        for problem in problems:
+            print(f"FAIL: {problem}")
+        sys.exit(1)
+    print(f"All {cases} checks passed: pixel data round-trips through both file formats.")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+import cv2 as cv
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'bad_apple_mosaic')))
+
+import config
+import tiles
+import video_generator
+from pixel_data import PixelData, find_pixel_data_file, load_pixel_data
+
+def read_frame_timestamps(ffmpeg_exe, video_path):
+    """
+    Reads the presentation timestamp and duration of every video packet with ffmpeg's framemd5 muxer.
+
+    Args:
+        ffmpeg_exe (str): Path to ffmpeg.
+        video_path (str): The video to inspect.
+
+    Returns:
+        list: The (pts, duration) of every frame, in stream time base units.
+    """
+    output = subprocess.run(
+        [ffmpeg_exe, '-v', 'error', '-i', video_path, '-map', '0:v', '-f', 'framemd5', '-'],
+        capture_output=True, check=True
+    ).stdout.decode()
+    timestamps = []
+    for line in output.splitlines():
+        if line.startswith('#') or not line.strip():
+            continue
+        fields = [field.strip() for field in line.split(',')]
+        timestamps.append((int(fields[2]), int(fields[3])))
+    return timestamps
+
+def read_stream_end(ffmpeg_exe, video_path, stream):
+    """
+    Reads when the last packet of a stream ends with ffmpeg's framemd5 muxer.
+
+    Args:
+        ffmpeg_exe (str): Path to ffmpeg.
+        video_path (str): The video to inspect.
+        stream (str): The stream to read, 'v' or 'a'.
+
+    Returns:
+        float: The end of the stream in seconds, or None if the video has no such stream.
+    """
+    result = subprocess.run(
+        [ffmpeg_exe, '-v', 'error', '-i', video_path, '-map', f'0:{stream}?', '-f', 'framemd5', '-'],
+        capture_output=True, check=True
+    )
+    time_base = None
+    end = None
+    for line in result.stdout.decode().splitlines():
+        if line.startswith('#tb'):
+            numerator, denominator = line.split(':', 1)[1].strip().split('/')
+            time_base = int(numerator) / int(denominator)
+        elif line.strip() and not line.startswith('#'):
+            fields = [field.strip() for field in line.split(',')]
+            end = max(end or 0, (int(fields[2]) + int(fields[3])) * time_base)
+    return end
+
+def check_timestamps(timestamps, frame_count):
+    """
+    Checks that a video has the expected number of frames, evenly spaced without gaps or repeats.
+
+    Returns:
+        list: Descriptions of every problem found.
+    """
+    problems = []
+    if len(timestamps) != frame_count:
+        problems.append(f"expected {frame_count} frames, found {len(timestamps)}")
+    frame_duration = timestamps[0][1] if timestamps else 0
+    for index in range(1, len(timestamps)):
+        step = timestamps[index][0] - timestamps[index - 1][0]
+        if step != frame_duration:
+            problems.append(f"frame {index} is {step} ticks after frame {index - 1}, expected {frame_duration}")
+    return problems
+
+def check_frames(video_path, pixel_data, tile_size, frame_dimensions, user_img_array, gray_user_img_array, bounds):
+    """
+    Decodes the video and compares every frame with the frame it was rendered from. A dropped, repeated
+    or misplaced frame at a segment join shows up as a frame that differs far more than the others, or
+    that looks more like its neighbour's source frame than its own.
+
+    Returns:
+        tuple: The mean absolute error of every frame and descriptions of every problem found.
+    """
+    palette = tiles.build_palette(user_img_array, gray_user_img_array, pixel_data.levels)
+    expected_frame = lambda index: video_generator.compose_frame(
+        pixel_data.frame_bits(index), tile_size, frame_dimensions, user_img_array, gray_user_img_array, palette=palette
+    )
+    join_indices = {index for start, _ in bounds[1:] for index in (start - 1, start)}
+
+    capture = cv.VideoCapture(video_path)
+    errors = []
+    problems = []
+    while len(errors) < len(pixel_data):
+        ret, decoded = capture.read()
+        if not ret:
+            break
+        index = len(errors)
+        errors.append(float(np.mean(cv.absdiff(decoded, expected_frame(index)))))
+        if index in join_indices:
+            for neighbour in (index - 1, index + 1):
+                if 0 <= neighbour < len(pixel_data):
+                    neighbour_error = float(np.mean(cv.absdiff(decoded, expected_frame(neighbour))))
+                    if neighbour_error < errors[index]:
+                        problems.append(f"frame {index} at a join looks like frame {neighbour}")
+    capture.release()
+
+    if not errors:
+        return errors, ["no frames could be decoded"]
+    limit = 3 * float(np.median(errors)) + 2
+    for index in sorted(join_indices):
+        if index < len(errors) and errors[index] > limit:
+            problems.append(f"frame {index} at a join differs by {errors[index]:.2f} (limit {limit:.2f})")
+    return errors, problems
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a clip in parallel segments and check that the joins play back smoothly.")
+    parser.add_argument('--preset', default='48p30fps', help="Pixel data preset, e.g. 48p30fps.")
+    parser.add_argument('--pixel-data', help="Pixel data file to use instead of the preset.")
+    parser.add_argument('--frames', type=int, default=600, help="Number of frames to render.")
+    parser.add_argument('--segments', type=int, default=4, help="Number of segments encoded at a time.")
+    parser.add_argument('--resolution', default='960x720', help="Output resolution as <width>x<height>.")
+    parser.add_argument('--image', default=config.IMAGE_FILE, help="Image used for the tiles.")
+    parser.add_argument('--workers', type=int, help="Number of worker processes.")
+    parser.add_argument('--audio', default=config.AUDIO_FILE if os.path.exists(config.AUDIO_FILE) else None,
+                        help="Soundtrack muxed in when the segments are joined. Defaults to the app's soundtrack.")
+    parser.add_argument('--no-audio', action='store_true', help="Render a silent video.")
+    args = parser.parse_args()
+
+    pixel_data_path = args.pixel_data or find_pixel_data_file(config.PIXEL_DATA_DIR, f"pixel_data@{args.preset}")
+    if pixel_data_path is None:
+        parser.error(f"Pixel data preset '{args.preset}' not found.")
+    full_pixel_data = load_pixel_data(pixel_data_path)
+    frame_count = min(args.frames, len(full_pixel_data))
+    pixel_data = PixelData(
+        np.asarray(full_pixel_data.packed_frames[:frame_count]), full_pixel_data.frame_dimensions, full_pixel_data.fps,
+        bits_per_cell=full_pixel_data.bits_per_cell
+    )
+    fps = pixel_data.fps or 30
+
+    width, height = (int(value) for value in args.resolution.split('x'))
+    tile_size, frame_dimensions = video_generator.compute_tile_layout(pixel_data.frame_dimensions, (width, height))
+    user_img_array, gray_user_img_array = tiles.load_user_tiles(args.image, tile_size)
+    bounds = video_generator.plan_segments(frame_count, fps, args.segments)
+    audio_path = None if args.no_audio else args.audio
+    print(f"Rendering {frame_count} frames in {len(bounds)} segments: {bounds}")
+    if audio_path:
+        print(f"Muxing in the soundtrack '{audio_path}'.")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        video_path = os.path.join(temp_dir, 'segments.mp4')
+        with video_generator.create_process_pool(args.workers) as executor:
+            video_generator.encode_segments(
+                executor, pixel_data, tile_size, frame_dimensions, user_img_array, gray_user_img_array, fps,
+                video_path, audio_path, segments=args.segments, workers=args.workers
+            )
+
+        ffmpeg_exe = video_generator.get_ffmpeg_executable()
+        problems = check_timestamps(read_frame_timestamps(ffmpeg_exe, video_path), frame_count)
+        if audio_path:
+            # The soundtrack may be shorter than the video, but must not run on past its last frame
+            audio_end = read_stream_end(ffmpeg_exe, video_path, 'a')
+            video_end = read_stream_end(ffmpeg_exe, video_path, 'v')
+            if audio_end is None:
+                problems.append("the video has no audio stream")
+            elif video_end is not None and audio_end > video_end + 1 / fps:
+                problems.append(f"the audio ends at {audio_end:.3f}s, after the last frame at {video_end:.3f}s")
+        errors, frame_problems = check_frames(
+            video_path, pixel_data, tile_size, frame_dimensions, user_img_array, gray_user_img_array, bounds
+        )
+        problems += frame_problems
+
+    if errors:
+        join_errors = [errors[index] for start, _ in bounds[1:] for index in (start - 1, start) if index < len(errors)]
+        print(f"Mean frame error: {np.mean(errors):.2f}, at the joins: {np.mean(join_errors) if join_errors else 0:.2f}")
+    if problems:
+        for problem in problems:
+            print(f"FAIL: {problem}")
+        sys.exit(1)
+    print("All segment joins play back smoothly.")
+
+if __name__ == '__main__':
+    main()
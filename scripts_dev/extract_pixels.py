@@ -4,6 +4,8 @@ import pickle
 import os
 import re
 import cv2 as cv
+import numpy as np
+import concurrent.futures
 import sys
 
 def extract_frame_number(file_name):
@@ -23,38 +25,62 @@ def bit_extraction(frame):
     """
     Converts a grayscale image frame into a bit array, where 1 represents a white pixel and 0 represents a black pixel.
 
+    The whole frame is thresholded and packed with NumPy instead of visiting every pixel in Python.
+
     Args:
         frame (numpy.ndarray): The grayscale image frame.
 
     Returns:
-        list: A list of bits representing the pixel data.
+        bitarray: The pixel data of the frame, in row-major order.
     """
-    return [1 if pixel == 255 else 0 for row in frame for pixel in row]
+    frame_data = bitarray(endian='big')
+    frame_data.frombytes(np.packbits(frame == 255).tobytes())
+    del frame_data[frame.size:]
+    return frame_data
 
-def extract_pixels(frames_dir, output_pkl_file):
+def read_frame(frame_path):
+    """
+    Reads a single frame and extracts its pixel data. Runs inside the worker processes.
+
+    Args:
+        frame_path (str): Path to the frame image.
+
+    Returns:
+        tuple: The frame dimensions (width, height) and the bit array of the frame, or None if the frame could not be read.
+    """
+    frame = cv.imread(frame_path, cv.IMREAD_GRAYSCALE)
+    if frame is None:
+        return None
+    frame_height, frame_width = frame.shape
+    return (frame_width, frame_height), bit_extraction(frame)
+
+def extract_pixels(frames_dir, output_pkl_file, max_workers=None):
     """
     Extracts pixel data from image frames in a directory and saves it as a pickle file.
 
+    Frames are decoded in parallel across a process pool and collected in frame order.
+
     Args:
         frames_dir (str): Directory containing the image frames.
         output_pkl_file (str): Path to the output pickle file where pixel data will be saved.
+        max_workers (int, optional): Number of worker processes. Defaults to the number of CPUs.
     """
     pixel_data = OrderedDict()
     raw_frame_files = sorted(os.listdir(frames_dir), key=extract_frame_number)
+    frame_paths = [os.path.join(frames_dir, frame_file) for frame_file in raw_frame_files]
     frame_dimensions = None
 
-    for frame_file in raw_frame_files:
-        frame_path = os.path.join(frames_dir, frame_file)
-        frame = cv.imread(frame_path, cv.IMREAD_GRAYSCALE)
-        if frame is None:
-            print(f"Error reading frame: {frame_path}")
-            continue
-        if frame_dimensions is None:
-            frame_height, frame_width = frame.shape
-            frame_dimensions = (frame_width, frame_height)
-        frame_data = bitarray(bit_extraction(frame))
-        frame_number = int(frame_file.split('_')[1].split('.')[0])
-        pixel_data[frame_number] = frame_data
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(read_frame, frame_paths, chunksize=64)
+        for frame_file, frame_path, result in zip(raw_frame_files, frame_paths, results):
+            if result is None:
+                print(f"Error reading frame: {frame_path}")
+                continue
+            dimensions, frame_data = result
+            if frame_dimensions is None:
+                frame_dimensions = dimensions
+            frame_number = int(frame_file.split('_')[1].split('.')[0])
+            pixel_data[frame_number] = frame_data
 
     data_to_save = {
         'pixel_data': pixel_data,
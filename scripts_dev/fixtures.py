@@ -0,0 +1,49 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'bad_apple_mosaic')))
+
+import tiles
+from pixel_data import PixelData, pack_levels
+
+def synthetic_tiles(tile_size, seed=0):
+    """
+    Builds a fixed pseudo-random user tile and its darkened tile, so every run composes identical frames.
+
+    Args:
+        tile_size (tuple): Size (width, height) of each tile.
+        seed (int, optional): Seed of the random generator.
+
+    Returns:
+        tuple: The user tile and the darkened tile as BGR arrays.
+    """
+    user_tile = np.random.default_rng(seed).integers(0, 256, (tile_size[1], tile_size[0], 3), dtype=np.uint8)
+    return user_tile, tiles.darken_tile(user_tile)
+
+def synthetic_pixel_data(levels, frame_count, grid_size, seed=0):
+    """
+    Builds pixel data that changes a few cells from one frame to the next and repeats whole black and
+    white rows, like Bad Apple does, so the delta renderer and the row strip cache both have work to do.
+
+    Args:
+        levels (int): Number of brightness levels per cell, a power of two.
+        frame_count (int): Number of frames.
+        grid_size (tuple): Dimensions (columns, rows) of the tile grid.
+        seed (int, optional): Seed of the random generator.
+
+    Returns:
+        PixelData: The pixel data, held in memory.
+    """
+    rng = np.random.default_rng(seed)
+    columns, rows = grid_size
+    frame = rng.integers(0, levels, (rows, columns), dtype=np.uint8)
+    frames = []
+    for _ in range(frame_count):
+        changed = rng.random((rows, columns)) < 0.1
+        frame = np.where(changed, rng.integers(0, levels, (rows, columns), dtype=np.uint8), frame)
+        frame[rng.integers(0, rows)] = rng.integers(0, 2) * (levels - 1)
+        frames.append(frame.reshape(-1))
+    bits_per_cell = (levels - 1).bit_length()
+    return PixelData(pack_levels(np.stack(frames), bits_per_cell), grid_size, 30, bits_per_cell=bits_per_cell)